@@ -1,17 +1,36 @@
 from dotenv import load_dotenv
 load_dotenv()
 from flask import Flask, redirect, url_for, send_from_directory
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_login import LoginManager
 from db import db
 from routes.auth_routes import auth_bp
 from routes.dashboard_routes import dashboard_bp
+from routes.metrics_routes import metrics_bp
+from routes.health_routes import health_bp
 from config import Config
 from models.user import User
 from models.group import Group
 from models.student import Student
-from models.absence import Absence
+from models.absence import Absence, merge_duplicate_absences
 from models.cmk import Cmk
 from models.audit_log import AuditLog
+from models.analytics_change import AnalyticsChange
+from services.audit import audit, archive_audit_logs
+from services.cache import cache
+from services.identity_cache import identity_cache
+from services.reference_cache import reference_cache
+from services.perf import perf_monitor
+from services.slow_query import slow_query_log
+from services.metrics import request_metrics, instrument_pool, metrics_dir, multiprocess as metrics_multiprocess
+from services.profiler import request_profiler
+from services.query_budget import query_budget_guard
+from services.startup import schema_is_current, remember_schema, import_time_report
+from services.db_profile import db_profile, optimize
+from services.db_routing import read_routing
+from services.schema import IndexCreationError, create_model_indexes
+from services.limiter import limiter
+from services.absence_store import absence_store
 from sqlalchemy import inspect, text
 import sys
 import os
@@ -19,48 +38,135 @@ import os
 # ДОБАВЛЕНО: импорт blueprint Ollama
 from routes.ollama_routes import ollama_bp
 
-# === Создание приложения ===
-app = Flask(__name__)
-app.config.from_object(Config)
+# === Фабрика приложения ===
+def create_app(config_object=Config):
+    """Создаёт и настраивает приложение (для тестов, скриптов и WSGI-сервера)"""
+    app = Flask(__name__)
+    app.config.from_object(config_object)
 
-# === Инициализация базы ===
-db.init_app(app)
+    # За nginx адрес клиента берётся из X-Forwarded-For доверенных прокси
+    hops = app.config.get('PROXY_FIX_HOPS', 0)
+    if hops:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops, x_host=hops)
 
-# === Настройка Flask-Login ===
-login_manager = LoginManager(app)
-login_manager.login_view = 'auth.login'
+    # === Инициализация базы ===
+    # Профиль подключения (прагмы SQLite, пул) задаётся до создания движка
+    db_profile.init_app(app)
+    read_routing.init_app(app)
+    db.init_app(app)
 
-@login_manager.user_loader
-def load_user(user_id):
-    try:
-        return User.query.get(int(user_id))
-    except Exception as e:
-        app.logger.error(f"Ошибка при загрузке пользователя {user_id}: {e}")
-        return None
-
-# === Регистрация блюпринтов ===
-app.register_blueprint(auth_bp, url_prefix='/auth')
-app.register_blueprint(dashboard_bp, url_prefix='/dashboard')
-
-# ДОБАВЛЕНО: регистрация Ollama blueprint
-app.register_blueprint(ollama_bp)
-
-# === Главная страница ===
-@app.route('/')
-def home():
-    return redirect(url_for('auth.login'))
-
-# === Favicon ===
-@app.route('/favicon.ico')
-def favicon():
-    return send_from_directory(
-        os.path.join(app.root_path, 'static'),
-        'favicon.ico',
-        mimetype='image/vnd.microsoft.icon'
-    )
+    # === Фоновая запись журнала действий ===
+    audit.init_app(app)
+
+    # === Настройка Flask-Login ===
+    login_manager = LoginManager(app)
+    login_manager.login_view = 'auth.login'
+
+    # Кэш пользователей: без SELECT на каждый запрос
+    identity_cache.init_app(app)
+
+    # Общий кэш (память, instance/cache или сервер Redis) с версиями по коммитам
+    cache.init_app(app)
+
+    # Кэш справочников (группы, кураторы, старосты, ЦМК)
+    reference_cache.init_app(app)
+
+    # Колоночное хранилище пропусков для аналитики (ANALYTICS_ENGINE=memory)
+    absence_store.init_app(app)
+
+    # Замеры запросов: SQL, шаблоны, Server-Timing
+    perf_monitor.init_app(app)
+
+    # Журнал медленных SQL-запросов с планом выполнения
+    slow_query_log.init_app(app)
+
+    # Профилирование запросов по требованию (/dashboard/perf)
+    request_profiler.init_app(app)
+
+    # Бюджеты SQL-запросов на маршрут
+    query_budget_guard.init_app(app)
+
+    # Ограничение одновременных экспортов, импортов и запросов к ИИ
+    limiter.init_app(app)
+
+    # Метрики Prometheus (/metrics)
+    request_metrics.init_app(app)
+    with app.app_context():
+        instrument_pool(db.engine)
+        db_profile.schedule_optimize(db.engine)
+        read_routing.setup_engine(db)
+
+    @login_manager.user_loader
+    def load_user(user_id):
+        try:
+            return identity_cache.load(int(user_id))
+        except Exception as e:
+            app.logger.error(f"Ошибка при загрузке пользователя {user_id}: {e}")
+            return None
+
+    # === Регистрация блюпринтов ===
+    app.register_blueprint(auth_bp, url_prefix='/auth')
+    app.register_blueprint(dashboard_bp, url_prefix='/dashboard')
+
+    # ДОБАВЛЕНО: регистрация Ollama blueprint
+    app.register_blueprint(ollama_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(health_bp)
+
+    # === Главная страница ===
+    @app.route('/')
+    def home():
+        return redirect(url_for('auth.login'))
+
+    # === Favicon ===
+    @app.route('/favicon.ico')
+    def favicon():
+        return send_from_directory(
+            os.path.join(app.root_path, 'static'),
+            'favicon.ico',
+            mimetype='image/vnd.microsoft.icon'
+        )
+
+    return app
+
+# === Инициализация процесса-воркера ===
+def init_worker(app):
+    """Вызывается в каждом воркере после fork (см. gunicorn.conf.py)
+
+    Соединения пула, открытые в мастер-процессе, не должны использоваться
+    совместно: сбрасываем пул без закрытия чужих соединений и заново
+    вешаем на новый пул замер ожидания.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+        instrument_pool(db.engine)
+        db_profile.schedule_optimize(db.engine)
+    # Метрики воркеров сводятся в общем каталоге
+    metrics_multiprocess.enable(metrics_dir(app))
+
+# === Общий экземпляр для скриптов и WSGI ===
+_app = None
+
+
+def get_app():
+    """Экземпляр приложения по умолчанию; создаётся при первом обращении"""
+    global _app
+    if _app is None:
+        _app = create_app()
+    return _app
+
+
+def __getattr__(name):
+    # from app import app, db в скриптах: приложение (с фоновыми потоками)
+    # создаётся при обращении, а не при любом импорте модуля
+    if name == 'app':
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # === Проверка и обновление структуры БД ===
-def check_and_update_database():
+def check_and_update_database(app=None):
+    app = app or get_app()
     try:
         with app.app_context():
             inspector = inspect(db.engine)
@@ -103,10 +209,11 @@ def check_and_update_database():
         print("✅ Таблицы созданы успешно!")
 
 # === Функция создания групп по умолчанию ===
-def init_default_groups():
+def init_default_groups(app=None):
     """Создает группы по умолчанию если база пустая"""
-    with app.app_context():
-        if Group.query.count() == 0:
+    with (app or get_app()).app_context():
+        groups_count = Group.query.count()
+        if groups_count == 0:
             print("Создаем группы по умолчанию...")
             default_groups = ["Э-101", "Э-102", "Б-101", "Б-102", "Ф-101"]
             
@@ -121,12 +228,18 @@ def init_default_groups():
                 db.session.rollback()
                 print(f"❌ Ошибка при создании групп: {e}")
         else:
-            print(f"✅ В базе уже есть {Group.query.count()} групп")
+            print(f"✅ В базе уже есть {groups_count} групп")
 
 # === Инициализация приложения ===
-def init_app():
+def init_app(app=None):
     """Инициализация приложения с созданием таблиц и групп"""
+    app = app or get_app()
     with app.app_context():
+        # Быстрый путь: схема моделей не менялась с прошлого запуска и группы уже есть
+        if schema_is_current(app):
+            print("✅ Схема базы данных актуальна")
+            return
+
         # Создаем все таблицы если их нет
         try:
             inspector = inspect(db.engine)
@@ -138,25 +251,91 @@ def init_app():
                 print("✅ Таблицы созданы успешно!")
             else:
                 print(f"✅ База данных уже содержит {len(tables)} таблиц")
+                # Схема моделей изменилась: создаём недостающие таблицы и индексы
+                db.create_all()
+                ensure_indexes()
             
             # Создаем группы по умолчанию
-            init_default_groups()
+            init_default_groups(app)
             
         except Exception as e:
             print(f"❌ Ошибка инициализации: {e}")
             # Попробуем создать таблицы принудительно
             db.create_all()
             print("✅ Таблицы созданы принудительно")
-            init_default_groups()
+            init_default_groups(app)
+        else:
+            # Отпечаток сохраняем только после полной инициализации,
+            # иначе следующий запуск пойдёт быстрым путём мимо недостроенной схемы
+            remember_schema(app)
+
+# Модели, индексы которых добавлялись после создания их таблиц
+# (журнал действий, ряды посещаемости)
+INDEXED_MODELS = (AuditLog, Absence, Student)
+
+
+def ensure_indexes():
+    """Создаёт недостающие индексы в существующих таблицах
+
+    Индексы каждой модели создаются в своей транзакции: ошибка в одной
+    не откатывает индексы других моделей. Если какой-то индекс не создан,
+    после обхода всех моделей поднимается RuntimeError с его именем.
+    """
+    failed = []
+    for model in INDEXED_MODELS:
+        try:
+            with db.engine.begin() as conn:
+                removed = 0
+                if model is Absence:
+                    # Дубли пропусков за день не дают создать uq_absences_student_date
+                    removed = merge_duplicate_absences(conn)
+                created = create_model_indexes(conn, model)
+        except IndexCreationError as e:
+            print(f"❌ Не удалось создать индекс {e.name}: {e.__cause__}")
+            failed.append(e.name)
+            continue
+        if removed:
+            print(f"✅ Объединено дублей пропусков: {removed}")
+        for name in created:
+            print(f"✅ Создан индекс {name}")
+    if failed:
+        raise RuntimeError(f"Не созданы индексы: {', '.join(failed)}")
 
 # === Запуск приложения ===
 if __name__ == '__main__':
+    app = get_app()
     # Проверяем аргументы командной строки
     if len(sys.argv) > 1 and sys.argv[1] == '--check-db':
-        check_and_update_database()
+        check_and_update_database(app)
     elif len(sys.argv) > 1 and sys.argv[1] == '--init':
-        init_app()
+        init_app(app)
+    elif len(sys.argv) > 1 and sys.argv[1] == '--archive-audit':
+        # Архивация журнала: python app.py --archive-audit [дней]
+        with app.app_context():
+            days = int(sys.argv[2]) if len(sys.argv) > 2 else None
+            archived = archive_audit_logs(days)
+            print(f"✅ Перенесено в архив записей журнала: {archived}")
+    elif len(sys.argv) > 1 and sys.argv[1] == '--optimize-db':
+        # Обновление статистики планировщика SQLite: python app.py --optimize-db
+        with app.app_context():
+            optimize(db.engine)
+            print("✅ PRAGMA optimize выполнен")
+    elif len(sys.argv) > 1 and sys.argv[1] == '--import-report':
+        # Время холодного импорта: python app.py --import-report [целевое, мс]
+        target_ms = float(sys.argv[2]) if len(sys.argv) > 2 else app.config['BOOT_TARGET_MS']
+        # wsgi создаёт приложение, как при запуске gunicorn
+        report = import_time_report('wsgi', cwd=app.root_path)
+        print("Самые тяжёлые пакеты (собственное время импорта):")
+        for package, ms in report['top']:
+            print(f"  {package:<24} {ms:>8.1f} мс")
+        if report['heavy']:
+            print(f"⚠️  При старте загружаются тяжёлые зависимости: {', '.join(report['heavy'])}")
+        print(f"\nХолодный импорт wsgi: {report['wall_ms']:.0f} мс (цель {target_ms:.0f} мс)")
+        if report['wall_ms'] > target_ms:
+            print("❌ Старт медленнее целевого")
+            sys.exit(1)
+        print("✅ Старт укладывается в цель")
     else:
         # Автоматическая инициализация при запуске
-        init_app()
+        init_app(app)
         app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -6,21 +6,23 @@ import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from app import app, db
-from sqlalchemy import text
+from models.group import Group
+from services.schema import add_column, column_names, create_index, create_table
 
 with app.app_context():
     print("="*60)
     print("МИГРАЦИЯ БАЗЫ ДАННЫХ ДЛЯ ПРИВЯЗКИ СТАРОСТ К ГРУППАМ")
     print("="*60)
     
-    # Проверяем существующие таблицы
+    # Проверяем существующие таблицы (SQLite и PostgreSQL)
     conn = db.engine.connect()
     
     # Проверяем структуру таблицы groups
     print("\n📊 Проверка таблицы 'groups'...")
     try:
-        result = conn.execute(text("PRAGMA table_info(groups)"))
-        columns = [row[1] for row in result]
+        columns = column_names(conn, 'groups')
+        if not columns:
+            raise LookupError("таблица groups не найдена")
         
         print(f"Найдено столбцов: {len(columns)}")
         for col in columns:
@@ -30,9 +32,11 @@ with app.app_context():
         if 'leader_id' not in columns:
             print("\n➕ Добавляем поле leader_id в таблицу groups...")
             try:
-                conn.execute(text("ALTER TABLE groups ADD COLUMN leader_id INTEGER"))
+                add_column(conn, Group, 'leader_id')
+                conn.commit()
                 print("✅ Поле leader_id добавлено успешно!")
             except Exception as e:
+                conn.rollback()
                 print(f"❌ Ошибка при добавлении поля: {e}")
         else:
             print("✅ Поле leader_id уже существует!")
@@ -41,9 +45,11 @@ with app.app_context():
         if 'curator_id' not in columns:
             print("\n➕ Добавляем поле curator_id в таблицу groups...")
             try:
-                conn.execute(text("ALTER TABLE groups ADD COLUMN curator_id INTEGER"))
+                add_column(conn, Group, 'curator_id')
+                conn.commit()
                 print("✅ Поле curator_id добавлено успешно!")
             except Exception as e:
+                conn.rollback()
                 print(f"❌ Ошибка при добавлении поля: {e}")
         else:
             print("✅ Поле curator_id уже существует!")
@@ -52,38 +58,46 @@ with app.app_context():
         print(f"❌ Ошибка при проверке таблицы groups: {e}")
         print("Создаём таблицу groups...")
         try:
-            conn.execute(text("""
-                CREATE TABLE groups (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name VARCHAR(100) NOT NULL UNIQUE,
-                    curator_id INTEGER,
-                    leader_id INTEGER,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            """))
+            create_table(conn, Group)
+            conn.commit()
             print("✅ Таблица groups создана успешно!")
         except Exception as e:
+            conn.rollback()
             print(f"❌ Ошибка при создании таблицы: {e}")
     
     # Создаём индексы для быстрого поиска
     print("\n🔍 Создаём индексы для ускорения поиска...")
     try:
-        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_groups_leader_id ON groups(leader_id)"))
+        create_index(conn, 'idx_groups_leader_id', 'groups', 'leader_id')
+        conn.commit()
         print("✅ Индекс idx_groups_leader_id создан!")
     except Exception as e:
+        conn.rollback()
         print(f"⚠️  Ошибка создания индекса leader_id: {e}")
     
     try:
-        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_groups_curator_id ON groups(curator_id)"))
+        create_index(conn, 'idx_groups_curator_id', 'groups', 'curator_id')
+        conn.commit()
         print("✅ Индекс idx_groups_curator_id создан!")
     except Exception as e:
+        conn.rollback()
         print(f"⚠️  Ошибка создания индекса curator_id: {e}")
     
+    # Индексы для рядов посещаемости (/api/attendance-series)
+    for name, table_name, column in (('ix_students_group_id', 'students', 'group_id'),
+                                     ('ix_absences_date', 'absences', 'date')):
+        try:
+            create_index(conn, name, table_name, column)
+            conn.commit()
+            print(f"✅ Индекс {name} создан!")
+        except Exception as e:
+            conn.rollback()
+            print(f"⚠️  Ошибка создания индекса {name}: {e}")
+    
     # Проверяем таблицу users
     print("\n📊 Проверка таблицы 'users'...")
     try:
-        result = conn.execute(text("PRAGMA table_info(users)"))
-        columns = [row[1] for row in result]
+        columns = column_names(conn, 'users')
         
         print(f"Найдено столбцов: {len(columns)}")
         
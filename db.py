@@ -1,3 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
+from services.db_routing import RoutingSession
 
-db = SQLAlchemy()
\ No newline at end of file
+# Сессия выбирает пул чтения в маршрутах @read_only (services/db_routing.py)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
\ No newline at end of file
@@ -0,0 +1,288 @@
+# generate_dataset.py
+"""Генерация синтетических данных в масштабе колледжа.
+
+Заполняет схему students.db правдоподобными данными: ЦМК, кураторы,
+группы со старостами, студенты и пропуски за учебный год. Вставка идёт
+пачками через executemany, поэтому миллион пропусков загружается за
+десятки секунд.
+
+    python generate_dataset.py --scale college
+    python generate_dataset.py --students 20000 --absences 1000000 --reset
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+# Добавляем путь к проекту
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from faker import Faker
+from sqlalchemy import func, insert, select
+
+from app import app, db
+from models.absence import Absence
+from models.audit_log import AuditLog
+from models.cmk import Cmk
+from models.group import Group
+from models.student import Student
+from models.user import User, bcrypt
+from services.schema import sync_sequences
+
+# Пресеты масштаба: ЦМК, кураторы, группы, студенты, пропуски
+SCALES = {
+    'small': dict(cmks=4, curators=10, groups=12, students=300, absences=20000),
+    'college': dict(cmks=10, curators=60, groups=80, students=2000, absences=150000),
+    'large': dict(cmks=20, curators=250, groups=400, students=12000, absences=1000000),
+}
+
+CMK_NAMES = [
+    'Информационные технологии', 'Экономика и бухгалтерский учёт', 'Право и организация соцобеспечения',
+    'Физическая культура', 'Иностранные языки', 'Математика и естественные науки',
+    'Гуманитарные дисциплины', 'Технология машиностроения', 'Электротехника',
+    'Строительство', 'Туризм и гостиничное дело', 'Дизайн', 'Логистика',
+    'Банковское дело', 'Сетевое администрирование', 'Коммерция', 'Страховое дело',
+    'Педагогика', 'Медицинские дисциплины', 'Автомеханика'
+]
+
+GROUP_PREFIXES = ['Э', 'П', 'ИС', 'Б', 'Ю', 'СА', 'Т', 'Л', 'Д', 'К']
+
+# Причины пропусков и их доли; None - без причины
+REASONS = [None, 'болезнь', 'справка', 'уважительная', 'семейные обстоятельства', 'соревнования', 'по заявлению']
+REASON_WEIGHTS = [38, 27, 14, 9, 5, 3, 4]
+
+# Сезонность: осенне-зимний рост заболеваемости
+MONTH_WEIGHTS = {9: 0.7, 10: 0.9, 11: 1.2, 12: 1.3, 1: 1.3, 2: 1.4, 3: 1.1, 4: 0.9, 5: 0.8, 6: 0.6}
+
+BATCH_SIZE = 10000
+
+
+def academic_days(year):
+    """Учебные дни (пн-сб) с 1 сентября по 30 июня, без зимних каникул"""
+    day = date(year, 9, 1)
+    end = date(year + 1, 6, 30)
+    days = []
+    while day <= end:
+        holidays = (day.month == 12 and day.day >= 29) or (day.month == 1 and day.day <= 10)
+        if day.weekday() < 6 and not holidays:
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def distribute(total, weights, cap):
+    """Делит total пропорционально весам, не превышая cap на элемент"""
+    counts = [0] * len(weights)
+    active = [i for i, w in enumerate(weights) if w > 0]
+    remaining = total
+    while remaining > 0 and active:
+        scale = remaining / sum(weights[i] for i in active)
+        still_active = []
+        for i in active:
+            add = min(cap - counts[i], max(1, int(round(weights[i] * scale))), remaining)
+            counts[i] += add
+            remaining -= add
+            if counts[i] < cap:
+                still_active.append(i)
+            if remaining <= 0:
+                break
+        active = still_active
+    return counts
+
+
+def next_id(model):
+    return (db.session.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+
+def bulk_insert(conn, model, rows):
+    """executemany пачками по BATCH_SIZE"""
+    stmt = insert(model.__table__)
+    for start in range(0, len(rows), BATCH_SIZE):
+        conn.execute(stmt, rows[start:start + BATCH_SIZE])
+
+
+def unique_phones(count, used):
+    """Номера +79XXXXXXXXX, не пересекающиеся с уже занятыми"""
+    phones = []
+    number = 9000000000
+    while len(phones) < count:
+        number += 1
+        phone = f'+7{number}'
+        if phone not in used:
+            phones.append(phone)
+    return phones
+
+
+def generate(cmks, curators, groups, students, absences, year, password, seed):
+    rnd = random.Random(seed)
+    fake = Faker('ru_RU')
+    fake.seed_instance(seed)
+    timings = {}
+
+    with app.app_context():
+        db.create_all()
+        used_phones = set(db.session.execute(select(User.phone)).scalars())
+        used_groups = set(db.session.execute(select(Group.name)).scalars())
+        used_cmks = set(db.session.execute(select(Cmk.name)).scalars())
+        ids = {model: next_id(model) for model in (Cmk, User, Group, Student)}
+        db.session.close()
+
+        # Хеш пароля один на всех: bcrypt намеренно медленный
+        password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        now = datetime.utcnow()
+
+        # ЦМК
+        cmk_rows = []
+        for i in range(cmks):
+            name = CMK_NAMES[i % len(CMK_NAMES)]
+            if i >= len(CMK_NAMES):
+                name = f'{name} {i // len(CMK_NAMES) + 1}'
+            if name in used_cmks:
+                name = f'{name} ({ids[Cmk] + i})'
+            cmk_rows.append({'id': ids[Cmk] + i, 'name': name})
+
+        # Кураторы и старосты (по одному на группу)
+        phones = iter(unique_phones(curators + groups, used_phones))
+        user_rows = []
+        curator_ids = []
+        for i in range(curators):
+            user_id = ids[User] + len(user_rows)
+            curator_ids.append(user_id)
+            user_rows.append({
+                'id': user_id, 'full_name': fake.name(), 'phone': next(phones), 'telegram': None,
+                'role': 'curator', 'password': password_hash, 'is_confirmed': True, 'is_rejected': False,
+                'cmk_id': rnd.choice(cmk_rows)['id'] if cmk_rows else None,
+                'created_at': now, 'confirmed_at': now
+            })
+
+        # Группы: префикс специальности, курс, номер
+        group_rows = []
+        number = 0
+        while len(group_rows) < groups:
+            number += 1
+            course = rnd.randint(1, 4)
+            name = f'{rnd.choice(GROUP_PREFIXES)}-{course}{number:02d}'
+            if name in used_groups:
+                continue
+            used_groups.add(name)
+            leader_id = ids[User] + len(user_rows)
+            user_rows.append({
+                'id': leader_id, 'full_name': fake.name(), 'phone': next(phones), 'telegram': None,
+                'role': 'leader', 'password': password_hash, 'is_confirmed': True, 'is_rejected': False,
+                'cmk_id': None, 'created_at': now, 'confirmed_at': now
+            })
+            group_rows.append({
+                'id': ids[Group] + len(group_rows), 'name': name,
+                'curator_id': rnd.choice(curator_ids) if curator_ids else None,
+                'leader_id': leader_id
+            })
+
+        # Студенты: размер групп неравномерный
+        group_weights = [rnd.uniform(0.6, 1.4) for _ in group_rows]
+        student_groups = rnd.choices([g['id'] for g in group_rows], weights=group_weights, k=students) if group_rows else [None] * students
+        student_rows = [{
+            'id': ids[Student] + i, 'full_name': fake.name(), 'group_id': student_groups[i],
+            'phone': fake.phone_number()[:20]
+        } for i in range(students)]
+
+        # Пропуски: у студентов разная склонность прогуливать, один пропуск на день
+        started = time.perf_counter()
+        days = academic_days(year)
+        day_weights = [MONTH_WEIGHTS.get(d.month, 1.0) for d in days]
+        propensity = [rnd.lognormvariate(0, 0.9) for _ in student_rows]
+        absence_rows = []
+        for student, count in zip(student_rows, distribute(absences, propensity, len(days))):
+            if count <= 0:
+                continue
+            picked = set()
+            while len(picked) < count:
+                picked.update(rnd.choices(range(len(days)), weights=day_weights, k=count - len(picked)))
+            reasons = rnd.choices(REASONS, weights=REASON_WEIGHTS, k=count)
+            for index, reason in zip(picked, reasons):
+                absence_rows.append({
+                    'student_id': student['id'], 'date': days[index], 'reason': reason,
+                    'lessons_count': rnd.choices((1, 2, 3, 4), weights=(50, 30, 15, 5))[0]
+                })
+        timings['генерация пропусков'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        with db.engine.begin() as conn:
+            bulk_insert(conn, Cmk, cmk_rows)
+            bulk_insert(conn, User, user_rows)
+            bulk_insert(conn, Group, group_rows)
+            bulk_insert(conn, Student, student_rows)
+            bulk_insert(conn, Absence, absence_rows)
+            # id заданы явно: на PostgreSQL последовательности нужно догнать
+            sync_sequences(conn, Cmk, User, Group, Student)
+        timings['вставка'] = time.perf_counter() - started
+
+    return {
+        'ЦМК': len(cmk_rows),
+        'пользователей': len(user_rows),
+        'групп': len(group_rows),
+        'студентов': len(student_rows),
+        'пропусков': len(absence_rows),
+    }, timings
+
+
+def reset():
+    """Очищает данные (кроме администраторов)"""
+    with app.app_context():
+        with db.engine.begin() as conn:
+            conn.execute(Absence.__table__.delete())
+            conn.execute(Student.__table__.delete())
+            conn.execute(Group.__table__.delete())
+            conn.execute(AuditLog.__table__.delete())
+            conn.execute(User.__table__.delete().where(User.role != 'admin'))
+            conn.execute(Cmk.__table__.delete())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Генерация синтетических данных для students.db')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small', help='пресет масштаба')
+    parser.add_argument('--cmks', type=int)
+    parser.add_argument('--curators', type=int)
+    parser.add_argument('--groups', type=int)
+    parser.add_argument('--students', type=int)
+    parser.add_argument('--absences', type=int, help='примерное число записей о пропусках')
+    parser.add_argument('--year', type=int, default=datetime.now().year - 1, help='год начала учебного года')
+    parser.add_argument('--password', default='password', help='пароль всех сгенерированных пользователей')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--reset', action='store_true', help='удалить существующие данные (кроме администраторов)')
+    args = parser.parse_args()
+
+    params = dict(SCALES[args.scale])
+    for key in params:
+        value = getattr(args, key)
+        if value is not None:
+            params[key] = value
+
+    print("=" * 60)
+    print("ГЕНЕРАЦИЯ СИНТЕТИЧЕСКИХ ДАННЫХ")
+    print("=" * 60)
+
+    if args.reset:
+        print("\n🗑️ Очищаем существующие данные...")
+        reset()
+
+    print(f"\n⚙️ Параметры: {params}")
+    started = time.perf_counter()
+    counts, timings = generate(year=args.year, password=args.password, seed=args.seed, **params)
+
+    print("\n✅ Добавлено:")
+    for name, count in counts.items():
+        print(f"  - {name}: {count}")
+    for name, seconds in timings.items():
+        print(f"⏱️ {name}: {seconds:.1f} с")
+    print(f"⏱️ всего: {time.perf_counter() - started:.1f} с")
+    print(f"🔑 Пароль пользователей: {args.password}")
+
+    print("\n" + "=" * 60)
+    print("ГЕНЕРАЦИЯ ЗАВЕРШЕНА!")
+    print("=" * 60)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+# gunicorn.conf.py
+"""Настройки gunicorn для продакшена.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Воркеры - процессы с пулом потоков (gthread). Параметры задаются
+переменными окружения: BIND, WEB_CONCURRENCY, GUNICORN_THREADS,
+GUNICORN_TIMEOUT, GUNICORN_MAX_REQUESTS.
+"""
+import multiprocessing
+import os
+
+from config import Config
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+
+# SQLite допускает одного писателя, поэтому воркеров по умолчанию немного
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 4)))
+worker_class = 'gthread'
+threads = Config.WORKER_THREADS
+
+# Экспорт в PDF/Excel на больших выборках может идти долго
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+# Перезапуск воркеров ограничивает рост памяти после pandas/reportlab
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = 100
+
+# Код приложения загружается один раз в мастере, воркеры получают его через fork
+preload_app = True
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    # Таблицы и группы по умолчанию создаются один раз, до запуска воркеров
+    from app import init_app
+    from services.metrics import MultiprocessMetrics, metrics_dir
+    from wsgi import app
+    init_app(app)
+    # Снимки метрик прошлого запуска не должны попасть в суммы
+    MultiprocessMetrics.clear(metrics_dir(app))
+
+
+def post_fork(server, worker):
+    # Свой пул соединений в каждом воркере
+    from app import init_worker
+    from wsgi import app
+    init_worker(app)
+
+
+def worker_exit(server, worker):
+    # Дописываем накопленный журнал действий
+    from services.audit import audit
+    audit.shutdown()
+    # Счётчики воркера остаются в общей сумме /metrics
+    from services.metrics import multiprocess
+    multiprocess.mark_dead()
@@ -0,0 +1,360 @@
+# load_test.py
+"""Нагрузочное тестирование локального сервера сценариями по ролям.
+
+Каждый виртуальный пользователь входит через /auth/login, держит
+cookie-сессию и повторяет типичный для своей роли сценарий:
+администратор выгружает отчёты, куратор смотрит аналитику, староста
+отмечает пропуски через /dashboard/api/roll-call. Нагрузка растёт
+ступенями (--stages); для каждой ступени выводятся пропускная
+способность, перцентили задержки, ошибки и число ошибок SQLite
+«database is locked» (по /metrics и по телам ответов).
+
+Сценарий morning имитирует утреннюю перекличку в 08:30: все
+пользователи - старосты и стартуют одновременно.
+
+    python app.py                                   # в другом терминале
+    python load_test.py --stages 5,10,20,40 --duration 30
+    python load_test.py --scenario morning --stages 50 --duration 20
+
+Учётные записи берутся из базы (--database: файл SQLite или URL
+SQLAlchemy, например postgresql://...), у всех сгенерированных
+generate_dataset.py пользователей общий пароль (--password).
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import re
+import sqlite3
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Доли ролей в смешанном сценарии
+DEFAULT_MIX = {'admin': 1, 'curator': 4, 'leader': 10}
+
+_ABSENT_RE = re.compile(r'name="absent" value="(\d+)"')
+_GROUP_RE = re.compile(r'name="group_id" value="(\d+)"')
+_LOCKED_RE = re.compile(r'^db_errors_total\{kind="locked"\} (\S+)$', re.MULTILINE)
+
+
+def percentile(values, pct):
+    """Перцентиль по методу ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+# =============================================
+# СТАТИСТИКА
+# =============================================
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = []  # (метка, секунды, статус, заблокировано)
+
+    def add(self, label, elapsed, status, locked):
+        with self._lock:
+            self.samples.append((label, elapsed, status, locked))
+
+    def drain(self):
+        with self._lock:
+            samples, self.samples = self.samples, []
+        return samples
+
+
+# =============================================
+# ВИРТУАЛЬНЫЙ ПОЛЬЗОВАТЕЛЬ
+# =============================================
+
+class VirtualUser(threading.Thread):
+    def __init__(self, base_url, role, account, recorder, stop, think, rnd):
+        super().__init__(daemon=True)
+        self.base_url = base_url.rstrip('/')
+        self.role = role
+        self.account = account
+        self.recorder = recorder
+        self.stop = stop
+        self.think = think
+        self.rnd = rnd
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+        self.students = []
+        self.group_id = account.get('group_id')
+
+    def request(self, label, path, data=None, json_body=None):
+        """Запрос с замером; возвращает (статус, тело)"""
+        headers = {}
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        elif data is not None:
+            body = urllib.parse.urlencode(data, doseq=True).encode('utf-8')
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers)
+
+        started = time.perf_counter()
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                status = response.status
+                payload = response.read()
+        except urllib.error.HTTPError as e:
+            status = e.code
+            payload = e.read()
+        except (urllib.error.URLError, OSError) as e:
+            status = 0
+            payload = str(e).encode('utf-8')
+        elapsed = time.perf_counter() - started
+
+        text = payload.decode('utf-8', errors='replace')
+        self.recorder.add(f'{self.role}:{label}', elapsed, status, 'database is locked' in text)
+        return status, text
+
+    def pause(self):
+        if self.think > 0:
+            self.stop.wait(self.rnd.expovariate(1.0 / self.think))
+
+    def login(self):
+        status, text = self.request('login', '/auth/login', data={
+            'username': self.account['phone'], 'password': self.account['password']})
+        return status == 200 and 'name="password"' not in text
+
+    def run(self):
+        if not self.login():
+            return
+        steps = getattr(self, f'session_{self.role}')
+        while not self.stop.is_set():
+            steps()
+
+    # === Сценарии ролей ===
+
+    def session_admin(self):
+        self.request('admin', '/dashboard/admin')
+        self.pause()
+        self.request('system_stats', '/dashboard/system-stats')
+        self.pause()
+        self.request('export_page', '/dashboard/export-students')
+        self.pause()
+        export_format = self.rnd.choice(('excel', 'csv', 'pdf'))
+        self.request(f'export_{export_format}', '/dashboard/export-students/process', data={
+            'period': 'month', 'export_format': export_format, 'include_stats': 'on'})
+        self.pause()
+        self.request('curator_stats', '/dashboard/curator_stats')
+        self.pause()
+
+    def session_curator(self):
+        self.request('index', '/dashboard/')
+        self.pause()
+        self.request('student_analytics', '/dashboard/student_analytics')
+        self.pause()
+        self.request('api_student_analytics', '/dashboard/api/student-analytics')
+        self.pause()
+        if self.group_id:
+            period = self.rnd.choice(('week', 'month'))
+            self.request('api_group_analytics',
+                         f'/dashboard/api/group-analytics?group_id={self.group_id}&period={period}')
+            self.pause()
+        self.request('absences', '/dashboard/absences')
+        self.pause()
+
+    def session_leader(self):
+        status, text = self.request('roll_call_page', '/dashboard/absences/roll-call')
+        if status == 200:
+            self.students = [int(s) for s in _ABSENT_RE.findall(text)] or self.students
+            group = _GROUP_RE.search(text)
+            if group:
+                self.group_id = int(group.group(1))
+        self.pause()
+
+        if self.group_id and self.students:
+            absent = self.rnd.sample(self.students, k=min(len(self.students), self.rnd.randint(0, 4)))
+            self.request('api_roll_call', '/dashboard/api/roll-call', json_body={
+                'group_id': self.group_id,
+                'date': datetime.now().strftime('%Y-%m-%d'),
+                'absences': [{'student_id': s, 'reason': self.rnd.choice(('', 'болезнь', 'справка')),
+                              'lessons_count': self.rnd.randint(1, 4)} for s in absent]
+            })
+            self.pause()
+        self.request('absences', '/dashboard/absences')
+        self.pause()
+
+
+# =============================================
+# УЧЁТНЫЕ ЗАПИСИ
+# =============================================
+
+def _connect(database):
+    """Соединение DB-API: файл SQLite только на чтение или URL SQLAlchemy"""
+    if '://' not in database:
+        return sqlite3.connect(f'file:{database}?mode=ro', uri=True)
+    from sqlalchemy import create_engine
+    return create_engine(database).raw_connection()
+
+
+def load_accounts(database, password):
+    """Подтверждённые пользователи по ролям с первой доступной группой"""
+    conn = _connect(database)
+
+    def rows(sql):
+        cursor = conn.cursor()
+        cursor.execute(sql)
+        return cursor.fetchall()
+
+    try:
+        accounts = defaultdict(list)
+        for phone, role in rows(
+                "SELECT phone, role FROM users WHERE role = 'admin'"):
+            accounts['admin'].append({'phone': phone, 'password': password})
+        for phone, group_id in rows("""
+                SELECT u.phone, MIN(g.id) FROM users u JOIN groups g ON g.curator_id = u.id
+                WHERE u.role = 'curator' AND u.is_confirmed GROUP BY u.id, u.phone"""):
+            accounts['curator'].append({'phone': phone, 'password': password, 'group_id': group_id})
+        for phone, group_id in rows("""
+                SELECT u.phone, g.id FROM users u JOIN groups g ON g.leader_id = u.id
+                WHERE u.role = 'leader' AND u.is_confirmed"""):
+            accounts['leader'].append({'phone': phone, 'password': password, 'group_id': group_id})
+        return accounts
+    finally:
+        conn.close()
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        role, _, weight = part.partition('=')
+        mix[role.strip()] = float(weight or 1)
+    return mix
+
+
+def scrape_locked(base_url):
+    """Счётчик db_errors_total{kind="locked"} с /metrics или None"""
+    try:
+        with urllib.request.urlopen(base_url.rstrip('/') + '/metrics', timeout=5) as response:
+            text = response.read().decode('utf-8')
+    except (urllib.error.URLError, OSError):
+        return None
+    match = _LOCKED_RE.search(text)
+    return float(match.group(1)) if match else 0.0
+
+
+# =============================================
+# ЗАПУСК
+# =============================================
+
+def summarize(samples, duration):
+    latencies = [s[1] * 1000 for s in samples]
+    errors = sum(1 for s in samples if s[2] == 0 or s[2] >= 500)
+    return {
+        'requests': len(samples),
+        'rps': round(len(samples) / duration, 2) if duration else 0.0,
+        'p50_ms': round(percentile(latencies, 50), 1),
+        'p95_ms': round(percentile(latencies, 95), 1),
+        'p99_ms': round(percentile(latencies, 99), 1),
+        'errors': errors,
+        'locked_responses': sum(1 for s in samples if s[3]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочное тестирование по ролям')
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--database', default=os.path.join(BASE_DIR, 'instance', 'students.db'),
+                        help='файл SQLite или URL базы, из которой берутся учётные записи')
+    parser.add_argument('--password', default='password')
+    parser.add_argument('--scenario', choices=('mixed', 'morning'), default='mixed')
+    parser.add_argument('--mix', default=','.join(f'{k}={v}' for k, v in DEFAULT_MIX.items()),
+                        help='доли ролей: admin=1,curator=4,leader=10')
+    parser.add_argument('--stages', default='5,10,20', help='число пользователей на ступенях')
+    parser.add_argument('--duration', type=float, default=30, help='секунд на ступень')
+    parser.add_argument('--ramp', type=float, default=5, help='секунд на разгон ступени')
+    parser.add_argument('--think', type=float, default=1.0, help='средняя пауза между действиями, с')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='сохранить отчёт в JSON')
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    accounts = load_accounts(args.database, args.password)
+    if args.scenario == 'morning':
+        mix, ramp, think = {'leader': 1}, 0, min(args.think, 0.2)
+    else:
+        mix, ramp, think = parse_mix(args.mix), args.ramp, args.think
+    mix = {role: weight for role, weight in mix.items() if accounts.get(role) and weight > 0}
+    if not mix:
+        print("❌ В базе нет подходящих учётных записей")
+        sys.exit(1)
+
+    print("=" * 60)
+    print(f"НАГРУЗОЧНЫЙ ТЕСТ: {args.url} ({args.scenario})")
+    print("=" * 60)
+    print(f"Роли: {mix}; учётных записей: { {r: len(accounts[r]) for r in mix} }")
+
+    recorder = Recorder()
+    report = {'url': args.url, 'scenario': args.scenario, 'stages': [], 'endpoints': {}}
+    all_samples = []
+    roles = list(mix)
+    weights = [mix[r] for r in roles]
+
+    for users in [int(s) for s in args.stages.split(',') if s.strip()]:
+        stop = threading.Event()
+        locked_before = scrape_locked(args.url)
+        recorder.drain()
+
+        threads = []
+        for i in range(users):
+            role = rnd.choices(roles, weights=weights)[0]
+            account = accounts[role][i % len(accounts[role])]
+            thread = VirtualUser(args.url, role, account, recorder, stop, think, random.Random(rnd.random()))
+            threads.append(thread)
+            thread.start()
+            if ramp:
+                time.sleep(ramp / users)
+
+        started = time.perf_counter()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=60)
+        elapsed = time.perf_counter() - started + ramp
+
+        samples = recorder.drain()
+        all_samples.extend(samples)
+        stage = dict(users=users, **summarize(samples, elapsed))
+        locked_after = scrape_locked(args.url)
+        if locked_before is not None and locked_after is not None:
+            stage['locked_errors'] = int(locked_after - locked_before)
+        report['stages'].append(stage)
+
+        print(f"👥 {users:>4}: {stage['requests']:>6} запр.  {stage['rps']:>7.1f} rps  "
+              f"p50 {stage['p50_ms']:>7.1f}  p95 {stage['p95_ms']:>7.1f}  p99 {stage['p99_ms']:>7.1f} мс  "
+              f"ошибок {stage['errors']}  locked {stage.get('locked_errors', stage['locked_responses'])}")
+
+    by_label = defaultdict(list)
+    for sample in all_samples:
+        by_label[sample[0]].append(sample)
+    print("\nПо действиям:")
+    for label in sorted(by_label):
+        summary = summarize(by_label[label], 0)
+        summary.pop('rps')
+        report['endpoints'][label] = summary
+        print(f"  {label:<32} {summary['requests']:>6}  p50 {summary['p50_ms']:>7.1f}  "
+              f"p95 {summary['p95_ms']:>7.1f} мс  ошибок {summary['errors']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Отчёт: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
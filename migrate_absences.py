@@ -0,0 +1,39 @@
+# migrate_absences.py
+import os
+import sys
+
+# Добавляем путь к проекту
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db
+from models.absence import UNIQUE_INDEX, Absence, merge_duplicate_absences
+from services.schema import create_index
+
+with app.app_context():
+    print("="*60)
+    print("МИГРАЦИЯ: УНИКАЛЬНЫЙ ПРОПУСК НА СТУДЕНТА В ДЕНЬ")
+    print("="*60)
+
+    # Слияние дублей и индекс в одной транзакции: без индекса база не остаётся
+    with db.engine.begin() as conn:
+        print("\n🔍 Поиск дублирующихся пропусков...")
+        removed = merge_duplicate_absences(conn)
+        if removed:
+            print(f"✅ Удалено дублей: {removed}")
+        else:
+            print("✅ Дублей нет!")
+
+        # Уникальный индекс (student_id, date)
+        print("\n🔍 Создаём уникальный индекс...")
+        try:
+            if create_index(conn, UNIQUE_INDEX, Absence.__tablename__, 'student_id', 'date', unique=True):
+                print(f"✅ Индекс {UNIQUE_INDEX} создан!")
+            else:
+                print(f"✅ Индекс {UNIQUE_INDEX} уже есть")
+        except Exception as e:
+            print(f"❌ Ошибка создания индекса: {e}")
+            raise
+
+    print("\n" + "="*60)
+    print("МИГРАЦИЯ ЗАВЕРШЕНА!")
+    print("="*60)
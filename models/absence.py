@@ -1,7 +1,19 @@
+from sqlalchemy import inspect, text
+
 from db import db
 
+# Больше занятий за день не бывает (совпадает с max в формах)
+MAX_LESSONS_PER_DAY = 12
+UNIQUE_INDEX = 'uq_absences_student_date'
+
 class Absence(db.Model):
     __tablename__ = 'absences'
+    # Один пропуск на студента в день; индекс также покрывает выборки по студенту за период.
+    # ix_absences_date - ряды посещаемости по всем студентам за период (services/timeseries.py)
+    __table_args__ = (
+        db.Index(UNIQUE_INDEX, 'student_id', 'date', unique=True),
+        db.Index('ix_absences_date', 'date'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)  # 🟢 связь с таблицей students
@@ -10,3 +22,82 @@ class Absence(db.Model):
     lessons_count = db.Column(db.Integer, default=1)
 
     student = db.relationship('Student', back_populates='absences')
+
+
+def upsert_absences(rows, merge=True):
+    """INSERT ... ON CONFLICT (student_id, date) для списка словарей пропусков.
+
+    При merge=True количество занятий суммируется с уже записанным
+    (не больше MAX_LESSONS_PER_DAY), иначе запись перезаписывается. Пустая причина не затирает существующую.
+    Коммит выполняет вызывающий код.
+    """
+    if not rows:
+        return
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    rows = [dict(row, lessons_count=int(row.get('lessons_count') or 1)) for row in rows]
+    stmt = insert(Absence)
+    lessons_count = stmt.excluded.lessons_count
+    if merge:
+        # least() в PostgreSQL, в SQLite min() с двумя аргументами
+        least = db.func.least if dialect == 'postgresql' else db.func.min
+        lessons_count = least(Absence.lessons_count + stmt.excluded.lessons_count, MAX_LESSONS_PER_DAY)
+
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['student_id', 'date'],
+        set_={
+            'lessons_count': lessons_count,
+            'reason': db.func.coalesce(stmt.excluded.reason, Absence.reason)
+        }
+    )
+    db.session.execute(stmt, rows)
+
+
+def merge_duplicate_absences(conn):
+    """Сливает дубли (student_id, date) в самую раннюю запись
+
+    Без этого uq_absences_student_date не создать в базе, где пропуски
+    за один день записывались несколькими строками. Занятия суммируются
+    (не больше MAX_LESSONS_PER_DAY), причина - первая непустая.
+    Если индекс уже есть, дублей быть не может и ничего не делается.
+    Возвращает число удалённых записей.
+    """
+    inspector = inspect(conn)
+    if not inspector.has_table(Absence.__tablename__):
+        return 0
+    if UNIQUE_INDEX in {index['name'] for index in inspector.get_indexes(Absence.__tablename__)}:
+        return 0
+
+    duplicates = conn.execute(text("""
+        SELECT student_id, date, MIN(id) AS keep_id,
+               SUM(COALESCE(lessons_count, 1)) AS total_lessons
+        FROM absences
+        GROUP BY student_id, date
+        HAVING COUNT(*) > 1
+    """)).fetchall()
+
+    removed = 0
+    for student_id, date, keep_id, total_lessons in duplicates:
+        reason = conn.execute(text("""
+            SELECT reason FROM absences
+            WHERE student_id = :student_id AND date = :date AND reason IS NOT NULL AND reason != ''
+            ORDER BY id LIMIT 1
+        """), {'student_id': student_id, 'date': date}).scalar()
+
+        conn.execute(text("""
+            UPDATE absences SET lessons_count = :total_lessons, reason = :reason
+            WHERE id = :keep_id
+        """), {'total_lessons': min(total_lessons, MAX_LESSONS_PER_DAY), 'reason': reason,
+               'keep_id': keep_id})
+
+        result = conn.execute(text("""
+            DELETE FROM absences
+            WHERE student_id = :student_id AND date = :date AND id != :keep_id
+        """), {'student_id': student_id, 'date': date, 'keep_id': keep_id})
+        removed += result.rowcount
+    return removed
@@ -0,0 +1,19 @@
+# models/analytics_change.py
+from db import db
+from datetime import datetime
+
+class AnalyticsChange(db.Model):
+    """Журнал изменений для колоночного хранилища пропусков (services/absence_store.py)
+
+    kind: student - изменились пропуски студента student_id; roster -
+    студенты, группы или кураторы; all - массовое изменение пропусков.
+    """
+    __tablename__ = 'analytics_changes'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(10), nullable=False)
+    student_id = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<AnalyticsChange {self.id} {self.kind} {self.student_id}>"
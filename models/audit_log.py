@@ -4,6 +4,12 @@ from datetime import datetime
 
 class AuditLog(db.Model):
     __tablename__ = 'audit_logs'
+    # Индексы для просмотра журнала: по дате и с фильтрами по пользователю/действию
+    __table_args__ = (
+        db.Index('ix_audit_logs_created_at', 'created_at', 'id'),
+        db.Index('ix_audit_logs_user_created', 'user_id', 'created_at'),
+        db.Index('ix_audit_logs_action_created', 'action', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -15,4 +21,4 @@ class AuditLog(db.Model):
     user = db.relationship('User', backref='audit_logs')
     
     def __repr__(self):
-        return f"<AuditLog {self.action} by user {self.user_id}>"
\ No newline at end of file
+        return f"<AuditLog {self.action} by user {self.user_id}>"
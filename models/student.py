@@ -3,6 +3,10 @@ from db import db
 
 class Student(db.Model):
     __tablename__ = 'students'
+    # Студенты группы: аналитика и ряды посещаемости по группе, куратору, ЦМК
+    __table_args__ = (
+        db.Index('ix_students_group_id', 'group_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     full_name = db.Column(db.String(150), nullable=False)
@@ -2,5 +2,7 @@
 from flask import Blueprint
 from .auth_routes import auth_bp
 from .dashboard_routes import dashboard_bp
+from .metrics_routes import metrics_bp
+from .health_routes import health_bp
 
-__all__ = ['auth_bp', 'dashboard_bp']
\ No newline at end of file
+__all__ = ['auth_bp', 'dashboard_bp', 'metrics_bp', 'health_bp']
\ No newline at end of file
@@ -4,6 +4,7 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from db import db
 from models.user import User
 from models.group import Group
+from services.reference_cache import reference_cache
 from flask_bcrypt import Bcrypt
 from flask_login import login_user
 from datetime import datetime
@@ -24,7 +25,7 @@ def safe_getattr(user, attr, default=None):
 def register_student():
     if request.method == 'GET':
         # Получаем список групп для выбора
-        groups = Group.query.order_by(Group.name).all()
+        groups = reference_cache.groups()
         return render_template('register_student.html', groups=groups)
     
     if request.method == 'POST':
@@ -38,21 +39,21 @@ def register_student():
         existing_user = User.query.filter_by(phone=phone).first()
         if existing_user:
             flash('❌ Пользователь с таким номером телефона уже существует.', 'danger')
-            groups = Group.query.order_by(Group.name).all()
+            groups = reference_cache.groups()
             return render_template('register_student.html', groups=groups)
 
         # Проверяем, существует ли группа
         group = Group.query.get(group_id)
         if not group:
             flash('❌ Выбранная группа не существует.', 'danger')
-            groups = Group.query.order_by(Group.name).all()
+            groups = reference_cache.groups()
             return render_template('register_student.html', groups=groups)
 
         # Проверяем, нет ли уже старосты в этой группе
         existing_leader = Group.query.filter_by(leader_id=group_id).first()
         if existing_leader and existing_leader.leader_id:
             flash('❌ В этой группе уже есть староста.', 'danger')
-            groups = Group.query.order_by(Group.name).all()
+            groups = reference_cache.groups()
             return render_template('register_student.html', groups=groups)
 
         user = User(
@@ -77,7 +78,7 @@ def register_student():
         flash('✅ Регистрация прошла успешно! Ожидайте подтверждения администратора.', 'success')
         return redirect(url_for('auth.login'))
 
-    groups = Group.query.order_by(Group.name).all()
+    groups = reference_cache.groups()
     return render_template('register_student.html', groups=groups)
 
 # 🔹 Регистрация куратора - ИСПРАВЛЕННЫЙ ВЕРСИЯ
@@ -85,7 +86,7 @@ def register_student():
 def register_curator():
     if request.method == 'GET':
         # Получаем список групп для выбора
-        groups = Group.query.order_by(Group.name).all()
+        groups = reference_cache.groups()
         return render_template('register_curator.html', groups=groups)
     
     if request.method == 'POST':
@@ -99,7 +100,7 @@ def register_curator():
         existing_user = User.query.filter_by(phone=phone).first()
         if existing_user:
             flash('❌ Пользователь с таким номером телефона уже существует.', 'danger')
-            groups = Group.query.order_by(Group.name).all()
+            groups = reference_cache.groups()
             return render_template('register_curator.html', groups=groups)
 
         user = User(
@@ -126,7 +127,7 @@ def register_curator():
         flash('✅ Куратор зарегистрирован! Ожидайте подтверждения администратора.', 'success')
         return redirect(url_for('auth.login'))
 
-    groups = Group.query.order_by(Group.name).all()
+    groups = reference_cache.groups()
     return render_template('register_curator.html', groups=groups)
 
 # 🔹 Вход в систему (защищённая версия) - БЕЗ ИЗМЕНЕНИЙ
@@ -2,27 +2,40 @@
 from flask_bcrypt import Bcrypt
 
 bcrypt = Bcrypt()
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_file
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_file, send_from_directory, current_app, abort
 from flask_login import login_required, current_user
 from db import db
 from models.student import Student
 from models.group import Group
-from models.absence import Absence
+from models.absence import MAX_LESSONS_PER_DAY, Absence, upsert_absences
 from models.user import User
 from models.cmk import Cmk
 from models.audit_log import AuditLog
+from services.audit import audit
+from services.cache import cache
+from services.singleflight import request_key
+from services.reference_cache import reference_cache
+from services.perf import perf_monitor
+from services.slow_query import slow_query_log
+from services.metrics import track_job
+from services.limiter import limiter, limit_concurrency
+from services.profiler import request_profiler, MODES as PROFILE_MODES, TOKEN_HEADER as PROFILE_TOKEN_HEADER
+from services.query_budget import query_budget
+from services.db_routing import read_only
+from services.absence_store import absence_store
+from services.timeseries import BUCKETS as SERIES_BUCKETS, SCOPES as SERIES_SCOPES, attendance_series, bucket_floor, count_buckets
 from datetime import datetime, timedelta
-import pandas as pd
+from services.lazy import pandas as pd  # загружается при первом экспорте/импорте
 import io
 import csv
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from reportlab.lib import colors
-from reportlab.platypus import Table, TableStyle
 import logging
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
+# Общий кэш: счётчики панели, аналитика и строки экспорта сбрасываются коммитом
+for _model in (Student, Group, Absence, User):
+    cache.track(_model, 'counters', 'analytics', 'export')
+
 # =============================================
 # ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ
 # =============================================
@@ -39,18 +52,114 @@ def get_user_groups(user):
     return []
 
 def get_user_students(user):
-    """Возвращает список студентов доступных пользователю"""
+    """Возвращает список студентов доступных пользователю (с группой, куратором и старостой)"""
+    query = Student.query.options(
+        db.joinedload(Student.group).joinedload(Group.curator),
+        db.joinedload(Student.group).joinedload(Group.leader)
+    )
     if user.role == 'admin':
-        return Student.query.all()
+        return query.all()
     elif user.role == 'curator':
         groups = Group.query.filter_by(curator_id=user.id).all()
         group_ids = [g.id for g in groups]
-        return Student.query.filter(Student.group_id.in_(group_ids)).all() if group_ids else []
+        return query.filter(Student.group_id.in_(group_ids)).all() if group_ids else []
     elif user.role == 'leader':
         group = Group.query.filter_by(leader_id=user.id).first()
-        return Student.query.filter_by(group_id=group.id).all() if group else []
+        return query.filter_by(group_id=group.id).all() if group else []
     return []
 
+EXCUSED_REASONS = {'болезнь', 'справка', 'уважительная', 'по болезни', 'мед. справка'}
+
+def count_student_absences(student_ids=None, start_date=None, end_date=None):
+    """Пропуски по студентам одним GROUP BY: {student_id: (всего, уважительных)}
+
+    student_ids=None - по всем студентам.
+    """
+    if student_ids is not None and not student_ids:
+        return {}
+    if absence_store.active:
+        return absence_store.student_totals(student_ids, start_date, end_date, EXCUSED_REASONS)
+
+    query = db.session.query(Absence.student_id, Absence.reason, db.func.count(Absence.id))
+    if student_ids is not None:
+        query = query.filter(Absence.student_id.in_(student_ids))
+    if start_date:
+        query = query.filter(Absence.date >= start_date)
+    if end_date:
+        query = query.filter(Absence.date <= end_date)
+
+    # Причины сравниваем в Python: lower() в SQLite не работает с кириллицей
+    totals = {}
+    for student_id, reason, count in query.group_by(Absence.student_id, Absence.reason):
+        total, excused = totals.get(student_id, (0, 0))
+        if reason and reason.lower() in EXCUSED_REASONS:
+            excused += count
+        totals[student_id] = (total + count, excused)
+    return totals
+
+STUDENT_ANALYTICS_COLUMNS = ['student_name', 'group_name', 'curator_name', 'leader_name',
+                             'total_absences', 'excused', 'unexcused']
+
+def student_analytics_rows(user, student_name='', group_name='', curator_id=None, leader_id=None,
+                           sort=None, descending=False):
+    """Пропуски по доступным пользователю студентам: два запроса и pandas
+
+    Студенты с названием группы, именами куратора и старосты - один запрос
+    с JOIN, пропуски - один GROUP BY (count_student_absences). Фильтры,
+    объединение и сортировка - операции над столбцами DataFrame; имена
+    сравниваются без учёта регистра в pandas, так как lower() в SQLite
+    не работает с кириллицей.
+    """
+    curator = db.aliased(User)
+    leader = db.aliased(User)
+    query = db.session.query(
+        Student.id, Student.full_name, Group.name, Group.curator_id, Group.leader_id,
+        curator.full_name, leader.full_name
+    ).outerjoin(Group, Group.id == Student.group_id) \
+     .outerjoin(curator, curator.id == Group.curator_id) \
+     .outerjoin(leader, leader.id == Group.leader_id)
+
+    if user.role == 'curator':
+        query = query.filter(Group.curator_id == user.id)
+    elif user.role == 'leader':
+        led_group = db.select(Group.id).where(Group.leader_id == user.id).limit(1).scalar_subquery()
+        query = query.filter(Student.group_id == led_group)
+    elif user.role != 'admin':
+        return []
+
+    frame = pd.DataFrame(query.order_by(Student.id).all(),
+                         columns=['id', 'student_name', 'group_name', 'curator_id', 'leader_id',
+                                  'curator_name', 'leader_name'])
+
+    # Фильтры: студенты без группы не проходят фильтры по группе, куратору и старосте
+    if student_name:
+        frame = frame[frame['student_name'].str.lower().str.contains(student_name.lower(), regex=False)]
+    if group_name:
+        frame = frame[frame['group_name'].str.lower().str.contains(group_name.lower(), regex=False, na=False)]
+    for column, value in (('curator_id', curator_id), ('leader_id', leader_id)):
+        if value:
+            frame = frame[frame[column] == (int(value) if value.isdigit() else -1)]
+
+    totals = count_student_absences(None if user.role == 'admin' else frame['id'].tolist())
+    counts = pd.DataFrame.from_dict(totals, orient='index', columns=['total_absences', 'excused'])
+    frame = frame.merge(counts, how='left', left_on='id', right_index=True)
+    frame[['total_absences', 'excused']] = frame[['total_absences', 'excused']].fillna(0).astype(int)
+    frame['unexcused'] = frame['total_absences'] - frame['excused']
+    frame[['group_name', 'curator_name', 'leader_name']] = \
+        frame[['group_name', 'curator_name', 'leader_name']].fillna('-')
+
+    if sort in STUDENT_ANALYTICS_COLUMNS:
+        frame = frame.sort_values(sort, ascending=not descending, kind='stable')
+    return frame[STUDENT_ANALYTICS_COLUMNS].to_dict('records')
+
+def count_group_absences():
+    """Пропуски по группам одним GROUP BY: {group_id: всего}"""
+    if absence_store.active:
+        return {group_id: total for group_id, (total, _) in
+                absence_store.group_totals(None, None, EXCUSED_REASONS).items()}
+    query = db.session.query(Student.group_id, db.func.count(Absence.id)).join(Absence, Absence.student_id == Student.id)
+    return dict(query.group_by(Student.group_id).all())
+
 def get_user_absences(user):
     """Возвращает список пропусков доступных пользователю"""
     if user.role == 'admin':
@@ -69,6 +178,21 @@ def get_user_absences(user):
             return Absence.query.filter(Absence.student_id.in_(student_ids)).all() if student_ids else []
     return []
 
+def dashboard_counters():
+    """Счётчики главной страницы из общего кэша"""
+    def load():
+        return {
+            'students': Student.query.count(),
+            'groups': Group.query.count(),
+            'absences': Absence.query.count(),
+            'pending': User.query.filter(
+                User.role.in_(['curator', 'leader']),
+                User.is_confirmed == False,
+                User.is_rejected == False
+            ).count()
+        }
+    return cache.get_or_set('counters', 'dashboard', load, ttl=current_app.config['COUNTERS_CACHE_TTL'])
+
 # =============================================
 # ОСНОВНЫЕ МАРШРУТЫ
 # =============================================
@@ -76,21 +200,15 @@ def get_user_absences(user):
 @dashboard_bp.route('/')
 @login_required
 def index():
-    pending_count = 0
-    if current_user.role == 'admin':
-        pending_count = User.query.filter(
-            User.role.in_(['curator', 'leader']),
-            User.is_confirmed == False,
-            User.is_rejected == False
-        ).count()
+    counters = dashboard_counters()
 
     return render_template(
         'dashboard.html',
         user=current_user,
-        students_count=Student.query.count(),
-        groups_count=Group.query.count(),
-        absences_count=Absence.query.count(),
-        pending_count=pending_count
+        students_count=counters['students'],
+        groups_count=counters['groups'],
+        absences_count=counters['absences'],
+        pending_count=counters['pending'] if current_user.role == 'admin' else 0
     )
 
 # =============================================
@@ -105,7 +223,8 @@ def admin_dashboard():
         return redirect(url_for('dashboard.index'))
     
     # Статистика для админа
-    stats = {
+    today = datetime.now().date()
+    stats = cache.get_or_set('counters', ('admin', today.isoformat()), lambda: {
         'total_users': User.query.count(),
         'total_students': Student.query.count(),
         'total_groups': Group.query.count(),
@@ -113,8 +232,8 @@ def admin_dashboard():
         'pending_users': User.query.filter_by(is_confirmed=False, is_rejected=False).count(),
         'curator_count': User.query.filter_by(role='curator', is_confirmed=True).count(),
         'leader_count': User.query.filter_by(role='leader', is_confirmed=True).count(),
-        'today_absences': Absence.query.filter(Absence.date == datetime.now().date()).count()
-    }
+        'today_absences': Absence.query.filter(Absence.date == today).count()
+    }, ttl=current_app.config['COUNTERS_CACHE_TTL'])
     
     # Последние 5 действий
     recent_actions = AuditLog.query.order_by(AuditLog.created_at.desc()).limit(5).all()
@@ -135,6 +254,169 @@ def admin_dashboard():
                          total_groups=stats['total_groups'],
                          pending_users_count=stats['pending_users'])
 
+# =============================================
+# ЖУРНАЛ ДЕЙСТВИЙ
+# =============================================
+
+@dashboard_bp.route('/admin/audit')
+@login_required
+def audit_log_view():
+    """Журнал действий с фильтрами и постраничным выводом по ключу (created_at, id)"""
+    if current_user.role != 'admin':
+        flash('Доступ запрещён', 'danger')
+        return redirect(url_for('dashboard.index'))
+
+    user_id = request.args.get('user_id', type=int)
+    action = request.args.get('action', '').strip()
+    date_from = request.args.get('date_from', '')
+    date_to = request.args.get('date_to', '')
+    cursor = request.args.get('cursor', '')
+    page_size = current_app.config.get('AUDIT_PAGE_SIZE', 50)
+
+    query = AuditLog.query
+    if user_id:
+        query = query.filter(AuditLog.user_id == user_id)
+    if action:
+        query = query.filter(AuditLog.action == action)
+    try:
+        if date_from:
+            query = query.filter(AuditLog.created_at >= datetime.strptime(date_from, '%Y-%m-%d'))
+        if date_to:
+            query = query.filter(AuditLog.created_at < datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1))
+        if cursor:
+            # Курсор: "<created_at ISO>_<id>" последней показанной записи
+            cursor_time, cursor_id = cursor.rsplit('_', 1)
+            cursor_time = datetime.fromisoformat(cursor_time)
+            query = query.filter(db.or_(
+                AuditLog.created_at < cursor_time,
+                db.and_(AuditLog.created_at == cursor_time, AuditLog.id < int(cursor_id))
+            ))
+    except ValueError:
+        flash('Неверные параметры фильтра', 'danger')
+        return redirect(url_for('dashboard.audit_log_view'))
+
+    entries = query.options(db.joinedload(AuditLog.user)).order_by(
+        AuditLog.created_at.desc(), AuditLog.id.desc()
+    ).limit(page_size + 1).all()
+
+    next_cursor = None
+    if len(entries) > page_size:
+        entries = entries[:page_size]
+        last = entries[-1]
+        next_cursor = f'{last.created_at.isoformat()}_{last.id}'
+
+    # Справочники для фильтров
+    actions = [a for (a,) in db.session.query(AuditLog.action).distinct().order_by(AuditLog.action)]
+    users = User.query.filter(User.role.in_(['admin', 'curator', 'leader'])).order_by(User.full_name).all()
+
+    filters = {'user_id': user_id or '', 'action': action, 'date_from': date_from, 'date_to': date_to}
+    return render_template('audit_log.html',
+                         entries=entries,
+                         actions=actions,
+                         users=users,
+                         filters=filters,
+                         cursor=cursor,
+                         next_cursor=next_cursor)
+
+# =============================================
+# ПРОИЗВОДИТЕЛЬНОСТЬ
+# =============================================
+
+@dashboard_bp.route('/perf', methods=['GET', 'POST'])
+@login_required
+def perf():
+    """Перцентили времени ответа, времени БД и числа запросов по маршрутам"""
+    if current_user.role != 'admin':
+        flash('Доступ запрещён', 'danger')
+        return redirect(url_for('dashboard.index'))
+
+    if request.method == 'POST':
+        perf_monitor.reset()
+        flash('Статистика производительности сброшена', 'success')
+        return redirect(url_for('dashboard.perf'))
+
+    endpoints = sorted({rule.endpoint for rule in current_app.url_map.iter_rules()
+                        if rule.endpoint != 'static'})
+    return render_template('perf.html',
+                         routes=perf_monitor.summary(),
+                         enabled=perf_monitor.enabled,
+                         limits=limiter.summary(),
+                         endpoints=endpoints,
+                         profile_modes=PROFILE_MODES,
+                         profile_armed=request_profiler.armed(),
+                         profile_max_requests=request_profiler.max_requests,
+                         profile_token_header=PROFILE_TOKEN_HEADER,
+                         profiles=request_profiler.profiles())
+
+@dashboard_bp.route('/perf/profile', methods=['POST'])
+@login_required
+def perf_profile():
+    """Взвести/снять профилировщик, выпустить токен, очистить профили"""
+    if current_user.role != 'admin':
+        flash('Доступ запрещён', 'danger')
+        return redirect(url_for('dashboard.index'))
+
+    action = request.form.get('action')
+    mode = request.form.get('mode', 'cprofile')
+    if mode not in PROFILE_MODES:
+        flash('Неизвестный режим профилирования', 'danger')
+        return redirect(url_for('dashboard.perf'))
+
+    if action == 'arm':
+        endpoint = request.form.get('endpoint', '').strip()
+        if endpoint not in current_app.view_functions:
+            flash('Маршрут не найден', 'danger')
+            return redirect(url_for('dashboard.perf'))
+        try:
+            count = int(request.form.get('count', 1))
+        except ValueError:
+            count = 1
+        count = request_profiler.arm(endpoint, count, mode)
+        audit.record('profile_arm', f'Профилирование {endpoint}: следующие {count} запросов ({mode})')
+        flash(f'Будут профилированы следующие {count} запросов к {endpoint}', 'success')
+    elif action == 'disarm':
+        request_profiler.disarm(request.form.get('endpoint') or None)
+        flash('Профилирование остановлено', 'success')
+    elif action == 'token':
+        token = request_profiler.issue_token(mode)
+        audit.record('profile_token', f'Выпущен токен профилирования ({mode})')
+        minutes = request_profiler.token_max_age // 60
+        flash(f'{PROFILE_TOKEN_HEADER}: {token} (действует {minutes} мин.)', 'info')
+    elif action == 'clear':
+        request_profiler.clear()
+        flash('Сохранённые профили удалены', 'success')
+
+    return redirect(url_for('dashboard.perf'))
+
+@dashboard_bp.route('/perf/profiles/<path:name>')
+@login_required
+def download_profile(name):
+    """Скачать сохранённый профиль (.pstats или .folded)"""
+    if current_user.role != 'admin':
+        flash('Доступ запрещён', 'danger')
+        return redirect(url_for('dashboard.index'))
+
+    if name not in {p['name'] for p in request_profiler.profiles()}:
+        abort(404)
+    return send_from_directory(request_profiler.directory, name, as_attachment=True)
+
+@dashboard_bp.route('/perf/slow-queries', methods=['GET', 'POST'])
+@login_required
+def slow_queries():
+    """Медленные SQL-запросы, сгруппированные по отпечатку"""
+    if current_user.role != 'admin':
+        flash('Доступ запрещён', 'danger')
+        return redirect(url_for('dashboard.index'))
+
+    if request.method == 'POST':
+        slow_query_log.reset()
+        flash('Сводка медленных запросов сброшена', 'success')
+        return redirect(url_for('dashboard.slow_queries'))
+
+    return render_template('slow_queries.html',
+                         queries=slow_query_log.summary(),
+                         threshold_ms=slow_query_log.threshold * 1000)
+
 # =============================================
 # БЫСТРЫЕ ДЕЙСТВИЯ АДМИНИСТРАТОРА
 # =============================================
@@ -194,6 +476,7 @@ def confirm_curators():
 
 @dashboard_bp.route('/confirm_leaders')
 @login_required
+@query_budget(admin=4)
 def confirm_leaders():
     if current_user.role != 'admin':
         flash('Доступ запрещён', 'danger')
@@ -206,16 +489,21 @@ def confirm_leaders():
         User.is_rejected == False
     ).all()
     
-    # Получаем информацию о группах для старост
+    # Получаем информацию о группах для старост одним запросом
+    groups_by_leader = {}
+    leader_ids = [leader.id for leader in pending_leaders]
+    if leader_ids:
+        for group in Group.query.filter(Group.leader_id.in_(leader_ids)).order_by(Group.id):
+            groups_by_leader.setdefault(group.leader_id, group)
+
     leaders_with_groups = []
     for leader in pending_leaders:
-        group = Group.query.filter_by(leader_id=leader.id).first() if leader.role == 'leader' else None
         leaders_with_groups.append({
             'id': leader.id,
             'full_name': leader.full_name,
             'phone': leader.phone,
-            'email': leader.email,
-            'group': group
+            'email': getattr(leader, 'email', None),
+            'group': groups_by_leader.get(leader.id)
         })
     
     return render_template('confirm_leaders.html', leaders=leaders_with_groups)
@@ -240,14 +528,7 @@ def confirm_user(user_id):
     db.session.commit()
     
     # Логируем действие
-    audit_log = AuditLog(
-        user_id=current_user.id,
-        action='confirm_user',
-        description=f'Подтверждён пользователь: {user.full_name} ({user.role})',
-        ip_address=request.remote_addr
-    )
-    db.session.add(audit_log)
-    db.session.commit()
+    audit.record('confirm_user', f'Подтверждён пользователь: {user.full_name} ({user.role})')
     
     flash(f'Пользователь {user.full_name} подтверждён', 'success')
     
@@ -285,14 +566,7 @@ def reject_user(user_id):
     db.session.commit()
     
     # Логируем действие
-    audit_log = AuditLog(
-        user_id=current_user.id,
-        action='reject_user',
-        description=f'Отклонён пользователь: {user.full_name} ({user.role})',
-        ip_address=request.remote_addr
-    )
-    db.session.add(audit_log)
-    db.session.commit()
+    audit.record('reject_user', f'Отклонён пользователь: {user.full_name} ({user.role})')
     
     flash(f'Заявка пользователя {user.full_name} отклонена', 'success')
     
@@ -308,69 +582,79 @@ def reject_user(user_id):
 
 @dashboard_bp.route('/curator_stats')
 @login_required
+@query_budget(admin=5)
+@read_only
 def curator_stats():
     if current_user.role != 'admin':
         flash('Доступ запрещён', 'danger')
         return redirect(url_for('dashboard.index'))
     
-    # Получаем всех подтверждённых кураторов и старост
-    users = User.query.filter(
-        User.role.in_(['curator', 'leader']),
-        User.is_confirmed == True
-    ).all()
-    
-    # Собираем статистику
-    curator_data = []
-    for user in users:
-        groups_count = 0
-        students_count = 0
-        total_absences = 0
-        excused = 0
-        unexcused = 0
+    # Одну и ту же статистику часто открывают сразу несколько человек:
+    # одновременные запросы ждут первое вычисление (single-flight в cache.get_or_set)
+    def build_stats():
+        # Четыре запроса вместо запросов по каждой группе и студенту:
+        # пользователи, группы, студенты и пропуски по группам (GROUP BY)
+        users = User.query.filter(
+            User.role.in_(['curator', 'leader']),
+            User.is_confirmed == True
+        ).all()
         
-        if user.role == 'curator':
-            groups = Group.query.filter_by(curator_id=user.id).all()
-            groups_count = len(groups)
-            for group in groups:
-                students_count += len(group.students)
-                for student in group.students:
-                    absences = Absence.query.filter_by(student_id=student.id).all()
-                    total_absences += len(absences)
-                    for absence in absences:
-                        if absence.reason and absence.reason.lower() in ['болезнь', 'справка', 'уважительная']:
-                            excused += 1
-                        else:
-                            unexcused += 1
-        else:  # leader
-            group = Group.query.filter_by(leader_id=user.id).first()
-            if group:
-                groups_count = 1
-                students_count = len(group.students)
-                for student in group.students:
-                    absences = Absence.query.filter_by(student_id=student.id).all()
-                    total_absences += len(absences)
-                    for absence in absences:
-                        if absence.reason and absence.reason.lower() in ['болезнь', 'справка', 'уважительная']:
-                            excused += 1
-                        else:
-                            unexcused += 1
+        curator_groups = {}
+        leader_groups = {}
+        for group_id, curator_id, leader_id in db.session.query(Group.id, Group.curator_id, Group.leader_id).order_by(Group.id):
+            curator_groups.setdefault(curator_id, []).append(group_id)
+            # У старосты одна группа (первая, как раньше .first())
+            leader_groups.setdefault(leader_id, [group_id])
         
-        curator_data.append({
-            'curator': user.full_name,
-            'role': user.role,
-            'phone': user.phone,
-            'telegram': user.telegram,
-            'groups_count': groups_count,
-            'students_count': students_count,
-            'total_absences': total_absences,
-            'excused': excused,
-            'unexcused': unexcused
-        })
+        students_count = dict(
+            db.session.query(Student.group_id, db.func.count(Student.id)).group_by(Student.group_id).all()
+        )
+        
+        # Причины сравниваются в Python: lower() в SQLite не работает с кириллицей
+        excused_reasons = {'болезнь', 'справка', 'уважительная'}
+        absences_count = {}
+        absences_query = db.session.query(Student.group_id, Absence.reason, db.func.count(Absence.id)) \
+            .join(Absence, Absence.student_id == Student.id) \
+            .group_by(Student.group_id, Absence.reason)
+        for group_id, reason, count in absences_query:
+            total, excused = absences_count.get(group_id, (0, 0))
+            if reason and reason.lower() in excused_reasons:
+                excused += count
+            absences_count[group_id] = (total + count, excused)
+    
+        # Собираем статистику
+        curator_data = []
+        for user in users:
+            if user.role == 'curator':
+                group_ids = curator_groups.get(user.id, [])
+            else:  # leader
+                group_ids = leader_groups.get(user.id, [])
+            
+            total_absences = sum(absences_count.get(group_id, (0, 0))[0] for group_id in group_ids)
+            excused = sum(absences_count.get(group_id, (0, 0))[1] for group_id in group_ids)
+        
+            curator_data.append({
+                'curator': user.full_name,
+                'role': user.role,
+                'phone': user.phone,
+                'telegram': user.telegram,
+                'groups_count': len(group_ids),
+                'students_count': sum(students_count.get(group_id, 0) for group_id in group_ids),
+                'total_absences': total_absences,
+                'excused': excused,
+                'unexcused': total_absences - excused
+            })
+    
+        return curator_data
+
+    curator_data = cache.get_or_set('analytics', request_key(), build_stats,
+                                    ttl=current_app.config['ANALYTICS_CACHE_TTL'])
     
     return render_template('curator_stats.html', curator_data=curator_data)
 
 @dashboard_bp.route('/cmk_stats')
 @login_required
+@read_only
 def cmk_stats():
     if current_user.role != 'admin':
         flash('Доступ запрещён', 'danger')
@@ -418,30 +702,18 @@ def export_students_page():
         flash('Доступ запрещён', 'danger')
         return redirect(url_for('dashboard.index'))
     
-    # Получаем группы и кураторов для фильтров
-    groups = Group.query.all()
-    curators = User.query.filter_by(role='curator', is_confirmed=True).all()
-    
-    # ПОЛУЧАЕМ ВСЕХ СТАРОСТ (leader) ДЛЯ ФИЛЬТРА
-    headmen = User.query.filter_by(role='leader', is_confirmed=True).all()
-    
-    # Добавляем информацию о группе для каждого старосты
-    headmen_with_groups = []
-    for headman in headmen:
-        group = Group.query.filter_by(leader_id=headman.id).first()
-        headmen_with_groups.append({
-            'id': headman.id,
-            'full_name': headman.full_name,
-            'group_name': group.name if group else 'Не назначена'
-        })
-    
+    # Получаем группы, кураторов и старост (с названием группы) для фильтров из кэша справочников
     return render_template('export_students.html', 
-                         groups=groups, 
-                         curators=curators,
-                         headmen=headmen_with_groups)  # Передаём список старост
+                         groups=reference_cache.groups(), 
+                         curators=reference_cache.curators(),
+                         headmen=reference_cache.leaders())  # Передаём список старост
 
 @dashboard_bp.route('/export-students/process', methods=['POST'])
 @login_required
+@limit_concurrency('export')
+@track_job('export_students_extended')
+@query_budget(admin=5)
+@read_only
 def export_students_post():
     """Обработка экспорта студентов (POST запрос)"""
     if current_user.role != 'admin':
@@ -461,34 +733,6 @@ def export_students_post():
         include_reason = request.form.get('include_reason') == 'on'
         exclude_status = request.form.get('exclude_status') == 'on'  # Новая опция
         
-        # Строим запрос для получения студентов
-        query = Student.query
-        
-        # Применяем фильтры
-        if group_id and group_id != '':
-            query = query.filter_by(group_id=group_id)
-        
-        if curator_id and curator_id != '':
-            # Находим группы, курируемые выбранным куратором
-            curator_groups = Group.query.filter_by(curator_id=curator_id).all()
-            if curator_groups:
-                curator_group_ids = [g.id for g in curator_groups]
-                query = query.filter(Student.group_id.in_(curator_group_ids))
-        
-        # ДОБАВЛЯЕМ ФИЛЬТР ПО СТАРОСТЕ
-        if headman_id and headman_id != '':
-            # Находим группу, где выбранный пользователь является старостой
-            leader_group = Group.query.filter_by(leader_id=headman_id).first()
-            if leader_group:
-                query = query.filter_by(group_id=leader_group.id)
-        
-        # Получаем студентов
-        students = query.all()
-        
-        if not students:
-            flash('Нет студентов, соответствующих выбранным фильтрам', 'warning')
-            return redirect(url_for('dashboard.export_students_page'))
-        
         # Определяем период для фильтрации пропусков
         end_date_obj = datetime.now()
         start_date_obj = None
@@ -508,76 +752,99 @@ def export_students_post():
             else:
                 start_date_obj = end_date_obj - timedelta(days=7)
         
-        # Подготавливаем данные для экспорта
-        data = []
-        for student in students:
-            student_data = {
-                'ID': student.id,
-                'ФИО': student.full_name,
-                'Группа': student.group.name if student.group else '',
-                'Телефон': student.phone or '',
-                'Статус': 'Активен',
-                'Куратор': student.group.curator.full_name if student.group and student.group.curator else '',
-                'Староста': student.group.leader.full_name if student.group and student.group.leader else ''
-            }
-            
-            # Убираем колонку "Статус" если нужно
-            if exclude_status:
-                del student_data['Статус']
-            
-            # Добавляем статистику пропусков если нужно
+        # Строки экспорта - самая дорогая часть; файл собирается из них заново
+        def build_rows():
+            # Строим запрос для получения студентов
+            query = Student.query
+        
+            # Применяем фильтры
+            if group_id and group_id != '':
+                query = query.filter_by(group_id=group_id)
+        
+            if curator_id and curator_id != '':
+                # Находим группы, курируемые выбранным куратором
+                curator_groups = Group.query.filter_by(curator_id=curator_id).all()
+                if curator_groups:
+                    curator_group_ids = [g.id for g in curator_groups]
+                    query = query.filter(Student.group_id.in_(curator_group_ids))
+        
+            # ДОБАВЛЯЕМ ФИЛЬТР ПО СТАРОСТЕ
+            if headman_id and headman_id != '':
+                # Находим группу, где выбранный пользователь является старостой
+                leader_group = Group.query.filter_by(leader_id=headman_id).first()
+                if leader_group:
+                    query = query.filter_by(group_id=leader_group.id)
+        
+            # Получаем студентов вместе с группой, куратором и старостой
+            students = query.options(
+                db.joinedload(Student.group).joinedload(Group.curator),
+                db.joinedload(Student.group).joinedload(Group.leader)
+            ).all()
+        
+            # Пропуски выбранных студентов по причинам - один GROUP BY
+            reasons_by_student = {}
             if include_stats:
+                reasons_query = db.session.query(Absence.student_id, Absence.reason, db.func.count(Absence.id)) \
+                    .filter(Absence.student_id.in_(query.with_entities(Student.id).scalar_subquery()))
                 if start_date_obj:
-                    # Фильтрация пропусков по дате
-                    absences_query = Absence.query.filter_by(student_id=student.id)
-                    if start_date_obj:
-                        absences_query = absences_query.filter(
-                            Absence.date >= start_date_obj.date(),
-                            Absence.date <= end_date_obj.date()
-                        )
-                    total_misses = absences_query.count()
-                else:
-                    total_misses = Absence.query.filter_by(student_id=student.id).count()
+                    reasons_query = reasons_query.filter(
+                        Absence.date >= start_date_obj.date(),
+                        Absence.date <= end_date_obj.date()
+                    )
+                reasons_query = reasons_query.group_by(Absence.student_id, Absence.reason) \
+                    .order_by(Absence.student_id, Absence.reason)
+                for student_id, reason, count in reasons_query:
+                    reasons_by_student.setdefault(student_id, []).append((reason, count))
+        
+            # Подготавливаем данные для экспорта
+            data = []
+            for student in students:
+                student_data = {
+                    'ID': student.id,
+                    'ФИО': student.full_name,
+                    'Группа': student.group.name if student.group else '',
+                    'Телефон': student.phone or '',
+                    'Статус': 'Активен',
+                    'Куратор': student.group.curator.full_name if student.group and student.group.curator else '',
+                    'Староста': student.group.leader.full_name if student.group and student.group.leader else ''
+                }
+            
+                # Убираем колонку "Статус" если нужно
+                if exclude_status:
+                    del student_data['Статус']
+            
+                # Добавляем статистику пропусков если нужно
+                if include_stats:
+                    reasons = reasons_by_student.get(student.id, [])
+                    total_misses = sum(count for _, count in reasons)
                 
-                student_data['Всего пропусков'] = total_misses
+                    student_data['Всего пропусков'] = total_misses
                 
-                if include_reason and total_misses > 0:
-                    # Статистика по причинам
-                    if start_date_obj:
-                        reasons = db.session.query(Absence.reason, db.func.count(Absence.id))\
-                                            .filter_by(student_id=student.id)\
-                                            .filter(
-                                                Absence.date >= start_date_obj.date(),
-                                                Absence.date <= end_date_obj.date()
-                                            )\
-                                            .group_by(Absence.reason)\
-                                            .all()
-                    else:
-                        reasons = db.session.query(Absence.reason, db.func.count(Absence.id))\
-                                            .filter_by(student_id=student.id)\
-                                            .group_by(Absence.reason)\
-                                            .all()
-                    
-                    for reason, count in reasons:
-                        if reason:
-                            student_data[f'Пропуски ({reason})'] = count
-                        else:
-                            student_data['Пропуски без причины'] = count
+                    if include_reason and total_misses > 0:
+                        # Статистика по причинам
+                        for reason, count in reasons:
+                            if reason:
+                                student_data[f'Пропуски ({reason})'] = count
+                            else:
+                                student_data['Пропуски без причины'] = count
             
-            data.append(student_data)
+                data.append(student_data)
+            return data
+
+        cache_key = (group_id, curator_id, headman_id, period, start_date, end_date,
+                     include_stats, include_reason, exclude_status, datetime.now().date().isoformat())
+        data = cache.get_or_set('export', ('students', cache_key), build_rows,
+                                ttl=current_app.config['EXPORT_CACHE_TTL'])
+
+        if not data:
+            flash('Нет студентов, соответствующих выбранным фильтрам', 'warning')
+            return redirect(url_for('dashboard.export_students_page'))
         
         # Создаем DataFrame
         df = pd.DataFrame(data)
         
         # Логируем действие
-        audit_log = AuditLog(
-            user_id=current_user.id,
-            action='export_students_extended',
-            description=f'Экспорт студентов: {len(students)} записей в формате {export_format}',
-            ip_address=request.remote_addr
-        )
-        db.session.add(audit_log)
-        db.session.commit()
+        audit.record('export_students_extended', f'Экспорт студентов: {len(data)} записей в формате {export_format}')
         
         # Создаем файл в зависимости от формата
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -630,7 +897,7 @@ def export_students_post():
             c.drawString(50, height - 50, "Экспорт студентов")
             c.setFont("Helvetica", 10)
             c.drawString(50, height - 70, f"Дата экспорта: {datetime.now().strftime('%d.%m.%Y %H:%M')}")
-            c.drawString(50, height - 85, f"Всего записей: {len(students)}")
+            c.drawString(50, height - 85, f"Всего записей: {len(data)}")
             
             if start_date_obj:
                 c.drawString(50, height - 100, f"Период: {start_date_obj.strftime('%d.%m.%Y')} - {end_date_obj.strftime('%d.%m.%Y')}")
@@ -704,6 +971,8 @@ def export_students_post():
 
 @dashboard_bp.route('/api/export-preview')
 @login_required
+@query_budget(admin=6)
+@read_only
 def export_preview():
     """API для предварительного просмотра данных (реальные данные из БД)"""
     # Проверяем права доступа - возвращаем JSON, а не редирект
@@ -770,22 +1039,23 @@ def export_preview():
         
         # Получаем реальные данные
         total_count = query.count()
-        students = query.limit(10).all()
+        students = query.options(db.joinedload(Student.group)).limit(10).all()
+        
+        # Пропуски показанных студентов одним GROUP BY
+        absences_query = db.session.query(Absence.student_id, db.func.count(Absence.id)) \
+            .filter(Absence.student_id.in_([student.id for student in students]))
+        if start_date_obj:
+            absences_query = absences_query.filter(
+                Absence.date >= start_date_obj.date(),
+                Absence.date <= end_date_obj.date()
+            )
+        absences_by_student = dict(absences_query.group_by(Absence.student_id).all())
         
         preview_data = []
         total_absences = 0
         
         for student in students:
-            # Считаем пропуски
-            absences_query = Absence.query.filter_by(student_id=student.id)
-            
-            if start_date_obj:
-                absences_query = absences_query.filter(
-                    Absence.date >= start_date_obj.date(),
-                    Absence.date <= end_date_obj.date()
-                )
-            
-            absences_count = absences_query.count()
+            absences_count = absences_by_student.get(student.id, 0)
             total_absences += absences_count
             
             preview_data.append({
@@ -835,49 +1105,53 @@ def export_preview():
 
 @dashboard_bp.route('/export_students')
 @login_required
+@limit_concurrency('export')
+@track_job('export_students')
+@query_budget(admin=2)
+@read_only
 def export_students():
     """Простой экспорт списка студентов в CSV (старый вариант)"""
     if current_user.role != 'admin':
         flash('Доступ запрещён', 'danger')
         return redirect(url_for('dashboard.index'))
     
-    students = Student.query.all()
-    
-    # Создаем CSV в памяти
-    output = io.StringIO()
-    writer = csv.writer(output, delimiter=';')
-    
-    # Заголовки
-    writer.writerow(['ID', 'ФИО', 'Группа', 'Телефон', 'Куратор', 'Староста'])
-    
-    # Данные
-    for student in students:
-        group_name = student.group.name if student.group else ''
-        curator_name = student.group.curator.full_name if student.group and student.group.curator else ''
-        leader_name = student.group.leader.full_name if student.group and student.group.leader else ''
+    def build_csv():
+        students = Student.query.options(
+            db.joinedload(Student.group).joinedload(Group.curator),
+            db.joinedload(Student.group).joinedload(Group.leader)
+        ).all()
+        
+        # Создаем CSV в памяти
+        output = io.StringIO()
+        writer = csv.writer(output, delimiter=';')
         
-        writer.writerow([
-            student.id,
-            student.full_name,
-            group_name,
-            student.phone or '',
-            curator_name,
-            leader_name
-        ])
+        # Заголовки
+        writer.writerow(['ID', 'ФИО', 'Группа', 'Телефон', 'Куратор', 'Староста'])
+        
+        # Данные
+        for student in students:
+            group_name = student.group.name if student.group else ''
+            curator_name = student.group.curator.full_name if student.group and student.group.curator else ''
+            leader_name = student.group.leader.full_name if student.group and student.group.leader else ''
+            
+            writer.writerow([
+                student.id,
+                student.full_name,
+                group_name,
+                student.phone or '',
+                curator_name,
+                leader_name
+            ])
+        return len(students), output.getvalue().encode('utf-8-sig')
+    
+    # Готовый файл из общего кэша, пока студенты и группы не менялись
+    count, content = cache.get_or_set('export', 'students_csv', build_csv, ttl=current_app.config['EXPORT_CACHE_TTL'])
     
     # Логируем действие
-    audit_log = AuditLog(
-        user_id=current_user.id,
-        action='export_students',
-        description=f'Экспорт списка студентов ({len(students)} записей)',
-        ip_address=request.remote_addr
-    )
-    db.session.add(audit_log)
-    db.session.commit()
+    audit.record('export_students', f'Экспорт списка студентов ({count} записей)')
     
-    output.seek(0)
     return send_file(
-        io.BytesIO(output.getvalue().encode('utf-8-sig')),
+        io.BytesIO(content),
         mimetype='text/csv',
         as_attachment=True,
         download_name=f'students_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
@@ -889,6 +1163,10 @@ def export_students():
 
 @dashboard_bp.route('/export-users')
 @login_required
+@limit_concurrency('export')
+@track_job('export_users')
+@query_budget(admin=4)
+@read_only
 def export_users_route():
     """Экспорт списка кураторов и старост"""
     if current_user.role != 'admin':
@@ -899,17 +1177,24 @@ def export_users_route():
         # Получаем всех кураторов и старостов
         users = User.query.filter(User.role.in_(['curator', 'leader'])).all()
         
+        # Группы кураторов и старост одним запросом
+        curator_groups = {}
+        leader_groups = {}
+        for group in Group.query.order_by(Group.id):
+            if group.curator_id:
+                curator_groups.setdefault(group.curator_id, []).append(group.name)
+            if group.leader_id:
+                leader_groups.setdefault(group.leader_id, group.name)
+        
         # Подготавливаем данные
         data = []
         for user in users:
             # Получаем информацию о группах
             groups_info = []
             if user.role == 'curator':
-                groups = Group.query.filter_by(curator_id=user.id).all()
-                groups_info = [g.name for g in groups]
+                groups_info = curator_groups.get(user.id, [])
             elif user.role == 'leader':
-                group = Group.query.filter_by(leader_id=user.id).first()
-                groups_info = [group.name] if group else []
+                groups_info = [leader_groups[user.id]] if user.id in leader_groups else []
             
             data.append({
                 'ID': user.id,
@@ -917,7 +1202,7 @@ def export_users_route():
                 'Роль': 'Куратор' if user.role == 'curator' else 'Староста',
                 'Телефон': user.phone or '',
                 'Telegram': user.telegram or '',
-                'Email': user.email or '',
+                'Email': getattr(user, 'email', None) or '',
                 'Группы': ', '.join(groups_info),
                 'Статус': 'Подтверждён' if user.is_confirmed else ('Отклонён' if user.is_rejected else 'Ожидает'),
                 'Дата регистрации': user.created_at.strftime('%d.%m.%Y %H:%M') if user.created_at else '',
@@ -942,14 +1227,7 @@ def export_users_route():
         output.seek(0)
         
         # Логируем действие
-        audit_log = AuditLog(
-            user_id=current_user.id,
-            action='export_users',
-            description=f'Экспорт кураторов и старостов ({len(users)} записей)',
-            ip_address=request.remote_addr
-        )
-        db.session.add(audit_log)
-        db.session.commit()
+        audit.record('export_users', f'Экспорт кураторов и старостов ({len(users)} записей)')
         
         filename = f'users_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
         return send_file(output,
@@ -968,6 +1246,8 @@ def export_users_route():
 
 @dashboard_bp.route('/import_students', methods=['GET', 'POST'])
 @login_required
+@limit_concurrency('import', methods=('POST',))
+@track_job('import_students', methods=('POST',))
 def import_students():
     """Импорт студентов из файла"""
     if current_user.role != 'admin':
@@ -1029,14 +1309,7 @@ def import_students():
             db.session.commit()
             
             # Логируем действие
-            audit_log = AuditLog(
-                user_id=current_user.id,
-                action='import_students',
-                description=f'Импортировано {imported_count} студентов',
-                ip_address=request.remote_addr
-            )
-            db.session.add(audit_log)
-            db.session.commit()
+            audit.record('import_students', f'Импортировано {imported_count} студентов')
             
             if errors:
                 flash(f'Импортировано {imported_count} студентов. Ошибок: {len(errors)}', 'warning')
@@ -1057,6 +1330,8 @@ def import_students():
 
 @dashboard_bp.route('/import-users', methods=['GET', 'POST'])
 @login_required
+@limit_concurrency('import', methods=('POST',))
+@track_job('import_users', methods=('POST',))
 def import_users_route():
     """Импорт кураторов и старостов из файла"""
     if current_user.role != 'admin':
@@ -1160,14 +1435,7 @@ def import_users_route():
             db.session.commit()
             
             # Логируем действие
-            audit_log = AuditLog(
-                user_id=current_user.id,
-                action='import_users',
-                description=f'Импортировано {imported_count} пользователей',
-                ip_address=request.remote_addr
-            )
-            db.session.add(audit_log)
-            db.session.commit()
+            audit.record('import_users', f'Импортировано {imported_count} пользователей')
             
             if errors:
                 flash(f'Импортировано {imported_count} пользователей. Ошибок: {len(errors)}', 'warning')
@@ -1188,6 +1456,7 @@ def import_users_route():
 
 @dashboard_bp.route('/users-list')
 @login_required
+@query_budget(admin=3)
 def users_list():
     """Список всех кураторов и старост с группировкой по группам"""
     if current_user.role != 'admin':
@@ -1195,7 +1464,16 @@ def users_list():
         return redirect(url_for('dashboard.index'))
     
     # Получаем все группы с кураторами и старостами
-    groups = Group.query.order_by(Group.name).all()
+    groups = Group.query.options(
+        db.joinedload(Group.curator),
+        db.joinedload(Group.leader)
+    ).order_by(Group.name).all()
+    
+    # Группы каждого куратора из уже загруженного списка
+    groups_by_curator = {}
+    for group in groups:
+        if group.curator_id:
+            groups_by_curator.setdefault(group.curator_id, []).append(group.name)
     
     # Собираем данные в удобном формате для отображения
     grouped_data = {}
@@ -1205,9 +1483,9 @@ def users_list():
         curator = group.curator
         curator_groups = []
         
-        # Если есть куратор, получаем все его группы
+        # Если есть куратор, берём все его группы
         if curator:
-            curator_groups = [g.name for g in curator.get_curator_groups()] if hasattr(curator, 'get_curator_groups') else []
+            curator_groups = groups_by_curator.get(curator.id, [])
         
         # Получаем старосту группы
         leader = group.leader
@@ -1261,6 +1539,7 @@ def manage_students():
 
 @dashboard_bp.route('/system-stats')
 @login_required
+@read_only
 def system_stats():
     """Статистика системы"""
     if current_user.role != 'admin':
@@ -1293,9 +1572,10 @@ def system_stats():
     # Статистика по группам
     groups_stats = []
     groups = Group.query.all()
+    group_absences = count_group_absences()
     for group in groups:
         student_count = Student.query.filter_by(group_id=group.id).count()
-        absence_count = Absence.query.join(Student).filter(Student.group_id == group.id).count()
+        absence_count = group_absences.get(group.id, 0)
         groups_stats.append({
             'name': group.name,
             'student_count': student_count,
@@ -1372,14 +1652,7 @@ def add_student():
             db.session.commit()
             
             # Логируем действие
-            audit_log = AuditLog(
-                user_id=current_user.id,
-                action='add_student',
-                description=f'Добавлен студент: {full_name}',
-                ip_address=request.remote_addr
-            )
-            db.session.add(audit_log)
-            db.session.commit()
+            audit.record('add_student', f'Добавлен студент: {full_name}')
             
             flash(f'Студент {full_name} успешно добавлен', 'success')
             return redirect(url_for('dashboard.students'))
@@ -1426,14 +1699,7 @@ def edit_student(student_id):
             db.session.commit()
             
             # Логируем действие
-            audit_log = AuditLog(
-                user_id=current_user.id,
-                action='edit_student',
-                description=f'Изменён студент: {student.full_name} (ID: {student_id})',
-                ip_address=request.remote_addr
-            )
-            db.session.add(audit_log)
-            db.session.commit()
+            audit.record('edit_student', f'Изменён студент: {student.full_name} (ID: {student_id})')
             
             flash('Студент успешно обновлён', 'success')
             return redirect(url_for('dashboard.students'))
@@ -1471,14 +1737,7 @@ def delete_student(student_id):
         db.session.commit()
         
         # Логируем действие
-        audit_log = AuditLog(
-            user_id=current_user.id,
-            action='delete_student',
-            description=f'Удалён студент: {student_name} (ID: {student_id})',
-            ip_address=request.remote_addr
-        )
-        db.session.add(audit_log)
-        db.session.commit()
+        audit.record('delete_student', f'Удалён студент: {student_name} (ID: {student_id})')
         
         flash(f'Студент {student_name} успешно удалён', 'success')
         
@@ -1490,6 +1749,8 @@ def delete_student(student_id):
 
 @dashboard_bp.route('/upload_students', methods=['GET', 'POST'])
 @login_required
+@limit_concurrency('import', methods=('POST',))
+@track_job('upload_students', methods=('POST',))
 def upload_students():
     if current_user.role not in ['admin', 'curator']:
         flash('Доступ запрещён', 'danger')
@@ -1560,14 +1821,7 @@ def upload_students():
             db.session.commit()
             
             # Логируем действие
-            audit_log = AuditLog(
-                user_id=current_user.id,
-                action='upload_students',
-                description=f'Импортировано {added_count} студентов в группу ID: {group_id}',
-                ip_address=request.remote_addr
-            )
-            db.session.add(audit_log)
-            db.session.commit()
+            audit.record('upload_students', f'Импортировано {added_count} студентов в группу ID: {group_id}')
             
             if errors:
                 flash(f'Добавлено {added_count} студентов. Ошибок: {len(errors)}', 'warning')
@@ -1604,7 +1858,7 @@ def add_group():
         flash('Доступ запрещён', 'danger')
         return redirect(url_for('dashboard.index'))
     
-    curators = User.query.filter_by(role='curator', is_confirmed=True).all()
+    curators = reference_cache.curators()
     
     if request.method == 'POST':
         name = request.form.get('name')
@@ -1630,14 +1884,7 @@ def add_group():
             db.session.commit()
             
             # Логируем действие
-            audit_log = AuditLog(
-                user_id=current_user.id,
-                action='add_group',
-                description=f'Добавлена группа: {name}',
-                ip_address=request.remote_addr
-            )
-            db.session.add(audit_log)
-            db.session.commit()
+            audit.record('add_group', f'Добавлена группа: {name}')
             
             flash(f'Группа {name} успешно добавлена', 'success')
             return redirect(url_for('dashboard.groups_list'))
@@ -1656,7 +1903,7 @@ def edit_group(group_id):
         return redirect(url_for('dashboard.index'))
     
     group = Group.query.get_or_404(group_id)
-    curators = User.query.filter_by(role='curator', is_confirmed=True).all()
+    curators = reference_cache.curators()
     
     if request.method == 'POST':
         name = request.form.get('name')
@@ -1675,14 +1922,7 @@ def edit_group(group_id):
             db.session.commit()
             
             # Логируем действие
-            audit_log = AuditLog(
-                user_id=current_user.id,
-                action='edit_group',
-                description=f'Изменена группа: {group.name} (ID: {group_id})',
-                ip_address=request.remote_addr
-            )
-            db.session.add(audit_log)
-            db.session.commit()
+            audit.record('edit_group', f'Изменена группа: {group.name} (ID: {group_id})')
             
             flash('Группа успешно обновлена', 'success')
             return redirect(url_for('dashboard.groups_list'))
@@ -1711,14 +1951,7 @@ def delete_group(group_id):
         db.session.commit()
         
         # Логируем действие
-        audit_log = AuditLog(
-            user_id=current_user.id,
-            action='delete_group',
-            description=f'Удалена группа: {group_name} (ID: {group_id})',
-            ip_address=request.remote_addr
-        )
-        db.session.add(audit_log)
-        db.session.commit()
+        audit.record('delete_group', f'Удалена группа: {group_name} (ID: {group_id})')
         
         flash(f'Группа {group_name} успешно удалена', 'success')
         
@@ -1754,43 +1987,41 @@ def add_absence():
         student_id = request.form.get('student_id')
         date_str = request.form.get('date')
         reason = request.form.get('reason')
-        lessons_count = request.form.get('lessons_count', 1)
+        lessons_count = request.form.get('lessons_count') or 1
         
         if not student_id or not date_str:
             flash('Заполните обязательные поля', 'danger')
             return redirect(url_for('dashboard.add_absence'))
         
+        try:
+            lessons_count = int(lessons_count)
+        except ValueError:
+            lessons_count = 0
+        if not 1 <= lessons_count <= MAX_LESSONS_PER_DAY:
+            flash(f'Количество занятий должно быть от 1 до {MAX_LESSONS_PER_DAY}', 'danger')
+            return redirect(url_for('dashboard.add_absence'))
+        
         try:
             date = datetime.strptime(date_str, '%Y-%m-%dT%H:%M') if 'T' in date_str else datetime.strptime(date_str, '%Y-%m-%d')
             
             # Проверяем, принадлежит ли студент доступным пользователю
-            student = Student.query.get(int(student_id))
-            user_students = get_user_students(current_user)
-            student_ids = [s.id for s in user_students]
+            student_ids = {s.id for s in students}
             
-            if student.id not in student_ids:
+            if int(student_id) not in student_ids:
                 flash('Нет прав для добавления пропуска этому студенту', 'danger')
                 return redirect(url_for('dashboard.add_absence'))
             
-            new_absence = Absence(
-                student_id=int(student_id),
-                date=date,
-                reason=reason,
-                lessons_count=int(lessons_count)
-            )
-            
-            db.session.add(new_absence)
+            # Повторный пропуск за тот же день суммируется с существующим
+            upsert_absences([{
+                'student_id': int(student_id),
+                'date': date.date(),
+                'reason': reason or None,
+                'lessons_count': lessons_count
+            }])
             db.session.commit()
             
             # Логируем действие
-            audit_log = AuditLog(
-                user_id=current_user.id,
-                action='add_absence',
-                description=f'Добавлен пропуск для студента ID: {student_id} на {date_str}',
-                ip_address=request.remote_addr
-            )
-            db.session.add(audit_log)
-            db.session.commit()
+            audit.record('add_absence', f'Добавлен пропуск для студента ID: {student_id} на {date_str}')
             
             flash('Пропуск успешно добавлен', 'success')
             return redirect(url_for('dashboard.absences_list'))
@@ -1844,21 +2075,14 @@ def edit_absence(absence_id):
                 return redirect(url_for('dashboard.edit_absence', absence_id=absence_id))
             
             absence.student_id = int(student_id)
-            absence.date = date
+            absence.date = date.date()
             absence.reason = reason
             absence.lessons_count = int(lessons_count)
             
             db.session.commit()
             
             # Логируем действие
-            audit_log = AuditLog(
-                user_id=current_user.id,
-                action='edit_absence',
-                description=f'Отредактирован пропуск ID: {absence_id}',
-                ip_address=request.remote_addr
-            )
-            db.session.add(audit_log)
-            db.session.commit()
+            audit.record('edit_absence', f'Отредактирован пропуск ID: {absence_id}')
             
             flash('Пропуск успешно обновлён', 'success')
             return redirect(url_for('dashboard.absences_list'))
@@ -1897,14 +2121,7 @@ def delete_absence(absence_id):
         db.session.commit()
         
         # Логируем действие
-        audit_log = AuditLog(
-            user_id=current_user.id,
-            action='delete_absence',
-            description=f'Удалён пропуск ID: {absence_id}',
-            ip_address=request.remote_addr
-        )
-        db.session.add(audit_log)
-        db.session.commit()
+        audit.record('delete_absence', f'Удалён пропуск ID: {absence_id}')
         
         flash('Пропуск успешно удалён', 'success')
         
@@ -1914,44 +2131,220 @@ def delete_absence(absence_id):
     
     return redirect(url_for('dashboard.absences_list'))
 
+# =============================================
+# ПЕРЕКЛИЧКА (МАССОВЫЙ ВВОД ПРОПУСКОВ)
+# =============================================
+
+def parse_roll_call_date(date_str):
+    """Разбирает дату переклички (YYYY-MM-DD), по умолчанию сегодня"""
+    if not date_str:
+        return datetime.now().date()
+    return datetime.strptime(date_str[:10], '%Y-%m-%d').date()
+
+def apply_roll_call(group, date, entries):
+    """Применяет перекличку группы за день одним набором bulk-операций.
+
+    entries - словарь {student_id: {'reason': ..., 'lessons_count': ...}}
+    с полным списком отсутствующих. Пропуски, которых нет в entries,
+    удаляются. Возвращает (added, updated, deleted). Коммит не выполняется.
+    """
+    student_ids = {
+        sid for (sid,) in db.session.query(Student.id).filter(Student.group_id == group.id)
+    }
+    unknown = set(entries) - student_ids
+    if unknown:
+        raise ValueError(f'Студенты не относятся к группе {group.name}: {sorted(unknown)}')
+
+    existing = Absence.query.join(Student).filter(
+        Student.group_id == group.id,
+        Absence.date == date
+    ).order_by(Absence.id).all()
+
+    kept = {}
+    to_delete = []
+    for absence in existing:
+        if absence.student_id in entries and absence.student_id not in kept:
+            kept[absence.student_id] = absence
+        else:
+            # Студент больше не отмечен или это дубль записи за тот же день
+            to_delete.append(absence.id)
+
+    to_insert = []
+    to_update = []
+    for student_id, entry in entries.items():
+        reason = entry.get('reason') or None
+        lessons_count = entry.get('lessons_count')
+        lessons_count = 1 if lessons_count in (None, '') else int(lessons_count)
+        if not 1 <= lessons_count <= MAX_LESSONS_PER_DAY:
+            raise ValueError(f'Количество занятий должно быть от 1 до {MAX_LESSONS_PER_DAY}: '
+                             f'студент {student_id}, указано {lessons_count}')
+        absence = kept.get(student_id)
+        if absence is None:
+            to_insert.append({
+                'student_id': student_id,
+                'date': date,
+                'reason': reason,
+                'lessons_count': lessons_count
+            })
+        elif absence.reason != reason or absence.lessons_count != lessons_count:
+            to_update.append({
+                'id': absence.id,
+                'reason': reason,
+                'lessons_count': lessons_count
+            })
+
+    # Все операции касаются только студентов группы: хранилище аналитики
+    # перечитает их, а не всю таблицу
+    with absence_store.scoped_to(db.session, student_ids):
+        if to_insert:
+            upsert_absences(to_insert, merge=False)
+        if to_update:
+            db.session.execute(db.update(Absence), to_update)
+        if to_delete:
+            db.session.execute(
+                db.delete(Absence).where(Absence.id.in_(to_delete)),
+                execution_options={'synchronize_session': False}
+            )
+
+    return len(to_insert), len(to_update), len(to_delete)
+
+def log_roll_call(group, date, counts):
+    """Записывает в журнал одно событие о перекличке"""
+    added, updated, deleted = counts
+    audit.record('roll_call',
+                 f'Перекличка группы {group.name} на {date.strftime("%d.%m.%Y")}: '
+                 f'добавлено {added}, изменено {updated}, удалено {deleted}')
+
+@dashboard_bp.route('/absences/roll-call', methods=['GET', 'POST'])
+@login_required
+def roll_call():
+    """Сетка переклички: все студенты группы за один день"""
+    groups = get_user_groups(current_user)
+    if not groups:
+        flash('Нет доступных групп для переклички', 'warning')
+        return redirect(url_for('dashboard.absences_list'))
+
+    groups_by_id = {g.id: g for g in groups}
+    group_id = request.values.get('group_id', type=int) or groups[0].id
+    group = groups_by_id.get(group_id)
+    if not group:
+        flash('Выбранная группа недоступна', 'danger')
+        return redirect(url_for('dashboard.roll_call'))
+
+    try:
+        date = parse_roll_call_date(request.values.get('date'))
+    except ValueError:
+        flash('Неверный формат даты', 'danger')
+        return redirect(url_for('dashboard.roll_call', group_id=group.id))
+
+    if request.method == 'POST':
+        back = url_for('dashboard.roll_call', group_id=group.id, date=date.strftime('%Y-%m-%d'))
+        entries = {}
+        try:
+            for student_id in request.form.getlist('absent'):
+                entries[int(student_id)] = {
+                    'reason': request.form.get(f'reason_{student_id}', '').strip(),
+                    'lessons_count': request.form.get(f'lessons_{student_id}', 1)
+                }
+        except ValueError:
+            flash('Неверный идентификатор студента', 'danger')
+            return redirect(back)
+
+        try:
+            counts = apply_roll_call(group, date, entries)
+            db.session.commit()
+            log_roll_call(group, date, counts)
+            flash(f'Перекличка сохранена: добавлено {counts[0]}, '
+                  f'изменено {counts[1]}, удалено {counts[2]}', 'success')
+        except ValueError as e:
+            db.session.rollback()
+            flash(f'Перекличка не сохранена: {e}', 'danger')
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Ошибка при сохранении переклички: {str(e)}', 'danger')
+
+        return redirect(back)
+
+    students = Student.query.filter_by(group_id=group.id).order_by(Student.full_name).all()
+    absences = Absence.query.join(Student).filter(
+        Student.group_id == group.id,
+        Absence.date == date
+    ).all()
+    absences_by_student = {}
+    for absence in absences:
+        absences_by_student.setdefault(absence.student_id, absence)
+
+    return render_template('roll_call.html',
+                         groups=groups,
+                         group=group,
+                         date=date,
+                         students=students,
+                         absences=absences_by_student,
+                         max_lessons=MAX_LESSONS_PER_DAY)
+
+@dashboard_bp.route('/api/roll-call', methods=['POST'])
+@login_required
+def api_roll_call():
+    """API переклички: {"group_id", "date", "absences": [{"student_id", "reason", "lessons_count"}]}"""
+    payload = request.get_json(silent=True) or {}
+    group_id = payload.get('group_id')
+
+    if not group_id:
+        return jsonify({'error': 'group_id is required'}), 400
+    try:
+        group_id = int(group_id)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'group_id must be an integer'}), 400
+
+    group = next((g for g in get_user_groups(current_user) if g.id == group_id), None)
+    if not group:
+        return jsonify({'error': 'Group not found'}), 404
+
+    try:
+        date = parse_roll_call_date(payload.get('date'))
+        entries = {}
+        for item in payload.get('absences', []):
+            entries[int(item['student_id'])] = item
+        counts = apply_roll_call(group, date, entries)
+        db.session.commit()
+        log_roll_call(group, date, counts)
+    except (KeyError, TypeError, ValueError) as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+    return jsonify({
+        'group_id': group.id,
+        'date': date.strftime('%Y-%m-%d'),
+        'added': counts[0],
+        'updated': counts[1],
+        'deleted': counts[2]
+    })
+
 # =============================================
 # АНАЛИТИКА
 # =============================================
 
 @dashboard_bp.route('/student_analytics')
 @login_required
+@query_budget(admin=4, curator=5, leader=5)
+@read_only
 def student_analytics():
-    # Получаем данные в зависимости от роли
-    students_data = get_user_students(current_user)
-    
     # Получаем кураторов и старост
     if current_user.role == 'admin':
-        curators = User.query.filter_by(role='curator', is_confirmed=True).all()
-        leaders = User.query.filter_by(role='leader', is_confirmed=True).all()
+        curators = reference_cache.curators()
+        leaders = reference_cache.leaders()
     elif current_user.role == 'curator':
         curators = [current_user]
-        leaders = User.query.filter_by(role='leader', is_confirmed=True).all()
+        leaders = reference_cache.leaders()
     else:  # leader
-        curators = User.query.filter_by(role='curator', is_confirmed=True).all()
+        curators = reference_cache.curators()
         leaders = [current_user]
     
-    # Собираем статистику
-    student_stats = []
-    for student in students_data:
-        absences = Absence.query.filter_by(student_id=student.id).all()
-        total_absences = len(absences)
-        excused = sum(1 for a in absences if a.reason and a.reason.lower() in ['болезнь', 'справка', 'уважительная', 'по болезни', 'мед. справка'])
-        unexcused = total_absences - excused
-        
-        student_stats.append({
-            'student_name': student.full_name,
-            'group_name': student.group.name if student.group else '-',
-            'curator_name': student.group.curator.full_name if student.group and student.group.curator else '-',
-            'leader_name': student.group.leader.full_name if student.group and student.group.leader else '-',
-            'total_absences': total_absences,
-            'excused': excused,
-            'unexcused': unexcused
-        })
+    # Собираем статистику по доступным студентам
+    student_stats = student_analytics_rows(current_user)
     
     return render_template('student_analytics.html', 
                          student_data=student_stats,
@@ -1961,6 +2354,8 @@ def student_analytics():
 
 @dashboard_bp.route('/group_analytics', methods=['GET', 'POST'])
 @login_required
+@query_budget(admin=6, curator=6, leader=6)
+@read_only
 def group_analytics():
     # Получаем доступные группы в зависимости от роли
     groups = get_user_groups(current_user)
@@ -1990,20 +2385,14 @@ def group_analytics():
                     
                     # Получаем всех студентов группы
                     students = Student.query.filter_by(group_id=selected_group.id).all()
+                    totals = count_student_absences([s.id for s in students], start, end)
                     
                     total_excused = 0
                     total_unexcused = 0
                     
                     for student in students:
                         # Пропуски студента за период
-                        absences = Absence.query.filter(
-                            Absence.student_id == student.id,
-                            Absence.date >= start,
-                            Absence.date <= end
-                        ).all()
-                        
-                        total = len(absences)
-                        excused = sum(1 for a in absences if a.reason and a.reason.lower() in ['болезнь', 'справка', 'уважительная', 'по болезни', 'мед. справка'])
+                        total, excused = totals.get(student.id, (0, 0))
                         unexcused = total - excused
                         
                         if total > 0:  # Добавляем только студентов с пропусками
@@ -2072,14 +2461,7 @@ def settings():
             db.session.commit()
             
             # Логируем действие
-            audit_log = AuditLog(
-                user_id=current_user.id,
-                action='update_settings',
-                description='Обновлены настройки профиля',
-                ip_address=request.remote_addr
-            )
-            db.session.add(audit_log)
-            db.session.commit()
+            audit.record('update_settings', 'Обновлены настройки профиля')
             
             flash('Настройки профиля обновлены', 'success')
             return redirect(url_for('dashboard.settings'))
@@ -2098,74 +2480,49 @@ def settings():
 
 @dashboard_bp.route('/api/student-analytics')
 @login_required
+@query_budget(admin=3, curator=4, leader=4)
+@read_only
 def api_student_analytics():
     # Получаем параметры фильтрации
     student_name = request.args.get('student_name', '').strip()
     group_name = request.args.get('group_name', '').strip()
     curator_id = request.args.get('curator_id')
     leader_id = request.args.get('leader_id')
-    
-    # Начинаем запрос с доступных пользователю студентов
-    students = get_user_students(current_user)
-    
-    # Применяем фильтры
-    filtered_students = []
-    for student in students:
-        include = True
-        
-        if student_name and student_name.lower() not in student.full_name.lower():
-            include = False
-        
-        if group_name and (not student.group or group_name.lower() not in student.group.name.lower()):
-            include = False
-        
-        if curator_id and (not student.group or str(student.group.curator_id) != curator_id):
-            include = False
-        
-        if leader_id and (not student.group or str(student.group.leader_id) != leader_id):
-            include = False
-        
-        if include:
-            filtered_students.append(student)
-    
-    # Собираем статистику
-    result = []
-    for student in filtered_students:
-        absences = Absence.query.filter_by(student_id=student.id).all()
-        total = len(absences)
-        excused = sum(1 for a in absences if a.reason and a.reason.lower() in ['болезнь', 'справка', 'уважительная', 'по болезни', 'мед. справка'])
-        unexcused = total - excused
-    
-        result.append({
-            'student_name': student.full_name,
-            'group_name': student.group.name if student.group else '-',
-            'curator_name': student.group.curator.full_name if student.group and student.group.curator else '-',
-            'leader_name': student.group.leader.full_name if student.group and student.group.leader else '-',
-            'total_absences': total,
-            'excused': excused,
-            'unexcused': unexcused
-        })
-    
+    # Сортировка: sort - имя поля ответа, order=desc - по убыванию
+    sort = request.args.get('sort')
+    descending = request.args.get('order') == 'desc'
+    
+    # Ответ зависит от роли (набор доступных студентов) и фильтров
+    cache_key = (current_user.role, None if current_user.role == 'admin' else current_user.id,
+                 student_name, group_name, curator_id, leader_id, sort, descending)
+    result = cache.get_or_set('analytics', ('students', cache_key),
+                              lambda: student_analytics_rows(current_user, student_name, group_name,
+                                                             curator_id, leader_id, sort, descending),
+                              ttl=current_app.config['ANALYTICS_CACHE_TTL'])
     return jsonify(result)
 
 @dashboard_bp.route('/api/group-analytics')
 @login_required
+@query_budget(admin=3, curator=3, leader=3)
+@read_only
 def api_group_analytics():
     period = request.args.get('period', 'week')
-    group_id = request.args.get('group_id')
+    # Ключ кэша строится из числа: "1", "01" и " 1" - одна группа
+    group_id = request.args.get('group_id', type=int)
     
-    if not group_id:
-        return jsonify({'error': 'group_id is required'}), 400
+    if group_id is None:
+        return jsonify({'error': 'group_id is required and must be an integer'}), 400
     
     try:
-        # Получаем группу
-        group = Group.query.get(group_id)
-        if not group:
-            return jsonify({'error': 'Group not found'}), 404
-        
         # Определяем период
         end_date = datetime.now().date()
-        if period == 'week':
+        if period == 'custom':
+            # Произвольный диапазон: start_date и end_date в формате YYYY-MM-DD
+            try:
+                start_date, end_date = parse_series_range(request.args.get('start_date'), request.args.get('end_date'))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+        elif period == 'week':
             start_date = end_date - timedelta(days=7)
         elif period == 'month':
             start_date = end_date - timedelta(days=30)
@@ -2176,43 +2533,133 @@ def api_group_analytics():
         else:
             start_date = end_date - timedelta(days=7)
         
-        # Получаем статистику
-        absences = Absence.query.join(Student).filter(
-            Student.group_id == group_id,
-            Absence.date >= start_date,
-            Absence.date <= end_date
-        ).all()
-        
-        total = len(absences)
-        excused = sum(1 for a in absences if a.reason and a.reason.lower() in ['болезнь', 'справка', 'уважительная', 'по болезни', 'мед. справка'])
-        unexcused = total - excused
-        
-        # Статистика по дням
-        daily_stats = {}
-        for absence in absences:
-            date_str = absence.date.strftime('%Y-%m-%d')
-            if date_str not in daily_stats:
-                daily_stats[date_str] = 0
-            daily_stats[date_str] += 1
-        
-        return jsonify({
-            'total': total,
-            'excused': excused,
-            'unexcused': unexcused,
-            'daily_stats': daily_stats,
-            'start_date': start_date.strftime('%Y-%m-%d'),
-            'end_date': end_date.strftime('%Y-%m-%d')
-        })
+        payload = cache.get_or_set('analytics', ('group', group_id, start_date.isoformat(), end_date.isoformat()),
+                                   lambda: build_group_analytics(group_id, start_date, end_date),
+                                   ttl=current_app.config['ANALYTICS_CACHE_TTL'])
+        if payload is None:
+            return jsonify({'error': 'Group not found'}), 404
+        return jsonify(payload)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@dashboard_bp.route('/api/attendance-series')
+@login_required
+@query_budget(admin=2, curator=3, leader=3)
+@read_only
+def api_attendance_series():
+    """Пропуски и занятия по дням, неделям, месяцам или семестрам
+
+    scope - all, group, student, curator или cmk; id - идентификатор
+    объекта; bucket - day, week, month или term; start_date и end_date
+    (YYYY-MM-DD) - диапазон, по умолчанию с начала учебного года.
+    """
+    scope = request.args.get('scope', 'group')
+    bucket = request.args.get('bucket', 'day')
+    scope_id = request.args.get('id', type=int)
+
+    if scope not in SERIES_SCOPES:
+        return jsonify({'error': f"scope must be one of: {', '.join(SERIES_SCOPES)}"}), 400
+    if bucket not in SERIES_BUCKETS:
+        return jsonify({'error': f"bucket must be one of: {', '.join(SERIES_BUCKETS)}"}), 400
+    if scope != 'all' and scope_id is None:
+        return jsonify({'error': 'id is required'}), 400
+
+    try:
+        start_date, end_date = parse_series_range(request.args.get('start_date'), request.args.get('end_date'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    max_points = current_app.config['TIMESERIES_MAX_POINTS']
+    if count_buckets(start_date, end_date, bucket) > max_points:
+        return jsonify({'error': f'Too many points (max {max_points}): use a larger bucket or a shorter range'}), 400
+
+    if not can_view_series(current_user, scope, scope_id):
+        return jsonify({'error': 'Доступ запрещён'}), 403
+
+    def load():
+        series = attendance_series(scope, scope_id, start_date, end_date, bucket, EXCUSED_REASONS)
+        return {
+            'scope': scope,
+            'id': scope_id,
+            'bucket': bucket,
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'points': [dict(point._asdict(), start=point.start.isoformat()) for point in series],
+            'totals': {
+                'absences': sum(point.absences for point in series),
+                'lessons': sum(point.lessons for point in series),
+                'excused': sum(point.excused for point in series),
+                'unexcused': sum(point.unexcused for point in series),
+            }
+        }
+
+    payload = cache.get_or_set('analytics', ('series', scope, scope_id, bucket, start_date.isoformat(),
+                                             end_date.isoformat()),
+                               load, ttl=current_app.config['ANALYTICS_CACHE_TTL'])
+    return jsonify(payload)
+
+def parse_series_range(start, end):
+    """Диапазон дат из параметров; по умолчанию - с 1 сентября текущего учебного года по сегодня"""
+    try:
+        end_date = datetime.strptime(end, '%Y-%m-%d').date() if end else datetime.now().date()
+        start_date = datetime.strptime(start, '%Y-%m-%d').date() if start else None
+    except ValueError:
+        raise ValueError('Dates must be in YYYY-MM-DD format')
+    if start_date is None:
+        start_date = bucket_floor(end_date, 'term')
+        if start_date.month == 2:
+            start_date = start_date.replace(year=start_date.year - 1, month=9)
+    if start_date > end_date:
+        raise ValueError('start_date must not be after end_date')
+    return start_date, end_date
+
+def can_view_series(user, scope, scope_id):
+    """Администратор видит всё, куратор - свои группы, староста - свою группу"""
+    if user.role == 'admin':
+        return True
+    if scope == 'curator':
+        return user.role == 'curator' and scope_id == user.id
+    if scope not in ('group', 'student'):
+        return False
+
+    owner = Group.curator_id if user.role == 'curator' else Group.leader_id
+    if scope == 'group':
+        query = db.session.query(Group.id).filter(Group.id == scope_id)
+    else:
+        query = db.session.query(Student.id).join(Group, Group.id == Student.group_id).filter(Student.id == scope_id)
+    return query.filter(owner == user.id).first() is not None
+
+def build_group_analytics(group_id, start_date, end_date):
+    """Данные /api/group-analytics; None, если группы нет"""
+    # Получаем группу
+    group = Group.query.get(group_id)
+    if not group:
+        return None
+    
+    # Статистика по дням: GROUP BY в SQL, дни без пропусков - нули
+    series = attendance_series('group', group.id, start_date, end_date, 'day', EXCUSED_REASONS)
+    total = sum(point.absences for point in series)
+    excused = sum(point.excused for point in series)
+    
+    return {
+        'total': total,
+        'excused': excused,
+        'unexcused': total - excused,
+        'lessons': sum(point.lessons for point in series),
+        'daily_stats': {point.start.isoformat(): point.absences for point in series},
+        'start_date': start_date.strftime('%Y-%m-%d'),
+        'end_date': end_date.strftime('%Y-%m-%d')
+    }
+
 # =============================================
 # ДОПОЛНИТЕЛЬНЫЙ API ДЛЯ ПРЕДПРОСМОТРА ЭКСПОРТА
 # =============================================
 
 @dashboard_bp.route('/api/export-preview-data')
 @login_required
+@query_budget(admin=6)
+@read_only
 def export_preview_data():
     """API для предварительного просмотра данных (реальные данные из БД) - ДУБЛИРУЮЩИЙ МЕТОД"""
     # Проверяем права доступа - возвращаем JSON, а не редирект
@@ -2279,22 +2726,23 @@ def export_preview_data():
         
         # Получаем реальные данные
         total_count = query.count()
-        students = query.limit(10).all()
+        students = query.options(db.joinedload(Student.group)).limit(10).all()
+        
+        # Пропуски показанных студентов одним GROUP BY
+        absences_query = db.session.query(Absence.student_id, db.func.count(Absence.id)) \
+            .filter(Absence.student_id.in_([student.id for student in students]))
+        if start_date_obj:
+            absences_query = absences_query.filter(
+                Absence.date >= start_date_obj.date(),
+                Absence.date <= end_date_obj.date()
+            )
+        absences_by_student = dict(absences_query.group_by(Absence.student_id).all())
         
         preview_data = []
         total_absences = 0
         
         for student in students:
-            # Считаем пропуски
-            absences_query = Absence.query.filter_by(student_id=student.id)
-            
-            if start_date_obj:
-                absences_query = absences_query.filter(
-                    Absence.date >= start_date_obj.date(),
-                    Absence.date <= end_date_obj.date()
-                )
-            
-            absences_count = absences_query.count()
+            absences_count = absences_by_student.get(student.id, 0)
             total_absences += absences_count
             
             preview_data.append({
@@ -0,0 +1,46 @@
+# routes/health_routes.py
+import os
+import time
+
+from flask import Blueprint, jsonify
+from sqlalchemy import text
+
+from db import db
+from services.audit import audit
+
+health_bp = Blueprint('health', __name__)
+
+
+@health_bp.route('/health/live')
+def live():
+    """Процесс жив и обслуживает запросы"""
+    return jsonify({'status': 'ok', 'pid': os.getpid()})
+
+
+@health_bp.route('/health/ready')
+def ready():
+    """Готовность принимать трафик: доступна БД, очередь журнала не переполнена"""
+    checks = {}
+    healthy = True
+
+    started = time.perf_counter()
+    try:
+        db.session.execute(text('SELECT 1'))
+        checks['database'] = {'status': 'ok', 'ms': round((time.perf_counter() - started) * 1000, 1)}
+    except Exception as e:
+        db.session.rollback()
+        checks['database'] = {'status': 'error', 'error': str(e)}
+        healthy = False
+
+    queue = getattr(audit, '_queue', None)
+    if queue is not None and queue.maxsize:
+        backlog = queue.qsize()
+        saturated = backlog >= queue.maxsize
+        checks['audit_queue'] = {'status': 'error' if saturated else 'ok', 'size': backlog}
+        healthy = healthy and not saturated
+
+    return jsonify({
+        'status': 'ok' if healthy else 'unavailable',
+        'pid': os.getpid(),
+        'checks': checks
+    }), 200 if healthy else 503
@@ -0,0 +1,49 @@
+# routes/metrics_routes.py
+import hmac
+import ipaddress
+
+from flask import Blueprint, Response, abort, current_app, request
+
+from services.metrics import registry
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+def is_allowed(remote_addr, allowlist):
+    """Проверяет IP по списку адресов и подсетей (METRICS_ALLOWED_IPS)"""
+    try:
+        address = ipaddress.ip_address(remote_addr or '')
+    except ValueError:
+        return False
+    for entry in allowlist:
+        try:
+            if address in ipaddress.ip_network(entry.strip(), strict=False):
+                return True
+        except ValueError:
+            continue
+    return False
+
+
+def has_token(header, token):
+    """Проверяет заголовок Authorization: Bearer <METRICS_TOKEN>"""
+    scheme, _, value = (header or '').partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(value.strip(), token)
+
+
+@metrics_bp.route('/metrics')
+def metrics():
+    """Метрики в формате Prometheus (только для адресов из белого списка)
+
+    За прокси адрес клиента корректен только при PROXY_FIX_HOPS > 0;
+    без этого запрос с X-Forwarded-For пришёл через прокси с адресом
+    127.0.0.1 и отклоняется.
+    """
+    config = current_app.config
+    if 'X-Forwarded-For' in request.headers and not config.get('PROXY_FIX_HOPS'):
+        abort(403)
+    if not is_allowed(request.remote_addr, config.get('METRICS_ALLOWED_IPS', [])):
+        abort(403)
+    token = config.get('METRICS_TOKEN')
+    if token and not has_token(request.headers.get('Authorization'), token):
+        abort(401)
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
@@ -1,7 +1,10 @@
 from flask import Blueprint, render_template, request, flash
 from flask_login import login_required
-from openai import OpenAI
+from services.lazy import openai  # загружается при первом обращении к ассистенту
+from services.metrics import ollama_duration, ollama_errors
+from services.limiter import limit_concurrency
 import os
+import time
 
 ollama_bp = Blueprint('ollama', __name__, url_prefix='/ollama')
 
@@ -11,6 +14,7 @@ OLLAMA_BASE_URL = 'http://127.0.0.1:11434/v1'
 
 @ollama_bp.route('/assistant', methods=['GET', 'POST'])
 @login_required
+@limit_concurrency('ollama', methods=('POST',))
 def ai_assistant():
     answer = ""
     question = ""
@@ -23,8 +27,9 @@ def ai_assistant():
         elif not USE_OLLAMA:
             flash('ИИ Ассистент временно недоступен', 'info')
         else:
+            started = time.perf_counter()
             try:
-                client = OpenAI(
+                client = openai.OpenAI(
                     base_url=OLLAMA_BASE_URL,
                     api_key="ollama",
                 )
@@ -49,7 +54,10 @@ def ai_assistant():
                 answer = response.choices[0].message.content.strip()
 
             except Exception as e:
+                ollama_errors.inc()
                 flash(f'Ошибка связи с ИИ Ассистентом: {str(e)}', 'danger')
+            finally:
+                ollama_duration.observe(time.perf_counter() - started)
 
     return render_template(
         'ai_assistant.html',
@@ -0,0 +1,438 @@
+# services/absence_store.py
+"""Колоночное хранилище пропусков в памяти воркера (NumPy).
+
+Вся аналитика посещаемости - агрегаты по (student_id, date,
+lessons_count, reason). При ANALYTICS_ENGINE=memory воркер держит их
+массивами NumPy, отсортированными по дате: диапазон дат - два бинарных
+поиска, отбор по студенту, группе, куратору или ЦМК - векторная маска,
+суммы - bincount. count_student_absences и attendance_series в этом
+режиме отвечают из памяти, не обращаясь к таблице absences.
+
+Согласованность с записью обеспечивает журнал analytics_changes: коммит,
+изменивший пропуски, студентов, группы или ЦМК кураторов, в той же
+транзакции записывает, что изменилось. Перед каждым ответом хранилище
+читает записи журнала после своего курсора и перечитывает только
+затронутых студентов. Массовые UPDATE/DELETE пропусков без списка
+студентов (Query.delete() и т.п.) заставляют загрузить всё заново, поэтому
+код, который знает затронутых студентов, оборачивает их в scoped_to(). Номера, пропущенные параллельными транзакциями
+PostgreSQL, перепроверяются ещё CHANGE_GAP_TIMEOUT секунд. Раз в
+ANALYTICS_STORE_MAX_AGE секунд хранилище загружается заново - на случай
+записи в обход ORM (скрипты, ручной SQL).
+
+Без NumPy или при ANALYTICS_ENGINE=sql агрегаты считаются в SQL.
+"""
+import importlib.util
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, event, func, inspect, or_, select
+from sqlalchemy.orm import Session
+
+from db import db
+from models.absence import Absence
+from models.analytics_change import AnalyticsChange
+from models.group import Group
+from models.student import Student
+from models.user import User
+from services.lazy import numpy as np
+from services.metrics import absence_store_refresh, absence_store_rows
+from services.query_budget import budget_exempt
+
+logger = logging.getLogger(__name__)
+
+CHANGE_GAP_TIMEOUT = 60.0
+# Больше затронутых студентов за раз - дешевле загрузить всё заново
+MAX_INCREMENTAL_STUDENTS = 500
+# Как часто (в записях журнала на процесс) удалять старые записи
+PRUNE_EVERY = 200
+
+# Столбцы справочника: их изменение требует перечитать связи студент-группа-куратор-ЦМК
+ROSTER_COLUMNS = {Student: 'group_id', Group: 'curator_id', User: 'cmk_id'}
+
+
+def _ordinal(value):
+    if isinstance(value, datetime):
+        value = value.date()
+    return value.toordinal()
+
+
+def _index_table(pairs):
+    """[(ключ, значение)] -> массив значений по ключу, -1 для отсутствующих"""
+    pairs = list(pairs)
+    table = np.full(max((key for key, _ in pairs), default=0) + 1, -1, dtype=np.int64)
+    for key, value in pairs:
+        if value is not None:
+            table[key] = value
+    return table
+
+
+def _lookup(table, keys):
+    """table[keys] с -1 для ключей вне таблицы"""
+    inside = (keys >= 0) & (keys < len(table))
+    return np.where(inside, table[np.where(inside, keys, 0)], -1)
+
+
+class _Columns:
+    """Неизменяемый снимок: пропуски по возрастанию даты и связи студент-группа-куратор-ЦМК"""
+
+    __slots__ = ('dates', 'students', 'lessons', 'reasons', 'reason_names',
+                 'student_group', 'group_curator', 'curator_cmk', '_excused')
+
+    def __init__(self, dates, students, lessons, reasons, reason_names, student_group, group_curator, curator_cmk):
+        self.dates = dates
+        self.students = students
+        self.lessons = lessons
+        self.reasons = reasons
+        self.reason_names = reason_names
+        self.student_group = student_group
+        self.group_curator = group_curator
+        self.curator_cmk = curator_cmk
+        self._excused = {}
+
+    @staticmethod
+    def encode(rows, reason_names):
+        """Строки (student_id, date, lessons_count, reason) -> массивы по возрастанию даты
+
+        reason_names дополняется новыми причинами; код - индекс в списке.
+        """
+        codes = {name: code for code, name in enumerate(reason_names)}
+        count = len(rows)
+        students = np.fromiter((row[0] for row in rows), dtype=np.int64, count=count)
+        dates = np.fromiter((row[1].toordinal() for row in rows), dtype=np.int32, count=count)
+        lessons = np.fromiter((row[2] or 0 for row in rows), dtype=np.int32, count=count)
+        reasons = np.empty(count, dtype=np.int32)
+        for i, row in enumerate(rows):
+            name = row[3] or ''
+            code = codes.get(name)
+            if code is None:
+                code = codes[name] = len(reason_names)
+                reason_names.append(name)
+            reasons[i] = code
+        order = np.argsort(dates, kind='stable')
+        return dates[order], students[order], lessons[order], reasons[order]
+
+    def with_roster(self, student_group, group_curator, curator_cmk):
+        return _Columns(self.dates, self.students, self.lessons, self.reasons, self.reason_names,
+                        student_group, group_curator, curator_cmk)
+
+    def with_students(self, student_ids, rows):
+        """Снимок, в котором пропуски student_ids заменены строками rows"""
+        keep = ~np.isin(self.students, np.fromiter(student_ids, dtype=np.int64))
+        reason_names = list(self.reason_names)
+        dates, students, lessons, reasons = self.encode(rows, reason_names)
+        kept_dates = self.dates[keep]
+        positions = np.searchsorted(kept_dates, dates, side='right')
+        return _Columns(np.insert(kept_dates, positions, dates),
+                        np.insert(self.students[keep], positions, students),
+                        np.insert(self.lessons[keep], positions, lessons),
+                        np.insert(self.reasons[keep], positions, reasons),
+                        reason_names, self.student_group, self.group_curator, self.curator_cmk)
+
+    def window(self, start, end):
+        lo = 0 if start is None else int(np.searchsorted(self.dates, _ordinal(start), side='left'))
+        hi = len(self.dates) if end is None else int(np.searchsorted(self.dates, _ordinal(end), side='right'))
+        return slice(lo, hi)
+
+    def excused(self, excused_reasons):
+        """Флаг уважительной причины для каждой строки"""
+        key = frozenset(excused_reasons)
+        flags = self._excused.get(key)
+        if flags is None:
+            by_code = np.array([bool(name) and name.lower() in key for name in self.reason_names], dtype=bool)
+            flags = self._excused[key] = by_code[self.reasons]
+        return flags
+
+    def scope_mask(self, students, scope, scope_id):
+        if scope == 'all':
+            return np.ones(len(students), dtype=bool)
+        if scope == 'student':
+            return students == scope_id
+        groups = _lookup(self.student_group, students)
+        if scope == 'group':
+            return groups == scope_id
+        curators = _lookup(self.group_curator, groups)
+        if scope == 'curator':
+            return curators == scope_id
+        return _lookup(self.curator_cmk, curators) == scope_id
+
+
+class AbsenceStore:
+    def __init__(self):
+        self.enabled = False
+        self.max_age = 600
+        self.retention = timedelta(hours=24)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.reset()
+
+    def init_app(self, app):
+        self.enabled = app.config.get('ANALYTICS_ENGINE', 'sql') == 'memory'
+        if self.enabled and importlib.util.find_spec('numpy') is None:
+            logger.warning('ANALYTICS_ENGINE=memory, но NumPy не установлен: аналитика считается в SQL')
+            self.enabled = False
+        self.max_age = app.config.get('ANALYTICS_STORE_MAX_AGE', 600)
+        self.retention = timedelta(hours=app.config.get('ANALYTICS_CHANGES_RETENTION_HOURS', 24))
+        self.reset()
+        if self.enabled:
+            _install_hooks()
+        app.extensions['absence_store'] = self
+
+    @property
+    def active(self):
+        return self.enabled
+
+    def reset(self):
+        """Забыть загруженные данные (следующий запрос загрузит их заново)"""
+        with self._lock:
+            self._columns = None
+            self._loaded_at = 0.0
+            self._cursor = 0
+            self._gaps = {}
+
+    # --- загрузка ---
+
+    def _snapshot(self):
+        with self._lock:
+            if self._columns is None or time.monotonic() - self._loaded_at > self.max_age:
+                self._load_all()
+            else:
+                self._apply_changes()
+            return self._columns
+
+    @staticmethod
+    def _load_roster():
+        return (
+            _index_table(db.session.execute(select(Student.id, Student.group_id)).all()),
+            _index_table(db.session.execute(select(Group.id, Group.curator_id)).all()),
+            _index_table(db.session.execute(select(User.id, User.cmk_id).where(User.cmk_id.isnot(None))).all()),
+        )
+
+    @staticmethod
+    def _absence_rows(student_ids=None):
+        query = select(Absence.student_id, Absence.date, Absence.lessons_count, Absence.reason)
+        if student_ids is not None:
+            query = query.where(Absence.student_id.in_(student_ids))
+        return db.session.execute(query).all()
+
+    def _load_all(self):
+        started = time.perf_counter()
+        with budget_exempt():
+            # Курсор до чтения данных: изменения во время загрузки применятся повторно
+            cursor = db.session.execute(select(func.max(AnalyticsChange.id))).scalar() or 0
+            roster = self._load_roster()
+            rows = self._absence_rows()
+        reason_names = ['']
+        columns = _Columns(*_Columns.encode(rows, reason_names), reason_names, *roster)
+
+        self._columns = columns
+        self._cursor = cursor
+        self._gaps = {}
+        self._loaded_at = time.monotonic()
+        absence_store_rows.set(len(columns.dates))
+        absence_store_refresh.observe(time.perf_counter() - started, kind='full')
+
+    def _apply_changes(self):
+        query = select(AnalyticsChange.id, AnalyticsChange.kind, AnalyticsChange.student_id)
+        if self._gaps:
+            query = query.where(or_(AnalyticsChange.id > self._cursor, AnalyticsChange.id.in_(list(self._gaps))))
+        else:
+            query = query.where(AnalyticsChange.id > self._cursor)
+        changes = db.session.execute(query).all()
+
+        now = time.monotonic()
+        seen = {change.id for change in changes}
+        top = max(seen, default=self._cursor)
+        for missing in range(self._cursor + 1, top):
+            if missing not in seen:
+                self._gaps[missing] = now
+        self._gaps = {i: since for i, since in self._gaps.items() if i not in seen and now - since < CHANGE_GAP_TIMEOUT}
+        self._cursor = max(top, self._cursor)
+        if not changes:
+            return
+
+        kinds = {change.kind for change in changes}
+        students = {change.student_id for change in changes if change.kind == 'student' and change.student_id}
+        if 'all' in kinds or len(students) > MAX_INCREMENTAL_STUDENTS:
+            self._load_all()
+            return
+
+        started = time.perf_counter()
+        columns = self._columns
+        with budget_exempt():
+            if 'roster' in kinds:
+                columns = columns.with_roster(*self._load_roster())
+            if students:
+                columns = columns.with_students(students, self._absence_rows(students))
+        self._columns = columns
+        absence_store_rows.set(len(columns.dates))
+        absence_store_refresh.observe(time.perf_counter() - started, kind='incremental')
+
+    # --- агрегаты ---
+
+    def student_totals(self, student_ids, start, end, excused_reasons):
+        """{student_id: (всего, уважительных)} - как count_student_absences"""
+        columns = self._snapshot()
+        window = columns.window(start, end)
+        students = columns.students[window]
+        excused = columns.excused(excused_reasons)[window]
+        if student_ids is not None:
+            mask = np.isin(students, np.fromiter(student_ids, dtype=np.int64))
+            students, excused = students[mask], excused[mask]
+        if not len(students):
+            return {}
+
+        totals = np.bincount(students)
+        excused_totals = np.bincount(students, weights=excused)
+        return {int(student): (int(totals[student]), int(excused_totals[student]))
+                for student in np.flatnonzero(totals)}
+
+    def group_totals(self, start, end, excused_reasons):
+        """{group_id: (всего, уважительных)} по всем группам"""
+        columns = self._snapshot()
+        window = columns.window(start, end)
+        groups = _lookup(columns.student_group, columns.students[window])
+        excused = columns.excused(excused_reasons)[window]
+        mask = groups >= 0
+        groups, excused = groups[mask], excused[mask]
+        if not len(groups):
+            return {}
+
+        totals = np.bincount(groups)
+        excused_totals = np.bincount(groups, weights=excused)
+        return {int(group): (int(totals[group]), int(excused_totals[group])) for group in np.flatnonzero(totals)}
+
+    def series(self, scope, scope_id, start, end, bucket, excused_reasons):
+        """Ряд attendance_series: периоды - searchsorted по их началам, суммы - bincount"""
+        from services.timeseries import Point, bucket_starts
+
+        columns = self._snapshot()
+        window = columns.window(start, end)
+        mask = columns.scope_mask(columns.students[window], scope, scope_id)
+        dates = columns.dates[window][mask]
+        lessons = columns.lessons[window][mask]
+        excused = columns.excused(excused_reasons)[window][mask]
+
+        starts = list(bucket_starts(start, end, bucket))
+        edges = np.array([period.toordinal() for period in starts], dtype=np.int32)
+        index = np.searchsorted(edges, dates, side='right') - 1
+        absences = np.bincount(index, minlength=len(starts))
+        lessons = np.bincount(index, weights=lessons, minlength=len(starts))
+        excused = np.bincount(index, weights=excused, minlength=len(starts))
+        return [Point(period, int(absences[i]), int(lessons[i]), int(excused[i]), int(absences[i] - excused[i]))
+                for i, period in enumerate(starts)]
+
+    # --- журнал изменений ---
+
+    @staticmethod
+    @contextmanager
+    def scoped_to(session, student_ids):
+        """Массовые операции над absences внутри блока затрагивают только student_ids"""
+        previous = session.info.get('analytics_scope')
+        session.info['analytics_scope'] = frozenset(student_ids)
+        try:
+            yield
+        finally:
+            if previous is None:
+                session.info.pop('analytics_scope', None)
+            else:
+                session.info['analytics_scope'] = previous
+
+    def write_changes(self, session, changes):
+        if ('all', None) in changes:
+            changes = {('all', None)}
+        now = datetime.utcnow()
+        table = AnalyticsChange.__table__
+        stmt = table.insert()
+        connection = session.connection(bind_arguments={'clause': stmt})
+        connection.execute(stmt, [{'kind': kind, 'student_id': student_id, 'created_at': now}
+                                  for kind, student_id in sorted(changes, key=lambda c: (c[0], c[1] or 0))])
+        self._writes += 1
+        if self._writes % PRUNE_EVERY == 0:
+            connection.execute(delete(table).where(table.c.created_at < now - self.retention))
+
+
+absence_store = AbsenceStore()
+
+
+def _changes(session):
+    return session.info.setdefault('analytics_changes', set())
+
+
+def _on_absence(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is None:
+        return
+    changes = _changes(session)
+    changes.add(('student', target.student_id))
+    # Пропуск перенесён к другому студенту
+    for previous in inspect(target).attrs.student_id.history.deleted or ():
+        changes.add(('student', previous))
+
+
+def _on_roster_change(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        _changes(session).add(('roster', None))
+
+
+def _on_roster_update(mapper, connection, target):
+    column = ROSTER_COLUMNS[mapper.class_]
+    if inspect(target).attrs[column].history.has_changes():
+        _on_roster_change(mapper, connection, target)
+
+
+def _on_bulk(orm_execute_state):
+    # INSERT/UPDATE/DELETE через session.execute(): upsert пропусков, Query.delete()
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    table = getattr(orm_execute_state.statement, 'table', None)
+    if table is None:
+        return
+    changes = _changes(orm_execute_state.session)
+    if table.name == Absence.__tablename__:
+        params = orm_execute_state.parameters
+        rows = params if isinstance(params, (list, tuple)) else [params] if params else []
+        student_ids = {row.get('student_id') for row in rows}
+        scope = orm_execute_state.session.info.get('analytics_scope')
+        if orm_execute_state.is_insert and rows and None not in student_ids:
+            changes.update(('student', student_id) for student_id in student_ids)
+        elif scope is not None:
+            changes.update(('student', student_id) for student_id in scope)
+        else:
+            changes.add(('all', None))
+    elif table.name in {model.__tablename__ for model in ROSTER_COLUMNS}:
+        changes.add(('roster', None))
+
+
+def _flush_changes(session, *args):
+    # После flush (изменения объектов) и перед коммитом (массовые операции)
+    changes = session.info.pop('analytics_changes', None)
+    if changes and absence_store.enabled:
+        absence_store.write_changes(session, changes)
+
+
+def _discard_changes(session):
+    session.info.pop('analytics_changes', None)
+
+
+_hooks_installed = False
+
+
+def _install_hooks():
+    global _hooks_installed
+    if _hooks_installed:
+        return
+    for _event in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(Absence, _event, _on_absence)
+    for model in ROSTER_COLUMNS:
+        event.listen(model, 'after_insert', _on_roster_change)
+        event.listen(model, 'after_update', _on_roster_update)
+        event.listen(model, 'after_delete', _on_roster_change)
+    event.listen(Session, 'do_orm_execute', _on_bulk)
+    event.listen(Session, 'after_flush', _flush_changes)
+    event.listen(Session, 'before_commit', _flush_changes)
+    event.listen(Session, 'after_rollback', _discard_changes)
+    _hooks_installed = True
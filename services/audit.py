@@ -0,0 +1,225 @@
+# services/audit.py
+"""Фоновая пакетная запись журнала действий (audit_logs).
+
+audit.record() не выполняет запросов к БД: событие кладётся в очередь,
+а фоновый поток вставляет накопленные записи одним INSERT по достижении
+AUDIT_BATCH_SIZE событий или раз в AUDIT_FLUSH_INTERVAL секунд.
+При AUDIT_ASYNC=False (и в режиме TESTING) запись выполняется сразу.
+
+archive_audit_logs() переносит записи старше AUDIT_RETENTION_DAYS в
+сжатые помесячные файлы instance/audit_archive/audit_logs_YYYY-MM.jsonl.gz,
+чтобы рабочая таблица оставалась небольшой.
+"""
+import atexit
+import gzip
+import json
+import logging
+import os
+import queue
+import threading
+from datetime import datetime, timedelta
+
+from db import db
+from models.audit_log import AuditLog
+from services.schema import create_model_indexes
+
+logger = logging.getLogger(__name__)
+
+
+class AuditWriter:
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self.batch_size = 50
+        self.flush_interval = 2.0
+        self._queue = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('AUDIT_ASYNC', True) and not app.config.get('TESTING')
+        self.batch_size = app.config.get('AUDIT_BATCH_SIZE', 50)
+        self.flush_interval = app.config.get('AUDIT_FLUSH_INTERVAL', 2.0)
+        self._queue = queue.Queue(maxsize=app.config.get('AUDIT_QUEUE_SIZE', 10000))
+        app.extensions['audit_writer'] = self
+        atexit.register(self.shutdown)
+
+    # =============================================
+    # ПУБЛИЧНЫЙ API
+    # =============================================
+
+    def record(self, action, description=None, user_id=None, ip_address=None):
+        """Регистрирует действие пользователя. Не блокирует запрос."""
+        event = self._build_event(action, description, user_id, ip_address)
+        if event['user_id'] is None:
+            logger.warning(f"Audit event without user skipped: {action}")
+            return
+
+        if self.enabled and self._ensure_worker():
+            try:
+                self._queue.put_nowait(event)
+                return
+            except queue.Full:
+                logger.warning("Audit queue is full, writing synchronously")
+
+        self._write([event])
+
+    def flush(self):
+        """Синхронно записывает все накопленные события"""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except (queue.Empty, AttributeError):
+                break
+        if batch:
+            self._write(batch)
+
+    def shutdown(self, timeout=5.0):
+        """Останавливает фоновый поток и дописывает очередь"""
+        self._stop.set()
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            self._thread.join(timeout)
+        self.flush()
+
+    # =============================================
+    # ВНУТРЕННЕЕ
+    # =============================================
+
+    def _build_event(self, action, description, user_id, ip_address):
+        from flask import has_request_context, request
+        from flask_login import current_user
+
+        if has_request_context():
+            if user_id is None and current_user and current_user.is_authenticated:
+                user_id = current_user.id
+            if ip_address is None:
+                ip_address = request.remote_addr
+
+        return {
+            'user_id': user_id,
+            'action': action,
+            'description': description,
+            'ip_address': ip_address,
+            'created_at': datetime.utcnow()
+        }
+
+    def _ensure_worker(self):
+        """Запускает поток в текущем процессе (в т.ч. после fork воркера)"""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return True
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return True
+            if self._pid != os.getpid():
+                # Очередь, унаследованная от родителя, принадлежит ему
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+                self._stop = threading.Event()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+            except queue.Empty:
+                continue
+
+            deadline = datetime.utcnow().timestamp() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - datetime.utcnow().timestamp()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._write(batch)
+
+    def _write(self, events):
+        try:
+            with self.app.app_context():
+                db.session.execute(db.insert(AuditLog), events)
+                db.session.commit()
+        except Exception as e:
+            logger.error(f"Audit write failed ({len(events)} events): {e}", exc_info=True)
+
+
+audit = AuditWriter()
+
+
+# =============================================
+# АРХИВАЦИЯ И ХРАНЕНИЕ
+# =============================================
+
+def ensure_audit_indexes():
+    """Создаёт индексы журнала в уже существующей базе"""
+    with db.engine.begin() as conn:
+        create_model_indexes(conn, AuditLog)
+
+
+def archive_audit_logs(days=None, archive_dir=None, batch_size=5000):
+    """Переносит записи старше days дней в архивные файлы и удаляет их из таблицы.
+
+    Выполняется в контексте приложения. Возвращает число перенесённых записей.
+    """
+    from flask import current_app
+
+    if days is None:
+        days = current_app.config.get('AUDIT_RETENTION_DAYS', 180)
+    if archive_dir is None:
+        archive_dir = current_app.config.get('AUDIT_ARCHIVE_DIR') or \
+            os.path.join(current_app.instance_path, 'audit_archive')
+    os.makedirs(archive_dir, exist_ok=True)
+
+    ensure_audit_indexes()
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    archived = 0
+
+    while True:
+        rows = db.session.query(
+            AuditLog.id, AuditLog.user_id, AuditLog.action,
+            AuditLog.description, AuditLog.ip_address, AuditLog.created_at
+        ).filter(
+            AuditLog.created_at < cutoff
+        ).order_by(AuditLog.created_at, AuditLog.id).limit(batch_size).all()
+
+        if not rows:
+            break
+
+        # Раскладываем пачку по месяцам
+        partitions = {}
+        for row in rows:
+            partitions.setdefault(row.created_at.strftime('%Y-%m'), []).append({
+                'id': row.id,
+                'user_id': row.user_id,
+                'action': row.action,
+                'description': row.description,
+                'ip_address': row.ip_address,
+                'created_at': row.created_at.isoformat()
+            })
+
+        # Каждая пачка дописывается отдельным gzip-членом, файл остаётся валидным
+        for month, entries in partitions.items():
+            path = os.path.join(archive_dir, f'audit_logs_{month}.jsonl.gz')
+            with gzip.open(path, 'at', encoding='utf-8') as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+        db.session.execute(
+            db.delete(AuditLog).where(AuditLog.id.in_([row.id for row in rows])),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.commit()
+        archived += len(rows)
+
+    return archived
@@ -0,0 +1,574 @@
+# services/cache.py
+"""Общий кэш с подключаемым хранилищем.
+
+Кэши в памяти процесса у каждого воркера gunicorn свои и после записи в
+другом воркере остаются устаревшими до истечения TTL. Здесь кэш
+разделён на интерфейс и хранилище (CACHE_BACKEND):
+
+    memory      - LRU с TTL в памяти процесса (один процесс, тесты)
+    filesystem  - файлы в instance/cache, общие для воркеров одной машины (по умолчанию)
+    redis       - сервер с протоколом Redis (CACHE_REDIS_URL), общий для всех
+
+Ключи группируются в пространства имён ('reference:groups', 'analytics',
+'export'...). У каждого пространства есть штамп версии, который хранится
+в том же хранилище и входит в ключ записи. Коммит, изменивший таблицы
+отслеживаемых моделей (cache.track), записывает новый штамп - все воркеры
+видят его не позже чем через CACHE_VERSION_CHECK секунд, и старые
+записи просто перестают читаться.
+
+    cache.track(Group, 'reference:groups')
+    groups = cache.get_or_set('reference:groups', 'all', load_groups, ttl=300)
+
+Промах get_or_set проходит через single-flight (services/singleflight.py):
+одинаковые одновременные вычисления в воркере объединяются, а при общем
+хранилище первый воркер берёт блокировку lock:<ключ>, и остальные ждут
+его результата в кэше (SINGLE_FLIGHT_WAIT секунд), а не считают сами.
+
+Граница доверия. В filesystem и redis значения хранятся в pickle:
+кэшируются namedtuple, даты и готовые файлы экспорта, которые JSON не
+передаёт. Распаковка pickle выполняет код, поэтому каждая запись
+подписывается HMAC-SHA256 ключом CACHE_SECRET (по умолчанию SECRET_KEY),
+и запись с неверной подписью считается промахом, а не распаковывается.
+Это защищает от подмены записей тем, у кого есть доступ к хранилищу, но
+не к ключу. Но каталог кэша (создаётся с правами 0700) и сервер Redis
+(пароль, закрытая сеть) должны быть доступны только приложению, а
+SECRET_KEY в продакшене - не значением по умолчанию.
+"""
+import hashlib
+import hmac
+import logging
+import os
+import pickle
+import socket
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import unquote, urlparse
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from services.metrics import cache_errors, cache_requests, singleflight_waits
+from services.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+SIGNATURE_SIZE = hashlib.sha256().digest_size
+
+
+def dumps(value, secret):
+    """pickle с подписью HMAC-SHA256 впереди"""
+    data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+    return hmac.new(secret, data, hashlib.sha256).digest() + data
+
+
+def loads(blob, secret):
+    """Распаковывает только запись, подписанную тем же ключом"""
+    signature, data = blob[:SIGNATURE_SIZE], blob[SIGNATURE_SIZE:]
+    if not hmac.compare_digest(signature, hmac.new(secret, data, hashlib.sha256).digest()):
+        raise pickle.UnpicklingError('подпись записи кэша не совпадает')
+    return pickle.loads(data)
+
+
+# =============================================
+# ХРАНИЛИЩА
+# =============================================
+
+class MemoryBackend:
+    """LRU с TTL в памяти процесса"""
+    name = 'memory'
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            expires, value = entry
+            if expires and expires < time.monotonic():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl if ttl else 0, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def add(self, key, value, ttl=None):
+        """Запись, только если ключа нет; True - записано"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not (entry[0] and entry[0] < time.monotonic()):
+                return False
+            self._entries[key] = (time.monotonic() + ttl if ttl else 0, value)
+            self._entries.move_to_end(key)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class FileSystemBackend:
+    """Файл на ключ: подписанный pickle (срок, значение), запись через os.replace"""
+    name = 'filesystem'
+
+    def __init__(self, directory, threshold=2000, secret=b''):
+        self.directory = directory
+        self.threshold = threshold
+        self.secret = secret
+        self._writes = 0
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+
+    def _read(self, path):
+        with open(path, 'rb') as f:
+            return loads(f.read(), self.secret)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.cache')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            expires, value = self._read(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return MISSING
+        if expires and expires < time.time():
+            self._remove(path)
+            return MISSING
+        return value
+
+    def set(self, key, value, ttl=None):
+        data = dumps((time.time() + ttl if ttl else 0, value), self.secret)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, self._path(key))
+        except OSError:
+            self._remove(tmp)
+            raise
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self._prune()
+
+    def add(self, key, value, ttl=None):
+        """Создание файла с O_EXCL: атомарно и между процессами"""
+        path = self._path(key)
+        data = dumps((time.time() + ttl if ttl else 0, value), self.secret)
+        for attempt in (1, 2):
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            except FileExistsError:
+                # Просроченная запись (упавший воркер) не должна держать ключ вечно
+                if attempt == 1 and self.get(key) is MISSING:
+                    continue
+                return False
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            return True
+        return False
+
+    def delete(self, key):
+        self._remove(self._path(key))
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith('.cache'):
+                self._remove(os.path.join(self.directory, name))
+
+    def _prune(self):
+        """Удаляет просроченные записи, а сверх порога - самые старые"""
+        files = []
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith('.cache'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                expires, _ = self._read(path)
+                if expires and expires < now:
+                    self._remove(path)
+                    continue
+                files.append((os.path.getmtime(path), path))
+            except (OSError, EOFError, pickle.UnpicklingError):
+                self._remove(path)
+        if len(files) > self.threshold:
+            for _, path in sorted(files)[:len(files) - self.threshold]:
+                self._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisBackend:
+    """Минимальный клиент протокола Redis (RESP2): GET, SET PX, DEL, SCAN
+
+    Подходит для Redis, Valkey, KeyDB и других совместимых серверов.
+    Соединение своё у каждого потока и переоткрывается после fork.
+    """
+    name = 'redis'
+
+    def __init__(self, url, prefix='students:', timeout=1.0, secret=b''):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or '127.0.0.1'
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.prefix = prefix
+        self.timeout = timeout
+        self.secret = secret
+        self._local = threading.local()
+
+    # --- протокол ---
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._local.sock = sock
+        self._local.reader = sock.makefile('rb')
+        self._local.pid = os.getpid()
+        if self.password:
+            auth = ('AUTH', self.username, self.password) if self.username else ('AUTH', self.password)
+            self._roundtrip(*auth)
+        if self.db:
+            self._roundtrip('SELECT', self.db)
+
+    def _close(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+        self._local.sock = None
+
+    def _roundtrip(self, *args):
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        self._local.sock.sendall(b''.join(parts))
+        return self._read_reply()
+
+    def _read_reply(self):
+        line = self._local.reader.readline()
+        if not line:
+            raise ConnectionError('соединение с сервером кэша закрыто')
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload
+        if kind == b'-':
+            raise RedisError(payload.decode('utf-8', 'replace'))
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self._local.reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            length = int(payload)
+            return None if length < 0 else [self._read_reply() for _ in range(length)]
+        raise RedisError(f'неизвестный ответ сервера: {line!r}')
+
+    def command(self, *args):
+        """Команда с одним переподключением при обрыве соединения"""
+        for attempt in (1, 2):
+            if getattr(self._local, 'sock', None) is None or self._local.pid != os.getpid():
+                self._connect()
+            try:
+                return self._roundtrip(*args)
+            except (ConnectionError, socket.timeout, OSError):
+                self._close()
+                if attempt == 2:
+                    raise
+
+    # --- интерфейс хранилища ---
+
+    def get(self, key):
+        data = self.command('GET', self.prefix + key)
+        if data is None:
+            return MISSING
+        try:
+            return loads(data, self.secret)
+        except pickle.UnpicklingError as e:
+            logger.warning(f'Кэш (redis): запись {key} отброшена: {e}')
+            return MISSING
+
+    def set(self, key, value, ttl=None):
+        data = dumps(value, self.secret)
+        if ttl:
+            self.command('SET', self.prefix + key, data, 'PX', int(ttl * 1000))
+        else:
+            self.command('SET', self.prefix + key, data)
+
+    def add(self, key, value, ttl=None):
+        data = dumps(value, self.secret)
+        args = ['SET', self.prefix + key, data, 'NX']
+        if ttl:
+            args += ['PX', int(ttl * 1000)]
+        return self.command(*args) is not None
+
+    def delete(self, key):
+        self.command('DEL', self.prefix + key)
+
+    def clear(self):
+        """Удаляет только ключи приложения (по префиксу), а не всю базу"""
+        cursor = b'0'
+        while True:
+            cursor, keys = self.command('SCAN', cursor, 'MATCH', self.prefix + '*', 'COUNT', 500)
+            if keys:
+                self.command('DEL', *keys)
+            if cursor == b'0':
+                break
+
+
+def create_backend(config, instance_path):
+    kind = (config.get('CACHE_BACKEND') or 'memory').lower()
+    secret = (config.get('CACHE_SECRET') or config.get('SECRET_KEY') or '').encode('utf-8')
+    if kind == 'filesystem':
+        directory = config.get('CACHE_DIR') or os.path.join(instance_path, 'cache')
+        return FileSystemBackend(directory, threshold=config.get('CACHE_THRESHOLD', 2000), secret=secret)
+    if kind == 'redis':
+        return RedisBackend(config.get('CACHE_REDIS_URL') or 'redis://127.0.0.1:6379/0',
+                            prefix=config.get('CACHE_KEY_PREFIX', 'students:'),
+                            timeout=config.get('CACHE_REDIS_TIMEOUT', 1.0), secret=secret)
+    if kind != 'memory':
+        raise ValueError(f'Неизвестное хранилище кэша: {kind}')
+    return MemoryBackend(config.get('CACHE_MAXSIZE', 1024))
+
+
+# =============================================
+# КЭШ С ВЕРСИЯМИ ПРОСТРАНСТВ ИМЁН
+# =============================================
+
+class Cache:
+    def __init__(self, app=None):
+        self.backend = MemoryBackend()
+        self.default_ttl = 300
+        self.version_check = 1.0
+        self.retry_interval = 5.0
+        self.shared_flight = False
+        self.flight_wait = 30.0
+        self.flight_poll = 0.05
+        self._flight = SingleFlight()
+        self._down_until = 0.0
+        self._versions = {}
+        self._tables = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.backend = create_backend(app.config, app.instance_path)
+        self.default_ttl = app.config.get('CACHE_DEFAULT_TTL', 300)
+        self.retry_interval = app.config.get('CACHE_RETRY_INTERVAL', 5.0)
+        # Блокировка между воркерами имеет смысл только в общем хранилище
+        self.shared_flight = self.backend.name != 'memory' and app.config.get('SINGLE_FLIGHT_SHARED', True)
+        self.flight_wait = app.config.get('SINGLE_FLIGHT_WAIT', 30.0)
+        self.flight_poll = app.config.get('SINGLE_FLIGHT_POLL', 0.05)
+        self._down_until = 0.0
+        # Для кэша в памяти процесса штамп и так локальный
+        self.version_check = 0 if self.backend.name == 'memory' else app.config.get('CACHE_VERSION_CHECK', 1.0)
+        self._versions = {}
+        app.extensions['cache'] = self
+
+    # --- версии ---
+
+    @staticmethod
+    def _new_stamp():
+        return f'{time.time_ns():x}.{os.getpid():x}'
+
+    def version(self, namespace):
+        """Текущий штамп пространства; перечитывается раз в version_check секунд"""
+        now = time.monotonic()
+        with self._lock:
+            local = self._versions.get(namespace)
+        if local is not None and (now - local[1] < self.version_check or self.backend.name == 'memory'):
+            return local[0]
+
+        stamp = self._call('get', f'version:{namespace}')
+        if stamp is MISSING or stamp is None:
+            stamp = self._new_stamp()
+            self._call('set', f'version:{namespace}', stamp)
+        with self._lock:
+            self._versions[namespace] = (stamp, now)
+        return stamp
+
+    def bump(self, *namespaces):
+        """Новый штамп: записи пространств перестают читаться во всех воркерах"""
+        now = time.monotonic()
+        for namespace in namespaces:
+            stamp = self._new_stamp()
+            self._call('set', f'version:{namespace}', stamp)
+            with self._lock:
+                self._versions[namespace] = (stamp, now)
+
+    # --- записи ---
+
+    def _key(self, namespace, key):
+        key = key if isinstance(key, str) else repr(key)
+        if len(key) > 150:
+            key = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return f'{namespace}:{self.version(namespace)}:{key}'
+
+    def get(self, namespace, key, default=None):
+        value = self._call('get', self._key(namespace, key))
+        return default if value is MISSING else value
+
+    def set(self, namespace, key, value, ttl=None):
+        self._call('set', self._key(namespace, key), value, self.default_ttl if ttl is None else ttl)
+
+    def get_or_set(self, namespace, key, loader, ttl=None, metric=None):
+        """Значение из кэша или loader() с сохранением
+
+        Штамп берётся до загрузки: если данные поменялись, пока loader
+        читал базу, запись ляжет под старым штампом и не будет прочитана.
+        Одновременные промахи по одному ключу объединяются (single-flight),
+        в том числе при ttl=0, когда результат не сохраняется.
+        """
+        full_key = self._key(namespace, key)
+        value = self._call('get', full_key)
+        metric = metric or namespace.split(':')[0]
+        if value is not MISSING:
+            cache_requests.inc(cache=metric, result='hit')
+            return value
+
+        cache_requests.inc(cache=metric, result='miss')
+        ttl = self.default_ttl if ttl is None else ttl
+        value, shared = self._flight.do(full_key, lambda: self._load(full_key, loader, ttl, metric))
+        if shared:
+            singleflight_waits.inc(cache=metric, scope='worker')
+        return value
+
+    def _load(self, full_key, loader, ttl, metric):
+        if not (ttl and self.shared_flight):
+            value = loader()
+            if ttl:
+                self._call('set', full_key, value, ttl)
+            return value
+
+        # Первый воркер считает, остальные ждут его записи в кэше
+        lock_key = f'lock:{full_key}'
+        token = self._new_stamp()
+        owner = self._call('add', lock_key, token, self.flight_wait) is True
+        if not owner:
+            value = self._wait_for(full_key, lock_key, metric)
+            if value is not MISSING:
+                return value
+        try:
+            value = loader()
+            self._call('set', full_key, value, ttl)
+            return value
+        finally:
+            if owner and self._call('get', lock_key) == token:
+                self._call('delete', lock_key)
+
+    def _wait_for(self, full_key, lock_key, metric):
+        """Результат другого воркера; MISSING - блокировка снята без результата или ожидание истекло"""
+        deadline = time.monotonic() + self.flight_wait
+        while time.monotonic() < deadline:
+            time.sleep(self.flight_poll)
+            value = self._call('get', full_key)
+            if value is not MISSING:
+                singleflight_waits.inc(cache=metric, scope='shared')
+                return value
+            if self._call('get', lock_key) is MISSING:
+                break
+        return MISSING
+
+    def clear(self):
+        self._call('clear')
+        with self._lock:
+            self._versions.clear()
+
+    def _call(self, method, *args):
+        """Ошибка хранилища не должна ломать запрос: считаем её промахом
+
+        После ошибки хранилище пропускается retry_interval секунд, чтобы
+        недоступный сервер не добавлял таймаут к каждому обращению.
+        """
+        if self._down_until and time.monotonic() < self._down_until:
+            return MISSING
+        try:
+            return getattr(self.backend, method)(*args)
+        except Exception as e:
+            self._down_until = time.monotonic() + self.retry_interval
+            cache_errors.inc(backend=self.backend.name)
+            logger.warning(f'Кэш ({self.backend.name}): {method} не выполнен: {e}')
+            return MISSING
+
+    # --- инвалидация по коммиту ---
+
+    def track(self, model, *namespaces):
+        """Коммит, изменивший таблицу модели, обновляет штампы пространств"""
+        table = model.__table__.name
+        first = table not in self._tables
+        self._tables.setdefault(table, set()).update(namespaces)
+        if first:
+            for _event in ('after_insert', 'after_update', 'after_delete'):
+                event.listen(model, _event, _mark_dirty)
+
+    def namespaces_for(self, table):
+        return self._tables.get(table, ())
+
+
+cache = Cache()
+
+
+def _dirty(session):
+    return session.info.setdefault('cache_dirty', set())
+
+
+def _mark_dirty(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        _dirty(session).update(cache.namespaces_for(target.__table__.name))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _mark_bulk_dirty(orm_execute_state):
+    # INSERT/UPDATE/DELETE через session.execute() (upsert пропусков и т.п.)
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if table is not None:
+            _dirty(orm_execute_state.session).update(cache.namespaces_for(table.name))
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_after_commit(session):
+    namespaces = session.info.pop('cache_dirty', None)
+    if namespaces:
+        cache.bump(*namespaces)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop('cache_dirty', None)
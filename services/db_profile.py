@@ -0,0 +1,205 @@
+# services/db_profile.py
+"""Профиль подключения к базе данных.
+
+Для SQLite на каждом новом соединении выставляются прагмы рабочего
+режима: WAL (читатели не блокируют писателя), busy_timeout (ожидание
+блокировки вместо мгновенного «database is locked»), synchronous=NORMAL,
+mmap и размер кэша страниц. Раз в SQLITE_OPTIMIZE_INTERVAL секунд
+фоновый поток выполняет PRAGMA optimize.
+
+Параметры пула подбираются по типу базы: для SQLite - небольшой пул
+без pre-ping, для серверных СУБД - QueuePool с pre-ping и
+переподключением, а PostgreSQL получает statement_timeout и
+lock_timeout на уровне сессии. Всё настраивается переменными окружения
+(см. config.py).
+
+init_app() вызывается до db.init_app(): он заполняет
+SQLALCHEMY_ENGINE_OPTIONS, если они не заданы явно.
+"""
+import logging
+import os
+import threading
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+SQLITE_PRAGMAS = ('journal_mode', 'busy_timeout', 'synchronous', 'mmap_size', 'cache_size', 'temp_store')
+
+
+def is_sqlite(uri):
+    return make_url(uri).get_backend_name() == 'sqlite'
+
+
+def normalize_url(uri):
+    """postgres:// (Heroku, docker) -> postgresql://: SQLAlchemy 2.0 не принимает старую схему"""
+    if isinstance(uri, str) and uri.startswith('postgres://'):
+        return 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
+def postgresql_connect_args(config, uri=None):
+    """Таймауты подключения и запросов для libpq
+
+    Параметр options из URL (например, -csearch_path=...) сохраняется:
+    connect_args заменили бы его целиком.
+    """
+    options = []
+    url_options = make_url(uri).query.get('options') if uri else None
+    if url_options:
+        options.append(url_options if isinstance(url_options, str) else ' '.join(url_options))
+    if config.get('DB_STATEMENT_TIMEOUT_MS'):
+        options.append(f"-c statement_timeout={int(config['DB_STATEMENT_TIMEOUT_MS'])}")
+    if config.get('DB_LOCK_TIMEOUT_MS'):
+        options.append(f"-c lock_timeout={int(config['DB_LOCK_TIMEOUT_MS'])}")
+    connect_args = {'application_name': config.get('DB_APPLICATION_NAME', 'students')}
+    if config.get('DB_CONNECT_TIMEOUT'):
+        connect_args['connect_timeout'] = int(config['DB_CONNECT_TIMEOUT'])
+    if options:
+        connect_args['options'] = ' '.join(options)
+    return connect_args
+
+
+def engine_options(config, uri=None):
+    """Параметры create_engine для URI (по умолчанию - основной базы)"""
+    uri = uri or config['SQLALCHEMY_DATABASE_URI']
+    if is_sqlite(uri):
+        options = {
+            'pool_size': config.get('DB_POOL_SIZE') or 5,
+            'max_overflow': config.get('DB_MAX_OVERFLOW', 10),
+            'pool_timeout': config.get('DB_POOL_TIMEOUT', 30),
+            # Соединение переходит между потоками gthread-воркера через пул
+            'connect_args': {
+                'timeout': config.get('SQLITE_BUSY_TIMEOUT_MS', 5000) / 1000.0,
+                'check_same_thread': False
+            }
+        }
+        if make_url(uri).database in (None, '', ':memory:'):
+            # In-memory база живёт в одном соединении: пул по умолчанию
+            options = {'connect_args': {'check_same_thread': False}}
+        return options
+
+    options = {
+        'poolclass': QueuePool,
+        'pool_size': config.get('DB_POOL_SIZE') or 10,
+        'max_overflow': config.get('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': config.get('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': True
+    }
+    if make_url(uri).get_backend_name() == 'postgresql':
+        options['connect_args'] = postgresql_connect_args(config, uri)
+    return options
+
+
+class DatabaseProfile:
+    def __init__(self, app=None):
+        self.pragmas = {}
+        self.optimize_interval = 0
+        self._hooked = False
+        self._lock = threading.Lock()
+        self._engines = []
+        self._optimizer = None
+        self._optimizer_pid = None
+        self._stop = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config['SQLALCHEMY_DATABASE_URI'] = normalize_url(app.config['SQLALCHEMY_DATABASE_URI'])
+        app.config['DATABASE_READ_URL'] = normalize_url(app.config.get('DATABASE_READ_URL'))
+        app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+        if not app.config['SQLALCHEMY_ENGINE_OPTIONS']:
+            app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+
+        self.pragmas = {
+            'journal_mode': app.config.get('SQLITE_JOURNAL_MODE', 'WAL'),
+            'busy_timeout': int(app.config.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+            'synchronous': app.config.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+            'mmap_size': int(app.config.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+            # Отрицательное значение - размер в КиБ, а не в страницах
+            'cache_size': -int(app.config.get('SQLITE_CACHE_SIZE_KB', 64 * 1024)),
+            'temp_store': 'MEMORY'
+        }
+        self.optimize_interval = app.config.get('SQLITE_OPTIMIZE_INTERVAL', 3600)
+        app.extensions['db_profile'] = self
+
+        if not self._hooked:
+            event.listen(Engine, 'connect', self._on_connect)
+            self._hooked = True
+
+    # =============================================
+    # ПРАГМЫ
+    # =============================================
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        if type(dbapi_connection).__module__.split('.')[0] not in ('sqlite3', 'pysqlite2'):
+            return
+        cursor = dbapi_connection.cursor()
+        try:
+            for name in SQLITE_PRAGMAS:
+                value = self.pragmas.get(name)
+                if value is None or value == '':
+                    continue
+                if name == 'journal_mode':
+                    # Режим журнала хранится в файле; соединения пула чтения (mode=ro) не могут его менять
+                    cursor.execute('PRAGMA journal_mode')
+                    if str(cursor.fetchone()[0]).lower() == str(value).lower():
+                        continue
+                try:
+                    cursor.execute(f'PRAGMA {name}={value}')
+                except Exception as e:
+                    # WAL недоступен, например, на сетевой ФС: работаем с настройками по умолчанию
+                    logger.warning(f'PRAGMA {name}={value} не применена: {e}')
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def current_pragmas(connection):
+        """Фактические значения прагм на соединении SQLAlchemy"""
+        return {name: connection.execute(text(f'PRAGMA {name}')).scalar() for name in SQLITE_PRAGMAS}
+
+    # =============================================
+    # PRAGMA OPTIMIZE
+    # =============================================
+
+    def schedule_optimize(self, engine):
+        """Периодический PRAGMA optimize в текущем процессе (после fork - заново)"""
+        if engine.dialect.name != 'sqlite' or not self.optimize_interval:
+            return
+        with self._lock:
+            if self._optimizer_pid != os.getpid():
+                self._engines = []
+                self._optimizer = None
+                self._stop = threading.Event()
+            if engine not in self._engines:
+                self._engines.append(engine)
+            if self._optimizer is None or not self._optimizer.is_alive():
+                self._optimizer_pid = os.getpid()
+                self._optimizer = threading.Thread(target=self._run_optimizer, name='sqlite-optimize', daemon=True)
+                self._optimizer.start()
+
+    def _run_optimizer(self):
+        while not self._stop.wait(self.optimize_interval):
+            for engine in list(self._engines):
+                try:
+                    optimize(engine)
+                except Exception as e:
+                    logger.warning(f'PRAGMA optimize не выполнен: {e}')
+
+    def stop(self):
+        self._stop.set()
+
+
+def optimize(engine):
+    """PRAGMA optimize: обновляет статистику планировщика там, где она устарела"""
+    if engine.dialect.name != 'sqlite':
+        return
+    with engine.connect() as conn:
+        conn.execute(text('PRAGMA optimize'))
+        conn.commit()
+
+
+db_profile = DatabaseProfile()
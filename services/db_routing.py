@@ -0,0 +1,124 @@
+# services/db_routing.py
+"""Маршрутизация сессии: чтение отчётов через отдельный пул только для чтения.
+
+Маршруты, помеченные @read_only (аналитика, статистика, экспорт), читают
+через отдельный движок с привязкой READ_BIND_KEY: для SQLite это тот же
+файл, открытый как URI с mode=ro, для серверной СУБД - реплика из
+DATABASE_READ_URL. Запись (flush сессии, INSERT/UPDATE/DELETE) всегда
+идёт в основной движок, поэтому журнал действий из таких маршрутов
+продолжает работать.
+
+Пул чтения настраивается отдельно (DB_READ_POOL_SIZE), и длинный отчёт
+не занимает соединения, нужные старостам для записи пропусков. Остальные
+параметры пула и таймауты те же, что у основного движка (engine_options).
+"""
+import functools
+
+from flask import g, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+from services.db_profile import engine_options
+
+READ_BIND_KEY = '__read__'
+
+
+def read_url(config):
+    """URL движка чтения или None, если маршрутизация не нужна"""
+    explicit = config.get('DATABASE_READ_URL')
+    if explicit:
+        return explicit
+
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+        return None
+
+    # sqlite:///students.db -> sqlite:///file:students.db?mode=ro&uri=true
+    database = url.database if url.query.get('uri') else f'file:{url.database}'
+    return url.set(database=database).update_query_dict({'mode': 'ro', 'uri': 'true'}).render_as_string(
+        hide_password=False)
+
+
+def read_only(view):
+    """Маршрут только читает: запросы идут в пул чтения"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g._db_read_only = True
+        return view(*args, **kwargs)
+    wrapper.read_only = True
+    return wrapper
+
+
+def _read_requested():
+    return has_request_context() and g.get('_db_read_only', False)
+
+
+def _is_write(clause):
+    return clause is not None and getattr(clause, 'is_dml', False)
+
+
+class RoutingSession(Session):
+    """Сессия Flask-SQLAlchemy с выбором движка чтения в маршрутах @read_only"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not _is_write(clause) and _read_requested():
+            engine = self._db.engines.get(READ_BIND_KEY)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _query_only(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute('PRAGMA query_only=1')
+    finally:
+        cursor.close()
+
+
+def _read_only_transactions(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute('SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY')
+    finally:
+        cursor.close()
+    dbapi_connection.commit()
+
+
+class ReadRouting:
+    def __init__(self, app=None):
+        self.enabled = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Вызывается до db.init_app(): добавляет привязку движка чтения"""
+        app.extensions['db_routing'] = self
+        url = read_url(app.config) if app.config.get('DB_READ_ROUTING', True) else None
+        self.enabled = url is not None
+        if not self.enabled:
+            return
+
+        options = dict(engine_options(app.config, url), url=url)
+        pool_size = app.config.get('DB_READ_POOL_SIZE')
+        if pool_size:
+            options['pool_size'] = pool_size
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds.setdefault(READ_BIND_KEY, options)
+        app.config['SQLALCHEMY_BINDS'] = binds
+
+    def engine(self, db):
+        return db.engines.get(READ_BIND_KEY) if self.enabled else None
+
+    def setup_engine(self, db):
+        """Запрет записи на соединениях пула чтения"""
+        engine = self.engine(db)
+        if engine is None:
+            return
+        listener = {'sqlite': _query_only, 'postgresql': _read_only_transactions}.get(engine.dialect.name)
+        if listener is not None and not event.contains(engine, 'connect', listener):
+            event.listen(engine, 'connect', listener)
+
+
+read_routing = ReadRouting()
@@ -0,0 +1,78 @@
+# services/identity_cache.py
+"""Кэш пользователей для Flask-Login user_loader.
+
+Вместо SELECT на каждый запрос храним снимок колонок User в памяти
+процесса и присоединяем его к сессии запроса через merge(load=False)
+без обращения к БД. Записи живут USER_CACHE_TTL секунд.
+
+Снимок - объект ORM, поэтому хранилище всегда в памяти процесса
+(MemoryBackend из services/cache.py), независимо от CACHE_BACKEND.
+Зато каждая запись помечена штампом пространства 'identity' общего
+кэша: коммит, изменивший users (настройки, пароль, подтверждение,
+отклонение, удаление, в том числе query.update()), обновляет штамп,
+и записи с прежним штампом не читаются ни в одном воркере - не позже
+чем через CACHE_VERSION_CHECK секунд.
+"""
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from db import db
+from models.user import User
+from services.cache import MISSING, MemoryBackend, cache
+from services.metrics import cache_requests
+
+
+class IdentityCache:
+    def __init__(self, app=None):
+        self.ttl = 30
+        self.maxsize = 1024
+        self._entries = MemoryBackend(self.maxsize)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('USER_CACHE_TTL', 30)
+        self.maxsize = app.config.get('USER_CACHE_SIZE', 1024)
+        self._entries = MemoryBackend(self.maxsize)
+        cache.track(User, 'identity')
+        app.extensions['identity_cache'] = self
+
+    def load(self, user_id):
+        """Возвращает пользователя, присоединённого к текущей сессии"""
+        # Штамп берётся до чтения: изменение во время загрузки не закэшируется
+        stamp = cache.version('identity')
+        entry = self._entries.get(user_id)
+        if entry is not MISSING and entry[0] == stamp:
+            cache_requests.inc(cache='identity', result='hit')
+            return db.session.merge(entry[1], load=False)
+
+        cache_requests.inc(cache='identity', result='miss')
+
+        user = db.session.get(User, user_id)
+        if user is not None and self.ttl > 0:
+            self._entries.set(user_id, (stamp, self._snapshot(user)), self.ttl)
+        return user
+
+    def invalidate(self, user_id=None):
+        """Сбрасывает одного пользователя или весь кэш"""
+        if user_id is None:
+            self._entries.clear()
+        else:
+            self._entries.delete(user_id)
+
+    @staticmethod
+    def _snapshot(user):
+        """Отсоединённая копия колонок пользователя без связи с сессией"""
+        data = {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs}
+        copy = User(**data)
+        make_transient_to_detached(copy)
+        return copy
+
+
+identity_cache = IdentityCache()
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_user(mapper, connection, target):
+    identity_cache.invalidate(target.id)
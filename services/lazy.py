@@ -0,0 +1,55 @@
+# services/lazy.py
+"""Отложенный импорт тяжёлых зависимостей.
+
+pandas, openai и reportlab нужны только экспорту, импорту и ассистенту,
+numpy - только колоночному хранилищу аналитики, но при импорте на уровне модуля их загрузку оплачивает каждый воркер
+при старте. Прокси LazyModule импортирует модуль при первом обращении
+к атрибуту:
+
+    from services.lazy import pandas as pd
+    df = pd.DataFrame(rows)   # здесь pandas и загружается
+"""
+import importlib
+import sys
+import threading
+
+
+class LazyModule:
+    __slots__ = ('_name', '_module', '_lock')
+
+    def __init__(self, name):
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_module', None)
+        object.__setattr__(self, '_lock', threading.Lock())
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            with self._lock:
+                module = self._module
+                if module is None:
+                    module = importlib.import_module(self._name)
+                    object.__setattr__(self, '_module', module)
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = 'загружен' if self._module is not None else 'не загружен'
+        return f'<LazyModule {self._name} ({state})>'
+
+    @property
+    def loaded(self):
+        return self._module is not None or self._name in sys.modules
+
+
+pandas = LazyModule('pandas')
+openai = LazyModule('openai')
+numpy = LazyModule('numpy')
@@ -0,0 +1,203 @@
+# services/limiter.py
+"""Ограничение одновременных тяжёлых запросов по классам маршрутов.
+
+Экспорт, импорт и запросы к Ollama занимают поток воркера на секунды;
+несколько таких запросов подряд - и на лёгкие страницы (отметка
+пропусков, списки) не остаётся потоков. Маршрут помечается классом:
+
+    @limit_concurrency('export')
+
+У каждого класса свой семафор (CONCURRENCY_LIMITS) и короткая очередь
+ожидания (CONCURRENCY_QUEUE). Если очередь заполнена - сразу 429, если
+место не освободилось за CONCURRENCY_WAIT секунд - 503; оба ответа с
+заголовком Retry-After. Ожидающий запрос тоже занимает поток, поэтому
+лимиты вместе с очередями всех классов должны оставлять потоки
+(WORKER_THREADS) для остальных маршрутов: без явных CONCURRENCY_LIMITS и
+CONCURRENCY_QUEUE они выводятся из числа потоков (plan_limits), а
+явные значения, занимающие все потоки, останавливают запуск.
+
+Лимиты действуют в пределах процесса: при нескольких воркерах gunicorn
+общий предел - лимит, умноженный на WEB_CONCURRENCY.
+"""
+import functools
+import threading
+import time
+
+from flask import jsonify, make_response, request
+from markupsafe import escape
+
+from services.metrics import (concurrency_active, concurrency_queue_depth, concurrency_queue_wait,
+                              concurrency_rejected, registry)
+
+QUEUE_FULL = 429
+TIMED_OUT = 503
+
+DEFAULT_LIMITS = {'export': 2, 'import': 1, 'ollama': 1}
+
+
+def parse_limits(value):
+    """'export=2,import=1' -> {'export': 2, 'import': 1}"""
+    if isinstance(value, dict):
+        return {name: int(limit) for name, limit in value.items()}
+    limits = {}
+    for item in (value or '').split(','):
+        name, _, limit = item.partition('=')
+        if name.strip() and limit.strip():
+            limits[name.strip()] = int(limit)
+    return limits
+
+
+def plan_limits(threads, limits=None, queue_size=None):
+    """Лимиты и размер очереди, при которых свободен хотя бы один поток
+
+    Лимиты по умолчанию уменьшаются до половины потоков (но не ниже 1
+    на класс), очередь по умолчанию делит оставшиеся потоки между
+    классами; если потоков не больше, чем классов, ограничение
+    отключается. Явно заданные значения только проверяются.
+    """
+    if limits is None:
+        if threads <= len(DEFAULT_LIMITS):
+            return {}, 0
+        limits = dict(DEFAULT_LIMITS)
+        while sum(limits.values()) > max(len(limits), threads // 2):
+            largest = max(limits, key=limits.get)
+            if limits[largest] == 1:
+                break
+            limits[largest] -= 1
+    limits = {name: limit for name, limit in parse_limits(limits).items() if limit > 0}
+    if queue_size is None:
+        spare = threads - 1 - sum(limits.values())
+        queue_size = max(0, spare // len(limits)) if limits else 0
+
+    occupied = sum(limits.values()) + queue_size * len(limits)
+    if limits and occupied >= threads:
+        raise ValueError(
+            f'CONCURRENCY_LIMITS и CONCURRENCY_QUEUE занимают {occupied} потоков из {threads} '
+            f'(WORKER_THREADS): для остальных маршрутов не остаётся потоков')
+    return limits, queue_size
+
+
+class _Class:
+    """Семафор класса маршрутов с ограниченной очередью ожидания"""
+
+    def __init__(self, name, limit, queue_size, wait):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.wait = wait
+        self.active = 0
+        self.waiting = 0
+        self.rejected = {QUEUE_FULL: 0, TIMED_OUT: 0}
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """None - место получено, иначе HTTP-статус отказа"""
+        with self._cond:
+            if self.active < self.limit:
+                self.active += 1
+                return None
+            if self.waiting >= self.queue_size:
+                self.rejected[QUEUE_FULL] += 1
+                return QUEUE_FULL
+
+            self.waiting += 1
+            started = time.monotonic()
+            deadline = started + self.wait
+            try:
+                while self.active >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected[TIMED_OUT] += 1
+                        return TIMED_OUT
+                    self._cond.wait(remaining)
+                self.active += 1
+                return None
+            finally:
+                self.waiting -= 1
+                concurrency_queue_wait.observe(time.monotonic() - started, **{'class': self.name})
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                'name': self.name,
+                'limit': self.limit,
+                'queue_size': self.queue_size,
+                'active': self.active,
+                'waiting': self.waiting,
+                'rejected_queue_full': self.rejected[QUEUE_FULL],
+                'rejected_timeout': self.rejected[TIMED_OUT],
+            }
+
+
+class ConcurrencyLimiter:
+    def __init__(self):
+        self._classes = {}
+        self.retry_after = 5
+
+    def init_app(self, app):
+        limits, queue_size = plan_limits(app.config.get('WORKER_THREADS', 8),
+                                         app.config.get('CONCURRENCY_LIMITS'),
+                                         app.config.get('CONCURRENCY_QUEUE'))
+        wait = app.config.get('CONCURRENCY_WAIT', 5.0)
+        self.retry_after = app.config.get('CONCURRENCY_RETRY_AFTER', 5)
+        self._classes = {name: _Class(name, limit, queue_size, wait) for name, limit in limits.items()}
+        app.extensions['limiter'] = self
+
+    def summary(self):
+        return [self._classes[name].snapshot() for name in sorted(self._classes)]
+
+    def update_metrics(self):
+        for item in self.summary():
+            concurrency_active.set(item['active'], **{'class': item['name']})
+            concurrency_queue_depth.set(item['waiting'], **{'class': item['name']})
+
+    def limit(self, name, methods=None):
+        """Декоратор: не больше CONCURRENCY_LIMITS[name] одновременных вызовов"""
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                slot = self._classes.get(name)
+                if slot is None or (methods and request.method not in methods):
+                    return view(*args, **kwargs)
+
+                status = slot.acquire()
+                if status is not None:
+                    reason = 'queue_full' if status == QUEUE_FULL else 'timeout'
+                    concurrency_rejected.inc(**{'class': name, 'reason': reason})
+                    return self._rejection(status)
+                try:
+                    return view(*args, **kwargs)
+                finally:
+                    slot.release()
+            return wrapper
+        return decorator
+
+    def _rejection(self, status):
+        message = ('Сервер занят обработкой тяжёлых запросов. Повторите попытку через '
+                   f'{self.retry_after} с.')
+        if _wants_json():
+            response = make_response(jsonify({'error': message, 'retry_after': self.retry_after}), status)
+        else:
+            back = escape(request.referrer or request.path)
+            response = make_response(
+                f'<!doctype html><meta charset="utf-8"><title>Сервер занят</title>'
+                f'<p>{escape(message)}</p><p><a href="{back}">Вернуться</a></p>', status)
+        response.headers['Retry-After'] = str(self.retry_after)
+        return response
+
+
+def _wants_json():
+    if '/api/' in request.path or request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return True
+    best = request.accept_mimetypes.best_match(['application/json', 'text/html'])
+    return best == 'application/json' and request.accept_mimetypes[best] > request.accept_mimetypes['text/html']
+
+
+limiter = ConcurrencyLimiter()
+registry.add_collector(limiter.update_metrics)
+limit_concurrency = limiter.limit
@@ -0,0 +1,488 @@
+# services/metrics.py
+"""Метрики в текстовом формате Prometheus без внешних зависимостей.
+
+Счётчики, gauge и гистограммы с метками хранятся в памяти процесса;
+/metrics отдаёт их снимок (см. routes/metrics_routes.py).
+
+Под gunicorn у каждого воркера свои значения, а запрос /metrics попадает
+в случайный воркер. Поэтому воркеры сбрасывают снимки в общий каталог
+(METRICS_DIR, см. MultiprocessMetrics), и /metrics отдаёт их сумму:
+счётчики и гистограммы складываются (включая завершившиеся воркеры,
+чтобы суммы не убывали при перезапуске), gauge выводятся по каждому
+живому воркеру с меткой worker="<pid>".
+"""
+import fcntl
+import functools
+import glob
+import json
+import os
+import threading
+import time
+
+from flask import request
+from sqlalchemy import event
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+    def snapshot(self):
+        """Значения для сброса в файл: [[метки, значение], ...]"""
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def collect(self, values=None, label_names=None):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def collect(self, values=None, label_names=None):
+        if values is None:
+            with self._lock:
+                values = dict(self._values)
+        label_names = label_names or self.label_names
+        return self.header() + [
+            f'{self.name}{_format_labels(label_names, key)} {_format_value(value)}'
+            for key, value in values.items()
+        ]
+
+    @staticmethod
+    def merge(total, value):
+        return (total or 0) + value
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), [list(e[0]), e[1], e[2]]] for key, e in self._values.items()]
+
+    @staticmethod
+    def merge(total, value):
+        if total is None:
+            return [list(value[0]), value[1], value[2]]
+        return [[a + b for a, b in zip(total[0], value[0])], total[1] + value[1], total[2] + value[2]]
+
+    def collect(self, values=None, label_names=None):
+        if values is None:
+            with self._lock:
+                values = {key: (list(e[0]), e[1], e[2]) for key, e in self._values.items()}
+        label_names = label_names or self.label_names
+        lines = self.header()
+        for key, (counts, total, count) in values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f'{self.name}_bucket{_format_labels(label_names, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(label_names, key)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(label_names, key)} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, documentation, labels=()):
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self._register(Gauge(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def add_collector(self, func):
+        """Функция, обновляющая gauge непосредственно перед выдачей"""
+        self._collectors.append(func)
+        return func
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def run_collectors(self):
+        for collector in self._collectors:
+            collector()
+
+    def snapshot(self):
+        self.run_collectors()
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+    def render(self):
+        if multiprocess.enabled:
+            return multiprocess.render()
+        self.run_collectors()
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+    def render_merged(self, snapshots):
+        """Текст /metrics по снимкам воркеров: [(pid, жив ли, снимок)]"""
+        lines = []
+        for metric in self._metrics:
+            merged = {}
+            for pid, alive, snapshot in snapshots:
+                for key, value in snapshot.get(metric.name, ()):
+                    key = tuple(key)
+                    if metric.kind == 'gauge':
+                        if alive:
+                            merged[key + (pid,)] = value
+                    else:
+                        merged[key] = metric.merge(merged.get(key), value)
+            label_names = metric.label_names + ('worker',) if metric.kind == 'gauge' else None
+            lines.extend(metric.collect(merged, label_names))
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MultiprocessMetrics:
+    """Обмен снимками метрик между воркерами gunicorn через каталог METRICS_DIR
+
+    Фоновый поток воркера переписывает его снимок в <pid>.json раз в
+    FLUSH_INTERVAL секунд, воркер, отвечающий на /metrics, - перед
+    выдачей. При завершении воркера его счётчики добавляются в
+    _dead.json, а файл удаляется. Включается в init_worker после fork.
+    """
+
+    FLUSH_INTERVAL = 1.0
+    DEAD_FILE = '_dead.json'
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.directory = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    @property
+    def enabled(self):
+        return self.directory is not None
+
+    def enable(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._stop.clear()
+        threading.Thread(target=self._run, name='metrics-flush', daemon=True).start()
+
+    def _run(self):
+        while not self._stop.wait(self.FLUSH_INTERVAL):
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    @staticmethod
+    def clear(directory):
+        """Удаляет снимки прошлого запуска (вызывается в мастере до fork)"""
+        for path in glob.glob(os.path.join(directory, '*.json*')):
+            os.remove(path)
+
+    def _path(self, name=None):
+        return os.path.join(self.directory, name or f'{os.getpid()}.json')
+
+    def flush(self):
+        with self._lock:
+            if not self.enabled:
+                return
+            path = self._path()
+            tmp = f'{path}.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self.registry.snapshot(), f)
+            os.replace(tmp, path)
+
+    def _read(self, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def mark_dead(self):
+        """Переносит счётчики завершающегося воркера в _dead.json"""
+        self._stop.set()
+        with self._lock:
+            if self.enabled:
+                self._fold_into_dead(self.registry.snapshot())
+                try:
+                    os.remove(self._path())
+                except FileNotFoundError:
+                    pass
+                self.directory = None
+
+    def _fold_into_dead(self, snapshot):
+        with open(self._path('_dead.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            dead = self._read(self._path(self.DEAD_FILE))
+            merged = {}
+            for metric in self.registry._metrics:
+                if metric.kind == 'gauge':
+                    continue
+                values = {tuple(key): value for key, value in dead.get(metric.name, ())}
+                for key, value in snapshot.get(metric.name, ()):
+                    values[tuple(key)] = metric.merge(values.get(tuple(key)), value)
+                merged[metric.name] = [[list(key), value] for key, value in values.items()]
+            tmp = self._path(f'{self.DEAD_FILE}.tmp')
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(merged, f)
+            os.replace(tmp, self._path(self.DEAD_FILE))
+
+    def render(self):
+        self.flush()
+        snapshots = []
+        for path in sorted(glob.glob(os.path.join(self.directory, '*.json'))):
+            name = os.path.basename(path)[:-len('.json')]
+            if name == self.DEAD_FILE[:-len('.json')]:
+                snapshots.append(('dead', False, self._read(path)))
+            elif name.isdigit():
+                pid = int(name)
+                snapshots.append((name, pid == os.getpid() or _pid_alive(pid), self._read(path)))
+        return self.registry.render_merged(snapshots)
+
+
+multiprocess = MultiprocessMetrics(registry)
+
+
+def metrics_dir(app):
+    return app.config.get('METRICS_DIR') or os.path.join(app.instance_path, 'metrics')
+
+# === HTTP ===
+http_requests = registry.counter(
+    'http_requests_total', 'Обработано HTTP-запросов', ('blueprint', 'endpoint', 'status'))
+http_request_duration = registry.histogram(
+    'http_request_duration_seconds', 'Время обработки HTTP-запроса', ('blueprint', 'endpoint'))
+http_in_flight = registry.gauge(
+    'http_requests_in_flight', 'HTTP-запросы в обработке')
+
+# === База данных ===
+db_checkout_wait = registry.histogram(
+    'db_pool_checkout_wait_seconds', 'Ожидание соединения из пула',
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0))
+db_pool_checked_out = registry.gauge(
+    'db_pool_checked_out', 'Соединений выдано из пула')
+db_errors = registry.counter(
+    'db_errors_total', 'Ошибки драйвера БД', ('kind',))
+
+# === Фоновые и тяжёлые операции ===
+job_duration = registry.histogram(
+    'job_duration_seconds', 'Длительность экспорта/импорта', ('job',))
+job_errors = registry.counter(
+    'job_errors_total', 'Ошибки экспорта/импорта', ('job',))
+ollama_duration = registry.histogram(
+    'ollama_request_duration_seconds', 'Время ответа Ollama')
+ollama_errors = registry.counter(
+    'ollama_errors_total', 'Ошибки обращения к Ollama')
+
+# === Ограничение нагрузки ===
+concurrency_active = registry.gauge(
+    'concurrency_active', 'Выполняющиеся запросы класса', ('class',))
+concurrency_queue_depth = registry.gauge(
+    'concurrency_queue_depth', 'Запросы класса в очереди ожидания', ('class',))
+concurrency_queue_wait = registry.histogram(
+    'concurrency_queue_wait_seconds', 'Ожидание места в очереди класса', ('class',),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+concurrency_rejected = registry.counter(
+    'concurrency_rejected_total', 'Отклонённые запросы (queue_full - 429, timeout - 503)', ('class', 'reason'))
+
+# === Кэши ===
+cache_requests = registry.counter(
+    'cache_requests_total', 'Обращения к кэшам', ('cache', 'result'))
+cache_hit_ratio = registry.gauge(
+    'cache_hit_ratio', 'Доля попаданий в кэш', ('cache',))
+cache_errors = registry.counter(
+    'cache_errors_total', 'Ошибки хранилища кэша', ('backend',))
+singleflight_waits = registry.counter(
+    'singleflight_waits_total', 'Запросы, дождавшиеся чужого вычисления', ('cache', 'scope'))
+absence_store_rows = registry.gauge(
+    'absence_store_rows', 'Пропусков в колоночном хранилище воркера')
+absence_store_refresh = registry.histogram(
+    'absence_store_refresh_seconds', 'Обновление колоночного хранилища', ('kind',))
+
+
+@registry.add_collector
+def _update_hit_ratios():
+    caches = {key[0] for key in list(cache_requests._values)}
+    for cache in caches:
+        hits = cache_requests.value(cache=cache, result='hit')
+        total = hits + cache_requests.value(cache=cache, result='miss')
+        cache_hit_ratio.set(hits / total if total else 0.0, cache=cache)
+
+
+def track_job(job, methods=None):
+    """Декоратор: длительность и ошибки экспорта/импорта (только для указанных HTTP-методов)"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if methods and request.method not in methods:
+                return view(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return view(*args, **kwargs)
+            except Exception:
+                job_errors.inc(job=job)
+                raise
+            finally:
+                job_duration.observe(time.perf_counter() - started, job=job)
+        return wrapper
+    return decorator
+
+
+def classify_db_error(exc):
+    """Вид ошибки БД для метки kind: locked, timeout, integrity, other"""
+    message = str(exc).lower()
+    if 'database is locked' in message or 'database table is locked' in message:
+        return 'locked'
+    if 'timeout' in message or 'canceling statement' in message:
+        return 'timeout'
+    if 'constraint' in message or 'unique' in message or 'integrity' in message:
+        return 'integrity'
+    return 'other'
+
+
+def _on_db_error(context):
+    db_errors.inc(kind=classify_db_error(context.original_exception))
+
+
+def instrument_pool(engine):
+    """Замер ожидания соединения из пула движка и счётчик ошибок драйвера"""
+    if not event.contains(engine, 'handle_error', _on_db_error):
+        event.listen(engine, 'handle_error', _on_db_error)
+
+    pool = engine.pool
+    if getattr(pool, '_metrics_instrumented', False):
+        return
+    original_connect = pool.connect
+
+    def connect():
+        started = time.perf_counter()
+        try:
+            return original_connect()
+        finally:
+            db_checkout_wait.observe(time.perf_counter() - started)
+
+    pool.connect = connect
+    pool._metrics_instrumented = True
+
+    @registry.add_collector
+    def _update_pool():
+        checked_out = getattr(engine.pool, 'checkedout', None)
+        if callable(checked_out):
+            db_pool_checked_out.set(checked_out())
+
+
+class RequestMetrics:
+    """Хуки Flask для HTTP-метрик"""
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+        app.after_request(self._after_request)
+
+    @staticmethod
+    def _before_request():
+        request.environ['metrics.started'] = time.perf_counter()
+        http_in_flight.inc()
+
+    @staticmethod
+    def _after_request(response):
+        request.environ['metrics.status'] = response.status_code
+        return response
+
+    @staticmethod
+    def _teardown_request(exc):
+        started = request.environ.pop('metrics.started', None)
+        if started is None:
+            return
+        http_in_flight.dec()
+        labels = {'blueprint': request.blueprint or '', 'endpoint': request.endpoint or 'unknown'}
+        http_request_duration.observe(time.perf_counter() - started, **labels)
+        status = request.environ.pop('metrics.status', 500 if exc else 200)
+        http_requests.inc(status=status, **labels)
+
+
+request_metrics = RequestMetrics()
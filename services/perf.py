@@ -0,0 +1,153 @@
+# services/perf.py
+"""Инструментирование запросов: число SQL-запросов, время БД, рендер шаблонов.
+
+Для каждого запроса собирается статистика в flask.g, отдаётся браузеру
+в заголовке Server-Timing и складывается в кольцевой буфер по эндпоинту.
+Страница /dashboard/perf показывает перцентили по маршрутам.
+"""
+import threading
+import time
+from collections import defaultdict, deque
+
+from flask import g, has_request_context, request, template_rendered, before_render_template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+def percentile(values, pct):
+    """Перцентиль по методу ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class RequestStats:
+    __slots__ = ('started', 'queries', 'db_time', 'render_time', '_render_started', '_query_started')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self._render_started = None
+        self._query_started = None
+
+
+class PerfMonitor:
+    def __init__(self, app=None):
+        self.enabled = True
+        self.samples = 500
+        self._routes = defaultdict(lambda: deque(maxlen=self.samples))
+        self._lock = threading.Lock()
+        self._engine_hooked = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('PERF_ENABLED', True)
+        self.samples = app.config.get('PERF_SAMPLES', 500)
+        app.extensions['perf_monitor'] = self
+        if not self.enabled:
+            return
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+
+        if not self._engine_hooked:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._engine_hooked = True
+
+    # =============================================
+    # ТЕКУЩИЙ ЗАПРОС
+    # =============================================
+
+    @staticmethod
+    def current():
+        """Статистика текущего запроса или None вне запроса"""
+        if has_request_context():
+            return g.get('_perf_stats')
+        return None
+
+    def _before_request(self):
+        g._perf_stats = RequestStats()
+
+    def _after_request(self, response):
+        stats = g.pop('_perf_stats', None)
+        if stats is None:
+            return response
+
+        total = time.perf_counter() - stats.started
+        response.headers.add('Server-Timing', (
+            f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries", '
+            f'tpl;dur={stats.render_time * 1000:.1f}, '
+            f'total;dur={total * 1000:.1f}'
+        ))
+
+        endpoint = request.endpoint or 'unknown'
+        with self._lock:
+            self._routes[endpoint].append((total, stats.db_time, stats.render_time, stats.queries))
+        return response
+
+    def _before_render(self, sender, template, context, **extra):
+        stats = self.current()
+        if stats is not None:
+            stats._render_started = time.perf_counter()
+
+    def _after_render(self, sender, template, context, **extra):
+        stats = self.current()
+        if stats is not None and stats._render_started is not None:
+            stats.render_time += time.perf_counter() - stats._render_started
+            stats._render_started = None
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        stats = self.current()
+        if stats is not None:
+            stats._query_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        stats = self.current()
+        if stats is not None and stats._query_started is not None:
+            stats.queries += 1
+            stats.db_time += time.perf_counter() - stats._query_started
+            stats._query_started = None
+
+    # =============================================
+    # СВОДКА
+    # =============================================
+
+    def summary(self):
+        """Перцентили по эндпоинтам, самые медленные (p95) первыми"""
+        with self._lock:
+            routes = {endpoint: list(samples) for endpoint, samples in self._routes.items()}
+
+        rows = []
+        for endpoint, samples in routes.items():
+            totals = [s[0] * 1000 for s in samples]
+            db_times = [s[1] * 1000 for s in samples]
+            render_times = [s[2] * 1000 for s in samples]
+            queries = [s[3] for s in samples]
+            rows.append({
+                'endpoint': endpoint,
+                'count': len(samples),
+                'p50': percentile(totals, 50),
+                'p95': percentile(totals, 95),
+                'p99': percentile(totals, 99),
+                'db_p50': percentile(db_times, 50),
+                'db_p95': percentile(db_times, 95),
+                'render_p95': percentile(render_times, 95),
+                'queries_p50': percentile(queries, 50),
+                'queries_max': max(queries) if queries else 0
+            })
+        return sorted(rows, key=lambda r: r['p95'], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+
+perf_monitor = PerfMonitor()
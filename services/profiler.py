@@ -0,0 +1,239 @@
+# services/profiler.py
+"""Профилирование живых запросов по требованию администратора.
+
+Администратор на странице /dashboard/perf «взводит» профилировщик на
+следующие N запросов к выбранному эндпоинту либо выпускает подписанный
+токен: запрос с заголовком X-Profile-Token профилируется независимо от
+маршрута. Режимы:
+  - cprofile — детерминированный cProfile, результат в .pstats;
+  - sampler  — выборка стека потока запроса с интервалом
+    PROFILE_SAMPLE_INTERVAL, результат в свёрнутых стеках (.folded),
+    готовых для flamegraph.pl / speedscope.
+Файлы складываются в instance/profiles. Счётчики хранятся в памяти
+процесса: при нескольких воркерах запрос попадёт в профиль только
+в том процессе, где профилировщик был взведён (токен работает везде).
+"""
+import cProfile
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import g, request
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+
+MODES = ('cprofile', 'sampler')
+TOKEN_HEADER = 'X-Profile-Token'
+
+_UNSAFE_RE = re.compile(r'[^A-Za-z0-9_.-]+')
+
+
+class StackSampler:
+    """Периодически снимает стек одного потока и считает свёрнутые стеки"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def dump(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+class RequestProfiler:
+    def __init__(self, app=None):
+        self.directory = None
+        self.max_requests = 50
+        self.interval = 0.005
+        self.keep = 100
+        self._serializer = None
+        self._token_max_age = 3600
+        self._armed = {}  # эндпоинт -> {'remaining': N, 'mode': ...}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.directory = app.config.get('PROFILE_DIR') or os.path.join(app.instance_path, 'profiles')
+        self.max_requests = app.config.get('PROFILE_MAX_REQUESTS', 50)
+        self.interval = app.config.get('PROFILE_SAMPLE_INTERVAL', 0.005)
+        self.keep = app.config.get('PROFILE_KEEP', 100)
+        self._token_max_age = app.config.get('PROFILE_TOKEN_MAX_AGE', 3600)
+        self._serializer = URLSafeTimedSerializer(app.config['SECRET_KEY'], salt='request-profiler')
+        app.extensions['request_profiler'] = self
+
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    # =============================================
+    # УПРАВЛЕНИЕ
+    # =============================================
+
+    def arm(self, endpoint, count, mode='cprofile'):
+        """Профилировать следующие count запросов к эндпоинту"""
+        if mode not in MODES:
+            raise ValueError(f'Неизвестный режим профилирования: {mode}')
+        count = max(1, min(int(count), self.max_requests))
+        with self._lock:
+            self._armed[endpoint] = {'remaining': count, 'mode': mode}
+        return count
+
+    def disarm(self, endpoint=None):
+        with self._lock:
+            if endpoint is None:
+                self._armed.clear()
+            else:
+                self._armed.pop(endpoint, None)
+
+    def armed(self):
+        with self._lock:
+            return {endpoint: dict(state) for endpoint, state in self._armed.items()}
+
+    def issue_token(self, mode='cprofile'):
+        """Подписанный токен для заголовка X-Profile-Token"""
+        if mode not in MODES:
+            raise ValueError(f'Неизвестный режим профилирования: {mode}')
+        return self._serializer.dumps({'mode': mode})
+
+    @property
+    def token_max_age(self):
+        return self._token_max_age
+
+    def _token_mode(self):
+        token = request.headers.get(TOKEN_HEADER)
+        if not token or self._serializer is None:
+            return None
+        try:
+            payload = self._serializer.loads(token, max_age=self._token_max_age)
+        except (SignatureExpired, BadSignature):
+            return None
+        mode = payload.get('mode') if isinstance(payload, dict) else None
+        return mode if mode in MODES else None
+
+    def _take(self, endpoint):
+        with self._lock:
+            state = self._armed.get(endpoint)
+            if state is None:
+                return None
+            state['remaining'] -= 1
+            if state['remaining'] <= 0:
+                del self._armed[endpoint]
+            return state['mode']
+
+    # =============================================
+    # ХУКИ ЗАПРОСА
+    # =============================================
+
+    def _before_request(self):
+        mode = self._token_mode()
+        if mode is None and self._armed:
+            mode = self._take(request.endpoint)
+        if mode is None:
+            return
+
+        if mode == 'cprofile':
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # В потоке уже работает другой профилировщик
+                return
+        else:
+            profiler = StackSampler(threading.get_ident(), self.interval)
+            profiler.start()
+        g._request_profile = (mode, profiler, time.perf_counter())
+
+    def _teardown_request(self, exc=None):
+        state = g.pop('_request_profile', None)
+        if state is None:
+            return
+        mode, profiler, started = state
+        if mode == 'cprofile':
+            profiler.disable()
+        else:
+            profiler.stop()
+
+        try:
+            self._save(mode, profiler, time.perf_counter() - started)
+        except OSError:
+            pass
+
+    # =============================================
+    # ФАЙЛЫ
+    # =============================================
+
+    def _save(self, mode, profiler, elapsed):
+        os.makedirs(self.directory, exist_ok=True)
+        endpoint = _UNSAFE_RE.sub('_', request.endpoint or 'unknown')
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        extension = 'pstats' if mode == 'cprofile' else 'folded'
+        name = f'{stamp}_{endpoint}_{int(elapsed * 1000)}ms.{extension}'
+        path = os.path.join(self.directory, name)
+        if mode == 'cprofile':
+            profiler.dump_stats(path)
+        else:
+            profiler.dump(path)
+        self._prune()
+        return name
+
+    def _prune(self):
+        files = sorted(self.profiles(), key=lambda p: p['modified'], reverse=True)
+        for profile in files[self.keep:]:
+            try:
+                os.remove(os.path.join(self.directory, profile['name']))
+            except OSError:
+                pass
+
+    def profiles(self):
+        """Сохранённые профили, новые первыми"""
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+        result = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(('.pstats', '.folded')):
+                continue
+            path = os.path.join(self.directory, name)
+            stat = os.stat(path)
+            result.append({
+                'name': name,
+                'mode': 'cprofile' if name.endswith('.pstats') else 'sampler',
+                'size': stat.st_size,
+                'modified': datetime.fromtimestamp(stat.st_mtime)
+            })
+        return sorted(result, key=lambda p: p['modified'], reverse=True)
+
+    def clear(self):
+        for profile in self.profiles():
+            try:
+                os.remove(os.path.join(self.directory, profile['name']))
+            except OSError:
+                pass
+
+
+request_profiler = RequestProfiler()
@@ -0,0 +1,123 @@
+# services/query_budget.py
+"""Бюджет SQL-запросов на эндпоинт.
+
+Декоратор @query_budget объявляет, сколько SQL-запросов может выполнить
+маршрут для каждой роли. Бюджет не должен зависеть от объёма данных:
+превышение почти всегда означает вернувшийся N+1.
+
+Режим задаётся QUERY_BUDGET_MODE:
+  - raise — превышение приводит к QueryBudgetExceeded (по умолчанию при TESTING);
+  - warn  — предупреждение в журнал приложения (по умолчанию);
+  - off   — проверка отключена.
+benchmark_routes.py сверяет бюджеты на большом синтетическом наборе.
+"""
+import functools
+from contextlib import contextmanager
+
+from flask import current_app, g, has_request_context, request
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+MODES = ('off', 'warn', 'raise')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Маршрут выполнил больше SQL-запросов, чем разрешено бюджетом"""
+
+
+def query_budget(default=None, **roles):
+    """Максимум SQL-запросов на запрос: query_budget(admin=5, curator=6, leader=6)
+
+    default - бюджет для ролей, не перечисленных явно (None - без ограничения).
+    """
+    limits = dict(roles)
+    if default is not None:
+        limits['*'] = default
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if has_request_context():
+                g._query_budget = limits
+            return view(*args, **kwargs)
+        wrapper.query_budget = limits
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def budget_exempt():
+    """Запросы внутри блока не входят в бюджет: разовая загрузка данных воркера,
+    которая не повторяется от запроса к запросу"""
+    count = g.get('_query_count') if has_request_context() else None
+    try:
+        yield
+    finally:
+        if count is not None:
+            g._query_count = count
+
+
+def budget_for(limits, role):
+    if not limits:
+        return None
+    return limits.get(role, limits.get('*'))
+
+
+class QueryBudget:
+    def __init__(self, app=None):
+        self._hooked = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['query_budget'] = self
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        if not self._hooked:
+            event.listen(Engine, 'before_cursor_execute', self._count)
+            self._hooked = True
+
+    @staticmethod
+    def mode():
+        mode = current_app.config.get('QUERY_BUDGET_MODE')
+        if mode not in MODES:
+            mode = 'raise' if current_app.testing else 'warn'
+        return mode
+
+    @staticmethod
+    def budgets(app):
+        """Бюджеты зарегистрированных маршрутов: {эндпоинт: {роль: лимит}}"""
+        return {endpoint: view.query_budget
+                for endpoint, view in app.view_functions.items()
+                if getattr(view, 'query_budget', None)}
+
+    @staticmethod
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and '_query_count' in g:
+            g._query_count += 1
+
+    def _before_request(self):
+        g._query_count = 0
+
+    def _after_request(self, response):
+        limits = g.pop('_query_budget', None)
+        count = g.pop('_query_count', 0)
+        if not limits:
+            return response
+
+        mode = self.mode()
+        role = getattr(current_user, 'role', None) if current_user else None
+        budget = budget_for(limits, role)
+        if mode == 'off' or budget is None or count <= budget:
+            return response
+
+        message = (f'Бюджет SQL-запросов превышен: {request.endpoint} '
+                   f'(роль {role}) - {count} при лимите {budget}')
+        if mode == 'raise':
+            raise QueryBudgetExceeded(message)
+        current_app.logger.warning(message)
+        return response
+
+
+query_budget_guard = QueryBudget()
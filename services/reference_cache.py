@@ -0,0 +1,96 @@
+# services/reference_cache.py
+"""Кэш справочников: группы, кураторы, старосты, ЦМК.
+
+Списки для выпадающих меню форм (регистрация, группы, экспорт) читаются
+из общего кэша (services/cache.py). Каждый справочник - отдельное
+пространство имён; коммит, изменивший соответствующие таблицы, обновляет
+штамп его версии, и список перечитывается при следующем обращении во
+всех воркерах. REFERENCE_CACHE_TTL ограничивает срок жизни записи.
+"""
+from collections import namedtuple
+
+from db import db
+from models.cmk import Cmk
+from models.group import Group
+from models.user import User
+from services.cache import cache
+
+GroupRef = namedtuple('GroupRef', 'id name curator_id leader_id')
+UserRef = namedtuple('UserRef', 'id full_name')
+LeaderRef = namedtuple('LeaderRef', 'id full_name group_name')
+CmkRef = namedtuple('CmkRef', 'id name')
+
+# Какие справочники зависят от какой модели
+DEPENDENCIES = {
+    Group: ('groups', 'leaders'),
+    User: ('curators', 'leaders'),
+    Cmk: ('cmks',),
+}
+
+
+class ReferenceCache:
+    def __init__(self, app=None):
+        self.ttl = 300
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('REFERENCE_CACHE_TTL', 300)
+        app.extensions['reference_cache'] = self
+
+    # =============================================
+    # СПРАВОЧНИКИ
+    # =============================================
+
+    def groups(self):
+        """Все группы по алфавиту"""
+        return self._get('groups', lambda: [
+            GroupRef(*row) for row in db.session.query(
+                Group.id, Group.name, Group.curator_id, Group.leader_id
+            ).order_by(Group.name)
+        ])
+
+    def curators(self):
+        """Подтверждённые кураторы"""
+        return self._get('curators', lambda: [
+            UserRef(*row) for row in db.session.query(User.id, User.full_name).filter(
+                User.role == 'curator', User.is_confirmed == True
+            ).order_by(User.full_name)
+        ])
+
+    def leaders(self):
+        """Подтверждённые старосты с названием группы"""
+        return self._get('leaders', lambda: [
+            LeaderRef(user_id, full_name, group_name or 'Не назначена')
+            for user_id, full_name, group_name in db.session.query(
+                User.id, User.full_name, Group.name
+            ).outerjoin(Group, Group.leader_id == User.id).filter(
+                User.role == 'leader', User.is_confirmed == True
+            ).order_by(User.full_name)
+        ])
+
+    def cmks(self):
+        """Все ЦМК по алфавиту"""
+        return self._get('cmks', lambda: [
+            CmkRef(*row) for row in db.session.query(Cmk.id, Cmk.name).order_by(Cmk.name)
+        ])
+
+    # =============================================
+    # ВЕРСИИ
+    # =============================================
+
+    def bump(self, *kinds):
+        """Обновляет штампы версий справочников, делая кэш устаревшим"""
+        cache.bump(*(f'reference:{kind}' for kind in kinds))
+
+    def invalidate(self):
+        self.bump('groups', 'curators', 'leaders', 'cmks')
+
+    def _get(self, kind, loader):
+        return cache.get_or_set(f'reference:{kind}', 'all', loader, ttl=self.ttl, metric='reference')
+
+
+reference_cache = ReferenceCache()
+
+for _model, _kinds in DEPENDENCIES.items():
+    cache.track(_model, *(f'reference:{kind}' for kind in _kinds))
@@ -0,0 +1,109 @@
+# services/schema.py
+"""Переносимые операции со схемой для скриптов миграции.
+
+Скрипты миграции раньше опрашивали PRAGMA table_info и sqlite_master и
+писали типы столбцов строками (DATETIME, AUTOINCREMENT), поэтому
+работали только на SQLite. Здесь то же самое сделано через инспектор
+SQLAlchemy и DDL, скомпилированный диалектом текущей базы: типы берутся
+из моделей, и миграции выполняются и на SQLite, и на PostgreSQL.
+"""
+from sqlalchemy import Column, Index, MetaData, Table, inspect, text
+from sqlalchemy.schema import CreateColumn
+
+
+class IndexCreationError(Exception):
+    """Индекс не создан; name - имя индекса, __cause__ - ошибка базы"""
+
+    def __init__(self, name, error):
+        super().__init__(f'{name}: {error}')
+        self.name = name
+
+
+def table_names(conn):
+    return inspect(conn).get_table_names()
+
+
+def column_names(conn, table_name):
+    """Имена столбцов таблицы; пустой список, если таблицы нет"""
+    inspector = inspect(conn)
+    if not inspector.has_table(table_name):
+        return []
+    return [column['name'] for column in inspector.get_columns(table_name)]
+
+
+def index_names(conn, table_name):
+    return {index['name'] for index in inspect(conn).get_indexes(table_name)}
+
+
+def create_table(conn, model):
+    """CREATE TABLE по модели, если таблицы ещё нет; True - таблица создана"""
+    if inspect(conn).has_table(model.__tablename__):
+        return False
+    model.__table__.create(conn)
+    return True
+
+
+def add_column(conn, model, name, server_default=None):
+    """ALTER TABLE ... ADD COLUMN со столбцом модели, если его ещё нет
+
+    Тип, NULL и значение по умолчанию компилируются диалектом базы.
+    Внешние ключи не добавляются: SQLite не умеет ADD CONSTRAINT, а
+    целостность обеспечивают модели. True - столбец добавлен.
+    """
+    table_name = model.__tablename__
+    if name in column_names(conn, table_name):
+        return False
+
+    source = model.__table__.c[name]
+    column = Column(name, source.type, nullable=True if server_default is None else source.nullable,
+                    server_default=server_default)
+    # Отдельная таблица-заготовка: столбец модели уже привязан к своей таблице
+    Table(table_name, MetaData(), column)
+    ddl = CreateColumn(column).compile(dialect=conn.dialect)
+    conn.execute(text(f'ALTER TABLE {conn.dialect.identifier_preparer.quote(table_name)} ADD COLUMN {ddl}'))
+    return True
+
+
+def create_index(conn, name, table_name, *columns, unique=False):
+    """CREATE INDEX, если индекса с таким именем ещё нет; True - создан"""
+    if name in index_names(conn, table_name):
+        return False
+    table = Table(table_name, MetaData(), *(Column(column) for column in columns))
+    Index(name, *(table.c[column] for column in columns), unique=unique).create(conn)
+    return True
+
+
+def create_model_indexes(conn, model):
+    """Индексы модели, которых нет в существующей таблице (create_all их не добавляет)
+
+    Возвращает имена созданных индексов. Ошибка базы поднимается как
+    IndexCreationError с именем индекса, который не удалось создать.
+    """
+    if not inspect(conn).has_table(model.__tablename__):
+        return []
+    existing = index_names(conn, model.__tablename__)
+    created = []
+    for index in sorted(model.__table__.indexes, key=lambda index: index.name):
+        if index.name not in existing:
+            try:
+                index.create(conn)
+            except Exception as e:
+                raise IndexCreationError(index.name, e) from e
+            created.append(index.name)
+    return created
+
+
+def sync_sequences(conn, *models):
+    """Сдвигает последовательности id PostgreSQL после вставки с явными id
+
+    На SQLite автоинкремент сам продолжает с MAX(id), на PostgreSQL
+    без этого следующая вставка через ORM упадёт на уникальности.
+    """
+    if conn.dialect.name != 'postgresql':
+        return
+    for model in models:
+        table_name = model.__tablename__
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table_name}', 'id'), "
+            f"COALESCE((SELECT MAX(id) FROM {conn.dialect.identifier_preparer.quote(table_name)}), 0) + 1, false)"
+        ))
@@ -0,0 +1,91 @@
+# services/singleflight.py
+"""Объединение одинаковых одновременных вычислений (single-flight).
+
+Когда на совещании кураторов десять человек одновременно открывают одну
+и ту же статистику, каждый запрос заново считает одно и то же. SingleFlight
+пропускает к вычислению только первый вызов с данным ключом; остальные
+потоки ждут его результата (или исключения) и получают тот же объект.
+
+    flight.do(request_key(), build_stats)
+
+Ключ - эндпоинт и нормализованные параметры запроса (request_key).
+Для координации между воркерами cache.get_or_set дополнительно берёт
+блокировку в общем кэше (services/cache.py).
+"""
+import threading
+
+from flask import request
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Результат fn(); одновременные вызовы с тем же ключом ждут первый
+
+        Возвращает (результат, shared): shared=True, если результат
+        посчитан другим потоком.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+def request_key(*extra, include_form=True):
+    """Эндпоинт и нормализованные параметры: порядок и пустые значения не важны"""
+    params = []
+    sources = [request.args]
+    if include_form and request.method == 'POST':
+        sources.append(request.form)
+    for source in sources:
+        for name in source:
+            values = sorted(value.strip() for value in source.getlist(name) if value.strip())
+            if values:
+                params.append((name, tuple(values)))
+    params.sort()
+    query = '&'.join(f"{name}={','.join(values)}" for name, values in params)
+    key = f'{request.endpoint}?{query}'
+    if extra:
+        key += '|' + '|'.join(str(part) for part in extra)
+    return key
+
+
+flight = SingleFlight()
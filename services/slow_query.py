@@ -0,0 +1,181 @@
+# services/slow_query.py
+"""Журнал медленных SQL-запросов с планом выполнения.
+
+Запросы дольше SLOW_QUERY_MS пишутся в ротируемый файл
+instance/slow_queries.log (JSON по строке): нормализованный SQL,
+типы параметров, маршрут и вывод EXPLAIN QUERY PLAN (SQLite).
+В памяти хранится сводка по отпечатку нормализованного SQL для
+страницы /dashboard/perf/slow-queries. Файл журнала открывается при
+первой записи, а не при создании приложения.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\(\s*(?:\?|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|:\w+))+\s*\)')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def normalize_sql(statement):
+    """Приводит SQL к виду без литералов и со свёрнутыми IN-списками"""
+    sql = _STRING_RE.sub('?', statement)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('(...)', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+def fingerprint(normalized):
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:12]
+
+
+def parameter_shape(parameters, executemany):
+    """Типы параметров без значений: ['int', 'date'] или {'rows': N, 'row': [...]}"""
+    if executemany:
+        rows = list(parameters or [])
+        return {'rows': len(rows), 'row': parameter_shape(rows[0], False) if rows else []}
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    return [type(value).__name__ for value in (parameters or ())]
+
+
+class SlowQueryLog:
+    def __init__(self, app=None):
+        self.threshold = 0.1
+        self.explain = True
+        self.logger = logging.getLogger('slow_queries')
+        self.path = None
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._hooked = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.threshold = app.config.get('SLOW_QUERY_MS', 100) / 1000.0
+        self.explain = app.config.get('SLOW_QUERY_EXPLAIN', True)
+        app.extensions['slow_query_log'] = self
+        if self.threshold <= 0:
+            return
+
+        # Обработчик файла создаётся при первой записи (_open_log)
+        self.path = os.path.abspath(
+            app.config.get('SLOW_QUERY_LOG') or os.path.join(app.instance_path, 'slow_queries.log'))
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+
+        if not self._hooked:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            event.listen(Engine, 'handle_error', self._handle_error)
+            self._hooked = True
+
+    def _open_log(self):
+        path = self.path
+        with self._lock:
+            if any(getattr(h, 'baseFilename', None) == path for h in self.logger.handlers):
+                return
+            for handler in list(self.logger.handlers):
+                self.logger.removeHandler(handler)
+                handler.close()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            handler = RotatingFileHandler(path, maxBytes=5 * 1024 * 1024, backupCount=5, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self.logger.addHandler(handler)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('slow_query_start', []).append(time.perf_counter())
+
+    @staticmethod
+    def _handle_error(exception_context):
+        # Запрос упал: after_cursor_execute не вызовется, снимаем его время со стека
+        conn = exception_context.connection
+        if conn is None or exception_context.statement is None or exception_context.is_pre_ping:
+            return
+        starts = conn.info.get('slow_query_start')
+        if starts:
+            starts.pop()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('slow_query_start')
+        if not starts:
+            return
+        duration = time.perf_counter() - starts.pop()
+        if duration < self.threshold:
+            return
+
+        try:
+            self._record(conn, statement, parameters, executemany, duration)
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"Slow query logging failed: {e}")
+
+    def _record(self, conn, statement, parameters, executemany, duration):
+        normalized = normalize_sql(statement)
+        key = fingerprint(normalized)
+        route = request.endpoint if has_request_context() else None
+        plan = self._explain(conn, statement, parameters, executemany)
+
+        self._open_log()
+        self.logger.info(json.dumps({
+            'time': datetime.utcnow().isoformat(),
+            'fingerprint': key,
+            'duration_ms': round(duration * 1000, 2),
+            'route': route,
+            'sql': normalized,
+            'params': parameter_shape(parameters, executemany),
+            'plan': plan
+        }, ensure_ascii=False, default=str))
+
+        with self._lock:
+            entry = self._stats.get(key)
+            if entry is None:
+                entry = self._stats[key] = {
+                    'fingerprint': key, 'sql': normalized, 'count': 0,
+                    'total_ms': 0.0, 'max_ms': 0.0, 'routes': set(), 'plan': plan
+                }
+            entry['count'] += 1
+            entry['total_ms'] += duration * 1000
+            entry['max_ms'] = max(entry['max_ms'], duration * 1000)
+            if route:
+                entry['routes'].add(route)
+            if plan:
+                entry['plan'] = plan
+
+    def _explain(self, conn, statement, parameters, executemany):
+        """EXPLAIN QUERY PLAN для SELECT на SQLite"""
+        if not self.explain or executemany or conn.dialect.name != 'sqlite':
+            return None
+        if not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            return None
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters or ())
+            return [row[-1] for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+
+    def summary(self):
+        """Сводка по отпечаткам: самые затратные (суммарно) первыми"""
+        with self._lock:
+            rows = [dict(entry, routes=sorted(entry['routes']),
+                         avg_ms=entry['total_ms'] / entry['count'])
+                    for entry in self._stats.values()]
+        return sorted(rows, key=lambda r: r['total_ms'], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+slow_query_log = SlowQueryLog()
@@ -0,0 +1,106 @@
+# services/startup.py
+"""Быстрый старт: кэш отпечатка схемы и отчёт о времени импорта.
+
+init_app() раньше на каждом запуске инспектировал таблицы и дважды
+считал группы. Теперь отпечаток схемы моделей (таблицы, столбцы,
+индексы) сохраняется в instance/schema_cache.json; если он совпадает
+и в базе уже есть группы, проверка сводится к одному запросу.
+
+python app.py --import-report [мс] запускает холодный импорт app в
+отдельном процессе с -X importtime и сравнивает его с целевым временем.
+"""
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+
+from sqlalchemy import text
+
+from db import db
+
+HEAVY_MODULES = ('pandas', 'numpy', 'openai', 'reportlab', 'openpyxl')
+
+_IMPORT_LINE_RE = re.compile(r'^import time:\s+(\d+)\s+\|\s+\d+\s+\|\s*(\S+)$')
+
+
+# =============================================
+# ОТПЕЧАТОК СХЕМЫ
+# =============================================
+
+def schema_fingerprint(metadata=None):
+    """SHA-1 от таблиц, столбцов и индексов (с их столбцами) моделей"""
+    metadata = metadata or db.metadata
+    parts = []
+    for table in sorted(metadata.tables.values(), key=lambda t: t.name):
+        columns = ','.join(f'{c.name}:{c.type}:{int(bool(c.nullable))}' for c in table.columns)
+        indexes = ','.join(sorted(f'{index.name}:' + '+'.join(c.name for c in index.columns)
+                                  for index in table.indexes if index.name))
+        parts.append(f'{table.name}({columns})[{indexes}]')
+    return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+
+
+def _cache_path(app):
+    return app.config.get('SCHEMA_CACHE') or os.path.join(app.instance_path, 'schema_cache.json')
+
+
+def _read_cache(app):
+    try:
+        with open(_cache_path(app), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def schema_is_current(app):
+    """Отпечаток совпадает с сохранённым для этой базы и группы уже созданы"""
+    cached = _read_cache(app).get(str(db.engine.url))
+    if cached != schema_fingerprint():
+        return False
+    try:
+        # Один запрос: таблица существует и в ней есть данные
+        return db.session.execute(text('SELECT 1 FROM groups LIMIT 1')).first() is not None
+    except Exception:
+        db.session.rollback()
+        return False
+
+
+def remember_schema(app):
+    cache = _read_cache(app)
+    cache[str(db.engine.url)] = schema_fingerprint()
+    path = _cache_path(app)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False, indent=2)
+
+
+# =============================================
+# ОТЧЁТ О ВРЕМЕНИ ИМПОРТА
+# =============================================
+
+def import_time_report(module='app', cwd=None, top=15):
+    """Холодный импорт модуля в отдельном процессе
+
+    Возвращает {'wall_ms', 'top': [(пакет, мс)], 'heavy': [...]}.
+    """
+    code = (f'import time; started = time.perf_counter(); import {module}; '
+            f'print((time.perf_counter() - started) * 1000)')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            cwd=cwd, capture_output=True, text=True, check=True)
+
+    # Собственное время модулей, сложенное по корневому пакету
+    packages = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORT_LINE_RE.match(line)
+        if not match:
+            continue
+        self_us, name = match.groups()
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0) + int(self_us) / 1000.0
+
+    return {
+        'wall_ms': float(result.stdout.strip().splitlines()[-1]),
+        'top': sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top],
+        'heavy': [name for name in HEAVY_MODULES if name in packages]
+    }
@@ -0,0 +1,153 @@
+# services/timeseries.py
+"""Ряды посещаемости по периодам: день, неделя, месяц, семестр.
+
+Группировка выполняется в SQL (GROUP BY по началу периода, вычисленному
+из absences.date), поэтому за год в Python приходит не больше нескольких
+сотен строк вместо всех пропусков. Выражение начала периода своё для
+SQLite и PostgreSQL. Пустые периоды заполняются нулями.
+
+Семестры: осенний - с 1 сентября по 31 января, весенний - с 1 февраля
+по 31 августа; период обозначается датой своего начала.
+"""
+from collections import namedtuple
+from datetime import date, timedelta
+
+from sqlalchemy import Date, Integer, case, cast, extract, func, select
+
+from db import db
+from models.absence import Absence
+from models.group import Group
+from models.student import Student
+from models.user import User
+from services.absence_store import absence_store
+
+BUCKETS = ('day', 'week', 'month', 'term')
+SCOPES = ('all', 'group', 'student', 'curator', 'cmk')
+
+Point = namedtuple('Point', 'start absences lessons excused unexcused')
+
+
+def bucket_expr(column, bucket, dialect):
+    """SQL-выражение начала периода для столбца с датой"""
+    month = cast(extract('month', column), Integer)
+    year = cast(extract('year', column), Integer)
+
+    if dialect == 'postgresql':
+        if bucket == 'day':
+            return column
+        if bucket in ('week', 'month'):
+            return cast(func.date_trunc(bucket, column), Date)
+        return case(
+            (month >= 9, func.make_date(year, 9, 1)),
+            (month == 1, func.make_date(year - 1, 9, 1)),
+            else_=func.make_date(year, 2, 1),
+        )
+
+    # SQLite: даты хранятся строками YYYY-MM-DD
+    if bucket == 'day':
+        return func.date(column)
+    if bucket == 'week':
+        # Ближайшее воскресенье не раньше даты минус 6 дней - понедельник
+        return func.date(column, 'weekday 0', '-6 days')
+    if bucket == 'month':
+        return func.strftime('%Y-%m-01', column)
+    return case(
+        (month >= 9, func.strftime('%Y-09-01', column)),
+        (month == 1, func.printf('%04d-09-01', year - 1)),
+        else_=func.strftime('%Y-02-01', column),
+    )
+
+
+def bucket_floor(day, bucket):
+    """Начало периода, в который попадает дата (то же, что bucket_expr)"""
+    if bucket == 'day':
+        return day
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    if day.month >= 9:
+        return date(day.year, 9, 1)
+    if day.month == 1:
+        return date(day.year - 1, 9, 1)
+    return date(day.year, 2, 1)
+
+
+def next_bucket(start, bucket):
+    if bucket == 'day':
+        return start + timedelta(days=1)
+    if bucket == 'week':
+        return start + timedelta(days=7)
+    if bucket == 'month':
+        return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return date(start.year + 1, 2, 1) if start.month == 9 else date(start.year, 9, 1)
+
+
+def bucket_starts(start, end, bucket):
+    """Начала всех периодов, пересекающих [start, end]"""
+    current = bucket_floor(start, bucket)
+    while current <= end:
+        yield current
+        current = next_bucket(current, bucket)
+
+
+def count_buckets(start, end, bucket):
+    """Число точек ряда без перебора дней"""
+    if bucket == 'day':
+        return (end - start).days + 1
+    if bucket == 'week':
+        return (bucket_floor(end, 'week') - bucket_floor(start, 'week')).days // 7 + 1
+    return sum(1 for _ in bucket_starts(start, end, bucket))
+
+
+def _scope_filter(query, scope, scope_id):
+    if scope == 'student':
+        return query.filter(Absence.student_id == scope_id)
+    if scope == 'all':
+        return query
+
+    query = query.join(Student, Student.id == Absence.student_id)
+    if scope == 'group':
+        return query.filter(Student.group_id == scope_id)
+    curators = [scope_id] if scope == 'curator' else select(User.id).where(User.cmk_id == scope_id)
+    return query.filter(Student.group_id.in_(select(Group.id).where(Group.curator_id.in_(curators))))
+
+
+def attendance_series(scope, scope_id, start, end, bucket, excused_reasons):
+    """Ряд Point по периодам [start, end] для группы, студента, куратора или ЦМК
+
+    Причины сравниваются в Python по excused_reasons: lower() в SQLite
+    не работает с кириллицей, поэтому SQL группирует ещё и по причине.
+    При ANALYTICS_ENGINE=memory ряд считается в памяти воркера.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f'unknown bucket: {bucket}')
+    if scope not in SCOPES:
+        raise ValueError(f'unknown scope: {scope}')
+    if absence_store.active:
+        return absence_store.series(scope, scope_id, start, end, bucket, excused_reasons)
+
+    dialect = db.session.get_bind(mapper=Absence.__mapper__).dialect.name
+    period = bucket_expr(Absence.date, bucket, dialect).label('period')
+    query = db.session.query(
+        period,
+        Absence.reason,
+        func.count(Absence.id),
+        func.coalesce(func.sum(Absence.lessons_count), 0),
+    ).filter(Absence.date >= start, Absence.date <= end)
+    query = _scope_filter(query, scope, scope_id).group_by(period, Absence.reason)
+
+    totals = {}
+    for period_start, reason, count, lessons in query:
+        if isinstance(period_start, str):
+            period_start = date.fromisoformat(period_start)
+        absences, lessons_total, excused = totals.get(period_start, (0, 0, 0))
+        if reason and reason.lower() in excused_reasons:
+            excused += count
+        totals[period_start] = (absences + count, lessons_total + int(lessons), excused)
+
+    series = []
+    for period_start in bucket_starts(start, end, bucket):
+        absences, lessons, excused = totals.get(period_start, (0, 0, 0))
+        series.append(Point(period_start, absences, lessons, excused, absences - excused))
+    return series
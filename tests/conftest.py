@@ -0,0 +1,41 @@
+# tests/conftest.py
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config  # noqa: E402
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Фабрика приложения с отдельной SQLite-базой во временном каталоге"""
+    from app import create_app
+    from db import db
+
+    def make(**overrides):
+        class TestConfig(Config):
+            TESTING = True
+            SECRET_KEY = 'test'
+            SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp_path / "students.db"}'
+            CACHE_BACKEND = 'memory'
+            SQLITE_OPTIMIZE_INTERVAL = 0
+            SLOW_QUERY_LOG = str(tmp_path / 'slow_queries.log')
+            SCHEMA_CACHE = str(tmp_path / 'schema_cache.json')
+            METRICS_DIR = str(tmp_path / 'metrics')
+
+        for key, value in overrides.items():
+            setattr(TestConfig, key, value)
+        app = create_app(TestConfig)
+        with app.app_context():
+            db.create_all()
+        return app
+
+    return make
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
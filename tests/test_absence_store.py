@@ -0,0 +1,122 @@
+# tests/test_absence_store.py
+"""ANALYTICS_ENGINE=memory отвечает так же, как SQL, после любых записей"""
+from datetime import date
+
+import pytest
+
+from db import db
+from models.absence import Absence, upsert_absences
+from models.group import Group
+from models.student import Student
+from models.user import User
+from routes.dashboard_routes import EXCUSED_REASONS, apply_roll_call, count_group_absences, count_student_absences
+from services.absence_store import absence_store
+from services.timeseries import attendance_series
+
+pytest.importorskip('numpy')
+
+DAY = date(2026, 3, 2)
+
+
+@pytest.fixture
+def store_app(make_app):
+    app = make_app(ANALYTICS_ENGINE='memory')
+    assert absence_store.active
+    with app.app_context():
+        curator = User(full_name='Куратор', phone='2', role='curator', is_confirmed=True)
+        db.session.add(curator)
+        db.session.flush()
+        groups = [Group(name='Э-101', curator_id=curator.id), Group(name='Б-101')]
+        db.session.add_all(groups)
+        db.session.flush()
+        db.session.add_all(Student(full_name=f'Студент {i}', group_id=groups[i % 2].id) for i in range(6))
+        db.session.commit()
+    yield app
+    absence_store.enabled = False
+    absence_store.reset()
+
+
+def aggregates():
+    return {
+        'students': count_student_absences(),
+        'students_march': count_student_absences(start_date=date(2026, 3, 1), end_date=date(2026, 3, 31)),
+        'groups': count_group_absences(),
+        'series': [attendance_series(scope, scope_id, date(2026, 2, 1), date(2026, 4, 30), 'week', EXCUSED_REASONS)
+                   for scope, scope_id in (('all', None), ('group', 1), ('curator', 1), ('student', 2))],
+    }
+
+
+def assert_matches_sql():
+    """Хранилище отвечает из памяти, затем те же агрегаты считаются в SQL"""
+    from_store = aggregates()
+    absence_store.enabled = False
+    try:
+        from_sql = aggregates()
+    finally:
+        absence_store.enabled = True
+    assert from_store == from_sql
+    return from_store
+
+
+def student_ids():
+    return [student_id for (student_id,) in db.session.query(Student.id).order_by(Student.id)]
+
+
+def test_store_matches_sql_after_orm_writes(store_app):
+    with store_app.app_context():
+        ids = student_ids()
+        assert assert_matches_sql()['students'] == {}
+
+        db.session.add_all([
+            Absence(student_id=ids[0], date=DAY, reason='болезнь', lessons_count=2),
+            Absence(student_id=ids[1], date=date(2026, 3, 10), lessons_count=1),
+            Absence(student_id=ids[2], date=date(2026, 4, 1), reason='прогул', lessons_count=3),
+        ])
+        db.session.commit()
+        assert assert_matches_sql()['students'][ids[0]] == (1, 1)
+
+        absence = Absence.query.filter_by(student_id=ids[1]).one()
+        absence.reason = 'справка'
+        absence.date = date(2026, 2, 20)
+        db.session.commit()
+        assert assert_matches_sql()['students'][ids[1]] == (1, 1)
+
+        db.session.delete(Absence.query.filter_by(student_id=ids[0]).one())
+        db.session.commit()
+        assert ids[0] not in assert_matches_sql()['students']
+
+        # Студент переведён в другую группу
+        db.session.get(Student, ids[2]).group_id = db.session.get(Student, ids[1]).group_id
+        db.session.commit()
+        assert_matches_sql()
+
+        # Массовое удаление без списка студентов
+        Absence.query.filter(Absence.date >= date(2026, 4, 1)).delete()
+        db.session.commit()
+        assert_matches_sql()
+
+
+def test_store_matches_sql_after_upsert_and_roll_call(store_app):
+    with store_app.app_context():
+        ids = student_ids()
+        group = db.session.get(Group, 1)
+        members = [student_id for student_id in ids if db.session.get(Student, student_id).group_id == group.id]
+        assert_matches_sql()
+
+        upsert_absences([{'student_id': ids[0], 'date': DAY, 'reason': None, 'lessons_count': 2},
+                         {'student_id': ids[3], 'date': DAY, 'reason': 'болезнь', 'lessons_count': 1}])
+        db.session.commit()
+        assert_matches_sql()
+
+        # Перекличка: вставка, изменение и удаление одним набором операций
+        apply_roll_call(group, DAY, {members[0]: {'reason': 'болезнь', 'lessons_count': 4},
+                                     members[1]: {}})
+        db.session.commit()
+        totals = assert_matches_sql()['students']
+        assert totals[members[0]] == (1, 1) and totals[members[1]] == (1, 0)
+
+        apply_roll_call(group, DAY, {members[2]: {'reason': 'прогул', 'lessons_count': 2}})
+        db.session.commit()
+        totals = assert_matches_sql()['students']
+        assert members[0] not in totals and members[1] not in totals
+        assert totals[members[2]] == (1, 0)
@@ -0,0 +1,106 @@
+# tests/test_absences.py
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+
+import app as app_module
+from db import db
+from models.absence import MAX_LESSONS_PER_DAY, UNIQUE_INDEX, Absence, merge_duplicate_absences, upsert_absences
+from models.group import Group
+from models.student import Student
+from models.user import User
+from services.schema import index_names
+
+DAY = date(2026, 3, 2)
+
+
+@pytest.fixture
+def student_id(app):
+    with app.app_context():
+        group = Group(name='Э-101')
+        db.session.add(group)
+        db.session.flush()
+        student = Student(full_name='Студент', group_id=group.id)
+        db.session.add(student)
+        db.session.commit()
+        return student.id
+
+
+def absences(student_id):
+    return [(a.date, a.lessons_count, a.reason)
+            for a in Absence.query.filter_by(student_id=student_id).order_by(Absence.date)]
+
+
+def insert_duplicates(student_id):
+    """Дубли за день, как в базах до уникального индекса"""
+    with db.engine.begin() as conn:
+        conn.execute(text(f'DROP INDEX {UNIQUE_INDEX}'))
+        conn.execute(text('INSERT INTO absences (student_id, date, reason, lessons_count) VALUES '
+                          '(:s, :d, NULL, 2), (:s, :d, \'болезнь\', 3), (:s, :d, \'прогул\', NULL), '
+                          '(:s, :e, \'\', 1)'),
+                     {'s': student_id, 'd': DAY, 'e': date(2026, 3, 3)})
+
+
+def test_merge_duplicate_absences(app, student_id):
+    with app.app_context():
+        insert_duplicates(student_id)
+        with db.engine.begin() as conn:
+            assert merge_duplicate_absences(conn) == 2
+            assert merge_duplicate_absences(conn) == 0
+        assert absences(student_id) == [(DAY, 6, 'болезнь'), (date(2026, 3, 3), 1, '')]
+
+
+def test_merge_caps_lessons(app, student_id):
+    with app.app_context():
+        insert_duplicates(student_id)
+        db.session.execute(text('UPDATE absences SET lessons_count = 10'))
+        db.session.commit()
+        with db.engine.begin() as conn:
+            merge_duplicate_absences(conn)
+        assert absences(student_id)[0][1] == MAX_LESSONS_PER_DAY
+
+
+def test_startup_merges_duplicates_before_unique_index(app, student_id):
+    with app.app_context():
+        insert_duplicates(student_id)
+    app_module.init_app(app)
+    with app.app_context():
+        with db.engine.connect() as conn:
+            assert UNIQUE_INDEX in index_names(conn, 'absences')
+        assert absences(student_id)[0] == (DAY, 6, 'болезнь')
+
+
+def test_upsert_merges_lessons_and_keeps_reason(app, student_id):
+    with app.app_context():
+        upsert_absences([{'student_id': student_id, 'date': DAY, 'reason': 'болезнь', 'lessons_count': 2}])
+        upsert_absences([{'student_id': student_id, 'date': DAY, 'reason': None, 'lessons_count': 3}])
+        db.session.commit()
+        assert absences(student_id) == [(DAY, 5, 'болезнь')]
+
+        upsert_absences([{'student_id': student_id, 'date': DAY, 'reason': 'справка', 'lessons_count': 10}])
+        db.session.commit()
+        assert absences(student_id) == [(DAY, MAX_LESSONS_PER_DAY, 'справка')]
+
+        upsert_absences([{'student_id': student_id, 'date': DAY, 'reason': None, 'lessons_count': 1}],
+                        merge=False)
+        db.session.commit()
+        assert absences(student_id) == [(DAY, 1, 'справка')]
+
+
+@pytest.mark.parametrize('lessons_count', ['0', '-3', '13', 'abc'])
+def test_add_absence_rejects_bad_lessons_count(app, student_id, lessons_count):
+    with app.app_context():
+        admin = User(full_name='Админ', phone='1', role='admin', is_confirmed=True)
+        admin.set_password('x')
+        db.session.add(admin)
+        db.session.commit()
+
+    client = app.test_client()
+    assert client.post('/auth/login', data={'username': '1', 'password': 'x'}).status_code == 302
+    response = client.post('/dashboard/absences/add', data={
+        'student_id': student_id, 'date': '2026-03-02', 'lessons_count': lessons_count})
+    assert response.status_code == 302
+    assert response.location.endswith('/dashboard/absences/add')
+    with app.app_context():
+        assert absences(student_id) == []
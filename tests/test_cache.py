@@ -0,0 +1,145 @@
+# tests/test_cache.py
+import os
+import pickle
+import socket
+import threading
+import time
+
+import pytest
+
+from db import db
+from models.group import Group
+from services.cache import MISSING, FileSystemBackend, RedisBackend, cache
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope='module')
+def redis_url():
+    """Сервер с протоколом Redis на fakeredis"""
+    fakeredis = pytest.importorskip('fakeredis')
+    port = free_port()
+    server = fakeredis.TcpFakeServer(('127.0.0.1', port), server_type='redis')
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'redis://127.0.0.1:{port}/0'
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def redis_backend(redis_url):
+    backend = RedisBackend(redis_url, prefix='test:', secret=b'secret')
+    yield backend
+    backend.clear()
+
+
+def test_redis_get_set(redis_backend):
+    assert redis_backend.get('missing') is MISSING
+    redis_backend.set('groups', [('Э-101', 1)])
+    assert redis_backend.get('groups') == [('Э-101', 1)]
+    redis_backend.delete('groups')
+    assert redis_backend.get('groups') is MISSING
+
+
+def test_redis_ttl(redis_backend):
+    redis_backend.set('short', 'value', ttl=0.2)
+    ttl_ms = redis_backend.command('PTTL', 'test:short')
+    assert 0 < ttl_ms <= 200
+    assert redis_backend.get('short') == 'value'
+    time.sleep(0.3)
+    assert redis_backend.get('short') is MISSING
+
+    redis_backend.set('forever', 'value')
+    assert redis_backend.command('PTTL', 'test:forever') == -1
+
+
+def test_redis_add_is_exclusive(redis_backend):
+    assert redis_backend.add('lock', 'a', ttl=5) is True
+    assert redis_backend.add('lock', 'b', ttl=5) is False
+    assert redis_backend.get('lock') == 'a'
+
+
+def test_redis_clear_keeps_foreign_keys(redis_backend):
+    redis_backend.set('mine', 1)
+    redis_backend.command('SET', 'other:key', 'x')
+    redis_backend.clear()
+    assert redis_backend.get('mine') is MISSING
+    assert redis_backend.command('GET', 'other:key') == b'x'
+    redis_backend.command('DEL', 'other:key')
+
+
+def test_unsigned_redis_value_is_not_unpickled(redis_url, redis_backend):
+    redis_backend.command('SET', 'test:forged', pickle.dumps('forged'))
+    assert redis_backend.get('forged') is MISSING
+
+    redis_backend.set('signed', 'value')
+    other_key = RedisBackend(redis_url, prefix='test:', secret=b'other')
+    assert other_key.get('signed') is MISSING
+
+
+def test_filesystem_rejects_tampered_entry(tmp_path):
+    backend = FileSystemBackend(str(tmp_path / 'cache'), secret=b'secret')
+    backend.set('key', {'a': 1}, ttl=60)
+    assert backend.get('key') == {'a': 1}
+    assert os.stat(tmp_path / 'cache').st_mode & 0o077 == 0
+
+    path = backend._path('key')
+    with open(path, 'r+b') as f:
+        data = bytearray(f.read())
+        data[-2] ^= 0xFF
+        f.seek(0)
+        f.write(data)
+    assert backend.get('key') is MISSING
+
+
+@pytest.fixture(params=['memory', 'redis'])
+def cached_app(request, make_app):
+    overrides = {'CACHE_BACKEND': request.param, 'CACHE_VERSION_CHECK': 0}
+    if request.param == 'redis':
+        overrides['CACHE_REDIS_URL'] = request.getfixturevalue('redis_url')
+        overrides['CACHE_KEY_PREFIX'] = f'test-{os.getpid()}:'
+    app = make_app(**overrides)
+    cache.track(Group, 'test:groups')
+    yield app
+    cache.clear()
+
+
+def load_group_names(calls):
+    def loader():
+        calls.append(1)
+        return [name for (name,) in db.session.query(Group.name).order_by(Group.name)]
+    return loader
+
+
+def test_version_bumped_after_commit(cached_app):
+    calls = []
+    with cached_app.app_context():
+        before = cache.version('test:groups')
+        assert cache.get_or_set('test:groups', 'all', load_group_names(calls)) == []
+        assert cache.get_or_set('test:groups', 'all', load_group_names(calls)) == []
+        assert len(calls) == 1
+
+        db.session.add(Group(name='Э-101'))
+        db.session.flush()
+        # До коммита штамп прежний
+        assert cache.version('test:groups') == before
+        db.session.commit()
+
+        assert cache.version('test:groups') != before
+        assert cache.get_or_set('test:groups', 'all', load_group_names(calls)) == ['Э-101']
+        assert len(calls) == 2
+
+
+def test_version_kept_after_rollback(cached_app):
+    with cached_app.app_context():
+        before = cache.version('test:groups')
+        db.session.add(Group(name='Б-101'))
+        db.session.flush()
+        db.session.rollback()
+        db.session.commit()
+        assert cache.version('test:groups') == before
@@ -0,0 +1,109 @@
+# tests/test_exports.py
+"""Статистика кураторов и экспорт: результат и число запросов не зависят от объёма данных"""
+import csv
+import io
+from datetime import date
+
+import pytest
+from flask import template_rendered
+
+from db import db
+from models.absence import Absence
+from models.group import Group
+from models.student import Student
+from models.user import User
+
+GROUPS = 6
+STUDENTS_PER_GROUP = 5
+
+
+@pytest.fixture
+def admin_client(app):
+    """Кураторы с одной и двумя группами, старосты, пропуски с разными причинами"""
+    with app.app_context():
+        admin = User(full_name='Админ', phone='1', role='admin', is_confirmed=True)
+        admin.set_password('x')
+        curators = [User(full_name=f'Куратор {i}', phone=f'c{i}', role='curator', is_confirmed=True) for i in range(3)]
+        leaders = [User(full_name=f'Староста {i}', phone=f'l{i}', role='leader', is_confirmed=True)
+                   for i in range(GROUPS + 1)]
+        db.session.add_all([admin, *curators, *leaders])
+        db.session.flush()
+
+        reasons = [None, 'болезнь', 'Справка', 'прогул', 'по болезни']
+        for i in range(GROUPS):
+            # Куратор 0 ведёт две группы; у последнего старосты группы нет
+            group = Group(name=f'Э-{i}', curator_id=curators[min(i, 2)].id, leader_id=leaders[i].id)
+            db.session.add(group)
+            db.session.flush()
+            for j in range(STUDENTS_PER_GROUP):
+                student = Student(full_name=f'Студент {i}-{j}', group_id=group.id)
+                db.session.add(student)
+                db.session.flush()
+                for k in range(j):
+                    db.session.add(Absence(student_id=student.id, date=date(2026, 3, 2 + k),
+                                           reason=reasons[k], lessons_count=1))
+        db.session.commit()
+
+    client = app.test_client()
+    assert client.post('/auth/login', data={'username': '1', 'password': 'x'}).status_code == 302
+    return client
+
+
+def rendered_context(app, client, url):
+    captured = []
+
+    def record(sender, template, context, **extra):
+        captured.append(context)
+
+    with template_rendered.connected_to(record, app):
+        assert client.get(url).status_code == 200
+    return captured[0]
+
+
+def test_curator_stats(app, admin_client):
+    # Бюджет запросов проверяется в режиме raise (TESTING)
+    stats = {row['curator']: row for row in rendered_context(app, admin_client, '/dashboard/curator_stats')['curator_data']}
+    # В группе 0+1+2+3+4 = 10 пропусков: болезнь и Справка - по 3 и 2
+    per_group = {'total_absences': 10, 'excused': 5, 'unexcused': 5}
+
+    assert stats['Куратор 0'] == dict(stats['Куратор 0'], groups_count=1, students_count=5, **per_group)
+    assert stats['Куратор 2'] == dict(stats['Куратор 2'], groups_count=4, students_count=20,
+                                      total_absences=40, excused=20, unexcused=20)
+    assert stats['Староста 1'] == dict(stats['Староста 1'], role='leader', groups_count=1, students_count=5, **per_group)
+    assert stats[f'Староста {GROUPS}'] == dict(stats[f'Староста {GROUPS}'], groups_count=0, students_count=0,
+                                               total_absences=0, excused=0, unexcused=0)
+
+
+def test_export_rows(admin_client):
+    response = admin_client.post('/dashboard/export-students/process', data={
+        'period': 'custom', 'start_date': '2026-03-01', 'end_date': '2026-03-04',
+        'include_stats': 'on', 'include_reason': 'on', 'export_format': 'csv'})
+    assert response.status_code == 200
+    rows = {row['ФИО']: row for row in csv.DictReader(io.StringIO(response.data.decode('utf-8-sig')))}
+    assert len(rows) == GROUPS * STUDENTS_PER_GROUP
+
+    # Пропуски 2-4 марта: без причины, болезнь, Справка; прогул 5 марта вне периода
+    row = rows['Студент 1-4']
+    assert (row['Группа'], row['Куратор'], row['Староста']) == ('Э-1', 'Куратор 1', 'Староста 1')
+    assert row['Всего пропусков'] == '3'
+    assert float(row['Пропуски без причины']) == float(row['Пропуски (болезнь)']) == float(row['Пропуски (Справка)']) == 1
+    assert rows['Студент 1-0']['Всего пропусков'] == '0'
+
+
+@pytest.mark.parametrize('url', [
+    '/dashboard/api/export-preview?period=all',
+    '/dashboard/api/export-preview-data?period=all',
+])
+def test_export_preview(admin_client, url):
+    data = admin_client.get(url).get_json()
+    assert data['count'] == GROUPS * STUDENTS_PER_GROUP
+    assert [student['misses'] for student in data['students']] == [0, 1, 2, 3, 4, 0, 1, 2, 3, 4]
+    assert data['stats']['absences_count'] == 20
+
+
+def test_export_students_csv(admin_client):
+    response = admin_client.get('/dashboard/export_students')
+    assert response.status_code == 200
+    rows = list(csv.reader(io.StringIO(response.data.decode('utf-8-sig')), delimiter=';'))
+    assert len(rows) == GROUPS * STUDENTS_PER_GROUP + 1
+    assert rows[1][2:] == ['Э-0', '', 'Куратор 0', 'Староста 0']
@@ -0,0 +1,46 @@
+# tests/test_group_analytics.py
+import pytest
+
+import routes.dashboard_routes as dashboard_routes
+from db import db
+from models.group import Group
+from models.user import User
+
+
+@pytest.fixture
+def admin_client(app):
+    with app.app_context():
+        admin = User(full_name='Админ', phone='1', role='admin', is_confirmed=True)
+        admin.set_password('x')
+        group = Group(name='Э-101')
+        db.session.add_all([admin, group])
+        db.session.commit()
+        group_id = group.id
+
+    client = app.test_client()
+    assert client.post('/auth/login', data={'username': '1', 'password': 'x'}).status_code == 302
+    return client, group_id
+
+
+@pytest.mark.parametrize('group_id', ['', 'abc', '1.5', '1; DROP'])
+def test_rejects_non_integer_group_id(admin_client, group_id):
+    client, _ = admin_client
+    response = client.get(f'/dashboard/api/group-analytics?group_id={group_id}')
+    assert response.status_code == 400
+
+
+def test_cache_key_uses_parsed_group_id(admin_client, monkeypatch):
+    client, group_id = admin_client
+    calls = []
+    build = dashboard_routes.build_group_analytics
+
+    def counting_build(*args):
+        calls.append(args[0])
+        return build(*args)
+
+    monkeypatch.setattr(dashboard_routes, 'build_group_analytics', counting_build)
+    for raw in (str(group_id), f'0{group_id}', f'%20{group_id}'):
+        response = client.get(f'/dashboard/api/group-analytics?group_id={raw}&period=month')
+        assert response.status_code == 200
+        assert response.get_json()['total'] == 0
+    assert calls == [group_id]
@@ -0,0 +1,121 @@
+# tests/test_limiter.py
+import threading
+import time
+
+import pytest
+from flask import Flask
+
+from services.limiter import DEFAULT_LIMITS, QUEUE_FULL, TIMED_OUT, ConcurrencyLimiter, _Class, plan_limits
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_acquire_queue_full_and_timeout():
+    slot = _Class('test', limit=1, queue_size=1, wait=0.2)
+    assert slot.acquire() is None
+
+    # Второй ждёт в очереди, третьему места в очереди нет
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(slot.acquire()))
+    waiter.start()
+    wait_for(lambda: slot.waiting == 1)
+    assert slot.acquire() == QUEUE_FULL
+
+    waiter.join(5)
+    assert results == [TIMED_OUT]
+    assert slot.snapshot() == dict(slot.snapshot(), active=1, waiting=0,
+                                   rejected_queue_full=1, rejected_timeout=1)
+
+
+def test_acquire_waiter_gets_released_slot():
+    slot = _Class('test', limit=1, queue_size=1, wait=5)
+    assert slot.acquire() is None
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(slot.acquire()))
+    waiter.start()
+    wait_for(lambda: slot.waiting == 1)
+    slot.release()
+    waiter.join(5)
+    assert results == [None] and slot.active == 1
+
+
+@pytest.fixture
+def limited_app():
+    app = Flask('limiter_test')
+    app.config.update(WORKER_THREADS=8, CONCURRENCY_LIMITS='slow=1', CONCURRENCY_QUEUE=1,
+                      CONCURRENCY_WAIT=0.2, CONCURRENCY_RETRY_AFTER=7)
+    limiter = ConcurrencyLimiter()
+    limiter.init_app(app)
+
+    @app.route('/api/slow')
+    @limiter.limit('slow')
+    def slow():
+        return 'ok'
+
+    @app.route('/slow-page')
+    @limiter.limit('slow')
+    def slow_page():
+        return 'ok'
+
+    return app, limiter._classes['slow']
+
+
+def test_queue_full_returns_429(limited_app):
+    app, slot = limited_app
+    assert slot.acquire() is None
+    waiter = threading.Thread(target=slot.acquire)
+    waiter.start()
+    wait_for(lambda: slot.waiting == 1)
+
+    response = app.test_client().get('/api/slow')
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '7'
+    assert response.get_json()['retry_after'] == 7
+    waiter.join(5)
+
+
+def test_wait_timeout_returns_503(limited_app):
+    app, slot = limited_app
+    assert slot.acquire() is None
+
+    response = app.test_client().get('/slow-page')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '7'
+    assert 'text/html' in response.content_type
+
+    slot.release()
+    assert app.test_client().get('/slow-page').status_code == 200
+    assert slot.active == 0
+
+
+@pytest.mark.parametrize('threads, limits, queue_size', [
+    (4, 'export=2,import=2', 0),
+    (8, 'export=2,import=1', 3),
+    (5, None, 1),
+    (2, 'export=1', 1),
+])
+def test_plan_limits_rejects_all_threads_busy(threads, limits, queue_size):
+    with pytest.raises(ValueError, match='не остаётся потоков'):
+        plan_limits(threads, limits, queue_size)
+
+
+def test_plan_limits_defaults_leave_free_threads():
+    for threads in range(1, 33):
+        limits, queue_size = plan_limits(threads)
+        if threads <= len(DEFAULT_LIMITS):
+            assert (limits, queue_size) == ({}, 0)
+            continue
+        assert set(limits) == set(DEFAULT_LIMITS)
+        assert sum(limits.values()) + queue_size * len(limits) < threads
+
+
+def test_init_app_refuses_limits_using_every_thread():
+    app = Flask('limiter_test')
+    app.config.update(WORKER_THREADS=4, CONCURRENCY_LIMITS='export=2,import=1', CONCURRENCY_QUEUE=1)
+    with pytest.raises(ValueError):
+        ConcurrencyLimiter().init_app(app)
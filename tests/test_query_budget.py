@@ -0,0 +1,35 @@
+# tests/test_query_budget.py
+import pytest
+
+from db import db
+from models.group import Group
+from services.query_budget import QueryBudgetExceeded, query_budget
+
+
+def add_group_route(app, budget):
+    @app.route('/test/groups')
+    @query_budget(default=budget)
+    def list_groups():
+        # Три запроса: бюджет 2 превышен
+        for _ in range(3):
+            db.session.query(Group).all()
+        return 'ok'
+
+
+def test_raise_mode_fails_route_over_budget(app):
+    add_group_route(app, budget=2)
+    with pytest.raises(QueryBudgetExceeded, match='3 при лимите 2'):
+        app.test_client().get('/test/groups')
+
+
+def test_route_within_budget_passes(app):
+    add_group_route(app, budget=3)
+    assert app.test_client().get('/test/groups').status_code == 200
+
+
+def test_warn_mode_only_logs(make_app, caplog):
+    app = make_app(QUERY_BUDGET_MODE='warn')
+    add_group_route(app, budget=2)
+    response = app.test_client().get('/test/groups')
+    assert response.status_code == 200
+    assert 'Бюджет SQL-запросов превышен' in caplog.text
@@ -0,0 +1,60 @@
+# tests/test_roll_call.py
+import pytest
+
+from db import db
+from models.group import Group
+from models.student import Student
+from models.user import User
+
+
+@pytest.fixture
+def curator_client(app):
+    with app.app_context():
+        curator = User(full_name='Куратор', phone='2', role='curator', is_confirmed=True)
+        curator.set_password('x')
+        db.session.add(curator)
+        db.session.flush()
+        group = Group(name='Э-101', curator_id=curator.id)
+        db.session.add(group)
+        db.session.flush()
+        student = Student(full_name='Студент', group_id=group.id)
+        db.session.add(student)
+        db.session.commit()
+        ids = group.id, student.id
+
+    client = app.test_client()
+    assert client.post('/auth/login', data={'username': '2', 'password': 'x'}).status_code == 302
+    return client, ids
+
+
+@pytest.mark.parametrize('payload', [
+    {'group_id': 'abc'},
+    {'absences': [{'student_id': 'x'}]},
+    {'absences': [{'lessons_count': 1}]},
+    {'absences': [{'student_id': '{student}', 'lessons_count': 0}]},
+    {'absences': [{'student_id': '{student}', 'lessons_count': 13}]},
+])
+def test_api_roll_call_rejects_bad_input(curator_client, payload):
+    client, (group_id, student_id) = curator_client
+    payload = dict({'group_id': group_id, 'date': '2026-03-02'}, **payload)
+    for item in payload.get('absences', []):
+        if item.get('student_id') == '{student}':
+            item['student_id'] = student_id
+    assert client.post('/dashboard/api/roll-call', json=payload).status_code == 400
+
+
+def test_api_roll_call_accepts_max_lessons(curator_client):
+    client, (group_id, student_id) = curator_client
+    response = client.post('/dashboard/api/roll-call', json={
+        'group_id': group_id, 'date': '2026-03-02',
+        'absences': [{'student_id': student_id, 'lessons_count': 12}]})
+    assert response.status_code == 200
+    assert response.get_json()['added'] == 1
+
+
+def test_roll_call_form_redirects_on_bad_student_id(curator_client):
+    client, (group_id, _) = curator_client
+    response = client.post(f'/dashboard/absences/roll-call?group_id={group_id}&date=2026-03-02',
+                           data={'absent': ['zz']})
+    assert response.status_code == 302
+    assert 'roll-call' in response.location
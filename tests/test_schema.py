@@ -0,0 +1,160 @@
+# tests/test_schema.py
+"""Схема и скрипты миграции на SQLite и PostgreSQL.
+
+Часть с PostgreSQL выполняется, только если DATABASE_URL указывает на
+PostgreSQL; таблицы создаются во временной схеме и удаляются после теста.
+"""
+import os
+import subprocess
+import sys
+import uuid
+from urllib.parse import quote
+
+import pytest
+from sqlalchemy import Column, MetaData, Table, create_engine, create_mock_engine, inspect, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from db import db
+from models.absence import Absence  # noqa: F401 - модели регистрируют таблицы в db.metadata
+from models.analytics_change import AnalyticsChange
+from models.audit_log import AuditLog
+from models.cmk import Cmk  # noqa: F401
+from models.group import Group
+from models.student import Student  # noqa: F401
+from models.user import User  # noqa: F401
+from services.schema import add_column, create_index, create_table
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PG_URL = os.environ.get('DATABASE_URL', '')
+
+# Столбцы, таблицы и индексы, которых не было в первых версиях базы
+LEGACY_MISSING = {
+    'users': {'is_rejected', 'created_at', 'confirmed_at', 'rejected_at', 'confirmed_by_id', 'rejected_by_id'},
+    'groups': {'leader_id'},
+}
+LEGACY_SKIPPED_TABLES = {AnalyticsChange.__tablename__}
+LEGACY_MISSING_INDEXES = {
+    'groups': {'idx_groups_leader_id'},
+    'students': {'ix_students_group_id'},
+    'absences': {'ix_absences_date'},
+    'audit_logs': {'ix_audit_logs_created_at', 'ix_audit_logs_user_created', 'ix_audit_logs_action_created'},
+}
+# Порядок важен: update_database.py уже читает groups.leader_id
+MIGRATIONS = ('create_migration.py', 'update_database.py')
+# Индексы, которые создаёт update_database.py без create_migration.py
+UPDATE_INDEXES = {'ix_students_group_id', 'ix_absences_date', 'ix_audit_logs_user_created'}
+
+
+def postgresql_ddl():
+    statements = []
+    engine = create_mock_engine('postgresql://', lambda sql, *args, **kwargs: statements.append(
+        str(sql.compile(dialect=engine.dialect))))
+    db.metadata.create_all(engine, checkfirst=False)
+    return statements
+
+
+def test_models_compile_for_postgresql():
+    dialect = postgresql.dialect()
+    for table in db.metadata.sorted_tables:
+        ddl = str(CreateTable(table).compile(dialect=dialect))
+        assert 'AUTOINCREMENT' not in ddl and 'DATETIME' not in ddl, ddl
+        for index in table.indexes:
+            CreateIndex(index).compile(dialect=dialect)
+
+    ddl = '\n'.join(postgresql_ddl())
+    assert 'CREATE TABLE users' in ddl and 'SERIAL' in ddl
+    assert 'CREATE INDEX ix_absences_date ON absences (date)' in ddl
+
+
+def create_legacy_schema(engine):
+    """Таблицы в том виде, в каком они были до добавленных позже столбцов и индексов"""
+    legacy = MetaData()
+    for table in db.metadata.sorted_tables:
+        if table.name in LEGACY_SKIPPED_TABLES:
+            continue
+        missing = LEGACY_MISSING.get(table.name, set())
+        Table(table.name, legacy, *(Column(column.name, column.type, primary_key=column.primary_key)
+                                    for column in table.columns if column.name not in missing))
+    legacy.create_all(engine)
+
+
+def run_migrations(database_url, tmp_path, scripts=MIGRATIONS):
+    env = dict(os.environ, DATABASE_URL=database_url, CACHE_BACKEND='memory',
+               SCHEMA_CACHE=str(tmp_path / 'schema_cache.json'),
+               SLOW_QUERY_LOG=str(tmp_path / 'slow_queries.log'),
+               METRICS_DIR=str(tmp_path / 'metrics'), AUDIT_ASYNC='false')
+    for script in scripts:
+        result = subprocess.run([sys.executable, script], cwd=ROOT, env=env,
+                                capture_output=True, text=True, timeout=120)
+        assert result.returncode == 0, result.stderr
+        assert '❌' not in result.stdout, result.stdout
+
+
+def check_migrated(engine):
+    inspector = inspect(engine)
+    for table_name, columns in LEGACY_MISSING.items():
+        assert columns <= {column['name'] for column in inspector.get_columns(table_name)}
+    for table_name in LEGACY_SKIPPED_TABLES:
+        assert inspector.has_table(table_name)
+    for table_name, indexes in LEGACY_MISSING_INDEXES.items():
+        assert indexes <= {index['name'] for index in inspector.get_indexes(table_name)}
+
+
+def test_migrations_on_sqlite(tmp_path):
+    url = f'sqlite:///{tmp_path / "legacy.db"}'
+    engine = create_engine(url)
+    create_legacy_schema(engine)
+
+    run_migrations(url, tmp_path)
+    check_migrated(engine)
+    # Повторный запуск ничего не ломает
+    run_migrations(url, tmp_path)
+    check_migrated(engine)
+
+
+def test_update_database_creates_indexes(tmp_path):
+    url = f'sqlite:///{tmp_path / "legacy.db"}'
+    engine = create_engine(url)
+    create_legacy_schema(engine)
+    # Без create_migration.py: update_database.py читает groups.leader_id
+    with engine.begin() as conn:
+        conn.execute(text('ALTER TABLE groups ADD COLUMN leader_id INTEGER'))
+    run_migrations(url, tmp_path, scripts=('update_database.py',))
+    inspector = inspect(engine)
+    indexes = {index['name'] for table in ('students', 'absences', 'audit_logs')
+               for index in inspector.get_indexes(table)}
+    assert UPDATE_INDEXES <= indexes
+
+
+def test_schema_helpers_are_idempotent(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "helpers.db"}')
+    with engine.connect() as conn:
+        assert create_table(conn, AuditLog) is True
+        assert create_table(conn, AuditLog) is False
+        conn.execute(text('CREATE TABLE groups (id INTEGER PRIMARY KEY, name VARCHAR(50))'))
+        assert add_column(conn, Group, 'curator_id') is True
+        assert add_column(conn, Group, 'curator_id') is False
+        assert create_index(conn, 'ix_test', 'groups', 'curator_id') is True
+        assert create_index(conn, 'ix_test', 'groups', 'curator_id') is False
+
+
+@pytest.mark.skipif(not PG_URL.startswith(('postgresql', 'postgres:')),
+                    reason='DATABASE_URL не указывает на PostgreSQL')
+def test_migrations_on_postgresql(tmp_path):
+    schema = f'test_migration_{uuid.uuid4().hex[:8]}'
+    separator = '&' if '?' in PG_URL else '?'
+    url = f'{PG_URL.replace("postgres://", "postgresql://", 1)}{separator}options={quote(f"-csearch_path={schema}")}'
+    admin = create_engine(PG_URL.replace('postgres://', 'postgresql://', 1))
+    with admin.begin() as conn:
+        conn.execute(text(f'CREATE SCHEMA {schema}'))
+    try:
+        engine = create_engine(url)
+        create_legacy_schema(engine)
+        run_migrations(url, tmp_path)
+        check_migrated(engine)
+        engine.dispose()
+    finally:
+        with admin.begin() as conn:
+            conn.execute(text(f'DROP SCHEMA {schema} CASCADE'))
+        admin.dispose()
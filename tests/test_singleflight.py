@@ -0,0 +1,90 @@
+# tests/test_singleflight.py
+import threading
+import time
+
+from services.singleflight import SingleFlight
+
+FOLLOWERS = 4
+
+
+def run_concurrently(flight, key, fn):
+    """Лидер начинает fn, затем FOLLOWERS потоков вызывают do() с тем же ключом"""
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def leader_fn():
+        calls.append(threading.current_thread().name)
+        started.set()
+        assert release.wait(5)
+        return fn()
+
+    results = {}
+
+    def worker(name, func):
+        try:
+            results[name] = ('ok', flight.do(key, func))
+        except Exception as e:
+            results[name] = ('error', e)
+
+    leader = threading.Thread(target=worker, args=('leader', leader_fn), name='leader')
+    leader.start()
+    assert started.wait(5)
+
+    # Последователи подключаются, пока лидер ещё считает; их fn не должна вызываться
+    followers = [threading.Thread(target=worker, args=(f'follower-{i}', lambda: calls.append('follower')))
+                 for i in range(FOLLOWERS)]
+    for thread in followers:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while flight._calls[key].waiters < FOLLOWERS:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join(5)
+    return calls, results
+
+
+def test_followers_share_leader_result():
+    flight = SingleFlight()
+    value = {'groups': 3}
+    calls, results = run_concurrently(flight, 'stats', lambda: value)
+
+    assert calls == ['leader']
+    assert results.pop('leader') == ('ok', (value, False))
+    assert len(results) == FOLLOWERS
+    for status, (result, shared) in results.values():
+        assert status == 'ok' and shared is True and result is value
+    assert flight.in_flight() == 0
+
+
+def test_leader_error_reaches_followers():
+    flight = SingleFlight()
+    error = ValueError('database unavailable')
+
+    def fail():
+        raise error
+
+    calls, results = run_concurrently(flight, 'stats', fail)
+
+    assert calls == ['leader']
+    assert len(results) == FOLLOWERS + 1
+    assert all(status == 'error' and raised is error for status, raised in results.values())
+    # Ошибка не остаётся в кэше вызовов: следующий вызов считает заново
+    assert flight.in_flight() == 0
+    assert flight.do('stats', lambda: 'recovered') == ('recovered', False)
+
+
+def test_different_keys_do_not_wait():
+    flight = SingleFlight()
+    assert flight.do('a', lambda: flight.do('b', lambda: 2)[0] + 1) == (3, False)
+
+
+def test_sequential_calls_recompute():
+    flight = SingleFlight()
+    counter = iter(range(10))
+    assert flight.do('k', lambda: next(counter)) == (0, False)
+    assert flight.do('k', lambda: next(counter)) == (1, False)
+
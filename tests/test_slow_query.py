@@ -0,0 +1,30 @@
+# tests/test_slow_query.py
+import os
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from db import db
+from services.slow_query import slow_query_log
+
+
+def test_failed_query_does_not_leave_start_time(make_app):
+    app = make_app(SLOW_QUERY_MS=10_000)
+    with app.app_context():
+        with db.engine.connect() as conn:
+            for _ in range(3):
+                with pytest.raises(OperationalError):
+                    conn.execute(text('SELECT * FROM missing_table'))
+            conn.execute(text('SELECT 1'))
+            assert conn.info.get('slow_query_start') == []
+
+
+def test_log_file_created_on_first_slow_query(make_app, tmp_path):
+    path = tmp_path / 'slow' / 'slow_queries.log'
+    app = make_app(SLOW_QUERY_MS=10_000, SLOW_QUERY_LOG=str(path))
+    assert not path.exists()
+    slow_query_log.threshold = 0
+    with app.app_context():
+        db.session.execute(text('SELECT 1')).all()
+    assert path.exists() and os.path.getsize(path) > 0
@@ -0,0 +1,44 @@
+# tests/test_startup.py
+import pytest
+from sqlalchemy import text
+
+import app as app_module
+from db import db
+from models.absence import UNIQUE_INDEX
+from services.schema import index_names
+from services.startup import schema_is_current
+
+
+def test_failed_init_is_not_cached(app, monkeypatch):
+    def broken_indexes():
+        raise RuntimeError('index creation failed')
+
+    monkeypatch.setattr(app_module, 'ensure_indexes', broken_indexes)
+    app_module.init_app(app)
+    with app.app_context():
+        assert not schema_is_current(app)
+
+    monkeypatch.undo()
+    app_module.init_app(app)
+    with app.app_context():
+        assert schema_is_current(app)
+
+
+def test_ensure_indexes_reports_failed_index(app, monkeypatch, capsys):
+    with app.app_context():
+        with db.engine.begin() as conn:
+            conn.execute(text('DROP INDEX ix_audit_logs_created_at'))
+            conn.execute(text(f'DROP INDEX {UNIQUE_INDEX}'))
+            conn.execute(text("INSERT INTO absences (student_id, date, lessons_count) "
+                              "VALUES (1, '2026-03-02', 1), (1, '2026-03-02', 2)"))
+
+        # Без слияния дублей уникальный индекс не создаётся
+        monkeypatch.setattr(app_module, 'merge_duplicate_absences', lambda conn: 0)
+        with pytest.raises(RuntimeError, match=UNIQUE_INDEX):
+            app_module.ensure_indexes()
+        assert f'❌ Не удалось создать индекс {UNIQUE_INDEX}' in capsys.readouterr().out
+
+        # Индексы других моделей созданы в своих транзакциях
+        with db.engine.connect() as conn:
+            assert 'ix_audit_logs_created_at' in index_names(conn, 'audit_logs')
+            assert UNIQUE_INDEX not in index_names(conn, 'absences')
@@ -0,0 +1,116 @@
+# tests/test_student_analytics.py
+"""student_analytics_rows совпадает с прежним подсчётом по каждому студенту"""
+from datetime import date
+
+import pytest
+
+from db import db
+from models.absence import Absence
+from models.group import Group
+from models.student import Student
+from models.user import User
+from routes.dashboard_routes import EXCUSED_REASONS, get_user_students, student_analytics_rows
+
+pytest.importorskip('pandas')
+
+
+@pytest.fixture
+def data(app):
+    """Две группы (у второй нет старосты), студент без группы и студенты без пропусков"""
+    with app.app_context():
+        users = {role: User(full_name=name, phone=phone, role=role, is_confirmed=True)
+                 for role, name, phone in (('admin', 'Админ', '1'), ('curator', 'Петрова Анна', '2'),
+                                           ('leader', 'Сидоров Олег', '3'), ('other_curator', 'Кузнецов Иван', '4'))}
+        users['other_curator'].role = 'curator'
+        db.session.add_all(users.values())
+        db.session.flush()
+
+        group = Group(name='Э-101', curator_id=users['curator'].id, leader_id=users['leader'].id)
+        other_group = Group(name='Б-202', curator_id=users['other_curator'].id)
+        db.session.add_all([group, other_group])
+        db.session.flush()
+
+        students = [
+            Student(full_name='Иванов Пётр', group_id=group.id),
+            Student(full_name='Смирнова Ольга', group_id=group.id),
+            Student(full_name='Иванова Мария', group_id=other_group.id),
+            Student(full_name='Орлов Денис', group_id=other_group.id),
+            Student(full_name='Без Группы', group_id=None),
+        ]
+        db.session.add_all(students)
+        db.session.flush()
+
+        db.session.add_all([
+            Absence(student_id=students[0].id, date=date(2026, 3, 2), reason='Болезнь', lessons_count=2),
+            Absence(student_id=students[0].id, date=date(2026, 3, 3), reason='прогул', lessons_count=1),
+            Absence(student_id=students[0].id, date=date(2026, 3, 4), lessons_count=1),
+            Absence(student_id=students[2].id, date=date(2026, 3, 2), reason='справка', lessons_count=3),
+            Absence(student_id=students[4].id, date=date(2026, 3, 5), lessons_count=1),
+        ])
+        db.session.commit()
+        return {role: user.id for role, user in users.items()}
+
+
+def reference_rows(user, student_name='', group_name='', curator_id=None, leader_id=None):
+    """Прежняя реализация: фильтры и пропуски отдельно по каждому студенту"""
+    rows = []
+    for student in get_user_students(user):
+        if student_name and student_name.lower() not in student.full_name.lower():
+            continue
+        if group_name and (not student.group or group_name.lower() not in student.group.name.lower()):
+            continue
+        if curator_id and (not student.group or str(student.group.curator_id) != curator_id):
+            continue
+        if leader_id and (not student.group or str(student.group.leader_id) != leader_id):
+            continue
+
+        absences = Absence.query.filter_by(student_id=student.id).all()
+        excused = sum(1 for absence in absences if absence.reason and absence.reason.lower() in EXCUSED_REASONS)
+        rows.append({
+            'student_name': student.full_name,
+            'group_name': student.group.name if student.group else '-',
+            'curator_name': student.group.curator.full_name if student.group and student.group.curator else '-',
+            'leader_name': student.group.leader.full_name if student.group and student.group.leader else '-',
+            'total_absences': len(absences),
+            'excused': excused,
+            'unexcused': len(absences) - excused,
+        })
+    return rows
+
+
+def by_name(rows):
+    return sorted(rows, key=lambda row: row['student_name'])
+
+
+@pytest.mark.parametrize('role', ['admin', 'curator', 'leader', 'other_curator'])
+@pytest.mark.parametrize('filters', [
+    {},
+    {'student_name': 'иванов'},
+    {'group_name': 'э-1'},
+    {'curator_id': 'curator'},
+    {'leader_id': 'leader'},
+    {'curator_id': 'abc'},
+])
+def test_rows_match_per_student_reference(app, data, role, filters):
+    filters = {key: str(data[value]) if value in data else value for key, value in filters.items()}
+    with app.app_context():
+        user = db.session.get(User, data[role])
+        assert by_name(student_analytics_rows(user, **filters)) == by_name(reference_rows(user, **filters))
+
+
+def test_students_without_absences_have_zeros(app, data):
+    with app.app_context():
+        rows = {row['student_name']: row for row in student_analytics_rows(db.session.get(User, data['admin']))}
+    assert len(rows) == 5
+    assert rows['Иванов Пётр'] == {
+        'student_name': 'Иванов Пётр', 'group_name': 'Э-101', 'curator_name': 'Петрова Анна',
+        'leader_name': 'Сидоров Олег', 'total_absences': 3, 'excused': 1, 'unexcused': 2}
+    assert (rows['Смирнова Ольга']['total_absences'], rows['Смирнова Ольга']['excused']) == (0, 0)
+    assert rows['Орлов Денис']['leader_name'] == '-'
+    assert rows['Без Группы']['group_name'] == '-' and rows['Без Группы']['total_absences'] == 1
+
+
+def test_sort(app, data):
+    with app.app_context():
+        rows = student_analytics_rows(db.session.get(User, data['admin']), sort='total_absences', descending=True)
+    assert [row['total_absences'] for row in rows] == [3, 1, 1, 0, 0]
@@ -0,0 +1,127 @@
+# tests/test_timeseries.py
+from datetime import date
+
+import pytest
+
+from db import db
+from models.absence import Absence
+from models.group import Group
+from models.student import Student
+from models.user import User
+from routes.dashboard_routes import EXCUSED_REASONS, can_view_series
+from services.timeseries import attendance_series, count_buckets
+
+
+@pytest.fixture
+def data(app):
+    """Две группы: в первой два студента с пропусками в марте и апреле 2026"""
+    with app.app_context():
+        users = {}
+        for phone, role in (('1', 'admin'), ('2', 'curator'), ('3', 'leader'), ('4', 'curator')):
+            users[role if phone != '4' else 'other_curator'] = User(
+                full_name=f'Пользователь {phone}', phone=phone, role=role, is_confirmed=True)
+        users['curator'].set_password('x')
+        db.session.add_all(users.values())
+        db.session.flush()
+
+        group = Group(name='Э-101', curator_id=users['curator'].id, leader_id=users['leader'].id)
+        other_group = Group(name='Б-101', curator_id=users['other_curator'].id)
+        db.session.add_all([group, other_group])
+        db.session.flush()
+
+        first, second = Student(full_name='Первый', group_id=group.id), Student(full_name='Второй', group_id=group.id)
+        other = Student(full_name='Чужой', group_id=other_group.id)
+        db.session.add_all([first, second, other])
+        db.session.flush()
+
+        db.session.add_all([
+            Absence(student_id=first.id, date=date(2026, 3, 2), reason='болезнь', lessons_count=2),
+            Absence(student_id=first.id, date=date(2026, 3, 4), reason='прогул', lessons_count=3),
+            Absence(student_id=first.id, date=date(2026, 3, 16), lessons_count=1),
+            Absence(student_id=first.id, date=date(2026, 4, 1), reason='справка', lessons_count=1),
+            Absence(student_id=second.id, date=date(2026, 3, 3), lessons_count=4),
+            Absence(student_id=other.id, date=date(2026, 3, 2), lessons_count=5),
+        ])
+        db.session.commit()
+        return {
+            'users': {role: user.id for role, user in users.items()},
+            'group': group.id, 'other_group': other_group.id,
+            'student': first.id, 'other_student': other.id,
+        }
+
+
+def series(scope, scope_id, start, end, bucket):
+    return [tuple(point) for point in attendance_series(scope, scope_id, start, end, bucket, EXCUSED_REASONS)]
+
+
+def test_day_buckets_fill_gaps(app, data):
+    with app.app_context():
+        assert series('group', data['group'], date(2026, 3, 1), date(2026, 3, 5), 'day') == [
+            (date(2026, 3, 1), 0, 0, 0, 0),
+            (date(2026, 3, 2), 1, 2, 1, 0),
+            (date(2026, 3, 3), 1, 4, 0, 1),
+            (date(2026, 3, 4), 1, 3, 0, 1),
+            (date(2026, 3, 5), 0, 0, 0, 0),
+        ]
+
+
+def test_week_buckets_start_on_monday(app, data):
+    with app.app_context():
+        assert series('group', data['group'], date(2026, 3, 1), date(2026, 3, 22), 'week') == [
+            (date(2026, 2, 23), 0, 0, 0, 0),
+            (date(2026, 3, 2), 3, 9, 1, 2),
+            (date(2026, 3, 9), 0, 0, 0, 0),
+            (date(2026, 3, 16), 1, 1, 0, 1),
+        ]
+        assert count_buckets(date(2026, 3, 1), date(2026, 3, 22), 'week') == 4
+
+
+def test_month_buckets(app, data):
+    with app.app_context():
+        assert series('group', data['group'], date(2026, 2, 15), date(2026, 4, 30), 'month') == [
+            (date(2026, 2, 1), 0, 0, 0, 0),
+            (date(2026, 3, 1), 4, 10, 1, 3),
+            (date(2026, 4, 1), 1, 1, 1, 0),
+        ]
+
+
+def test_scopes(app, data):
+    with app.app_context():
+        start, end = date(2026, 3, 1), date(2026, 3, 31)
+        assert series('student', data['student'], start, end, 'month') == [(date(2026, 3, 1), 3, 6, 1, 2)]
+        assert series('curator', data['users']['curator'], start, end, 'month') == [(date(2026, 3, 1), 4, 10, 1, 3)]
+        assert series('all', None, start, end, 'month') == [(date(2026, 3, 1), 5, 15, 1, 4)]
+
+
+@pytest.mark.parametrize('role, scope, key, allowed', [
+    ('admin', 'all', None, True),
+    ('admin', 'group', 'other_group', True),
+    ('curator', 'group', 'group', True),
+    ('curator', 'student', 'student', True),
+    ('curator', 'group', 'other_group', False),
+    ('curator', 'student', 'other_student', False),
+    ('curator', 'curator', 'curator', True),
+    ('curator', 'curator', 'other_curator', False),
+    ('curator', 'all', None, False),
+    ('curator', 'cmk', None, False),
+    ('leader', 'group', 'group', True),
+    ('leader', 'student', 'student', True),
+    ('leader', 'group', 'other_group', False),
+    ('leader', 'curator', 'curator', False),
+])
+def test_can_view_series(app, data, role, scope, key, allowed):
+    ids = dict(data, **data['users'])
+    with app.app_context():
+        user = db.session.get(User, data['users'][role])
+        assert can_view_series(user, scope, ids.get(key)) is allowed
+
+
+def test_api_forbids_foreign_group(app, data):
+    client = app.test_client()
+    assert client.post('/auth/login', data={'username': '2', 'password': 'x'}).status_code == 302
+    query = 'scope=group&bucket=week&start_date=2026-03-01&end_date=2026-03-22'
+    assert client.get(f'/dashboard/api/attendance-series?{query}&id={data["other_group"]}').status_code == 403
+
+    response = client.get(f'/dashboard/api/attendance-series?{query}&id={data["group"]}')
+    assert response.status_code == 200
+    assert [point['absences'] for point in response.get_json()['points']] == [0, 3, 0, 1]
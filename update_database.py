@@ -1,59 +1,70 @@
 # update_database.py
 from app import app, db
-from sqlalchemy import text
+from sqlalchemy import false
+from models.audit_log import AuditLog
+from models.analytics_change import AnalyticsChange
+from models.absence import Absence, merge_duplicate_absences
 from models.group import Group  # ДОБАВИТЬ ЭТОТ ИМПОРТ
+from models.student import Student
+from models.user import User
+from services.schema import add_column, column_names, create_model_indexes, create_table
 
 with app.app_context():
-    # Проверяем, какие столбцы уже существуют
+    # Проверяем, какие столбцы уже существуют (SQLite и PostgreSQL)
     conn = db.engine.connect()
     
     # Получаем информацию о таблице users
-    result = conn.execute(text("PRAGMA table_info(users)"))
-    existing_columns = [row[1] for row in result]  # Имя столбца находится в позиции 1
+    existing_columns = column_names(conn, 'users')
     
     print("Существующие столбцы в таблице users:")
     for col in existing_columns:
         print(f"  - {col}")
     
-    # Список новых столбцов, которые нужно добавить
+    # Список новых столбцов, которые нужно добавить (типы берутся из модели User)
     new_columns = [
-        ('is_rejected', 'BOOLEAN DEFAULT FALSE'),
-        ('created_at', 'DATETIME'),
-        ('confirmed_at', 'DATETIME'),
-        ('rejected_at', 'DATETIME'),
-        ('confirmed_by_id', 'INTEGER'),
-        ('rejected_by_id', 'INTEGER')
+        ('is_rejected', false()),
+        ('created_at', None),
+        ('confirmed_at', None),
+        ('rejected_at', None),
+        ('confirmed_by_id', None),
+        ('rejected_by_id', None)
     ]
     
     added_count = 0
-    for column_name, column_type in new_columns:
+    for column_name, server_default in new_columns:
         if column_name not in existing_columns:
+            column_type = User.__table__.c[column_name].type.compile(dialect=conn.dialect)
             print(f"\nДобавляем столбец: {column_name} ({column_type})")
             try:
-                # Для SQLite ALTER TABLE ADD COLUMN
-                sql = f"ALTER TABLE users ADD COLUMN {column_name} {column_type}"
-                conn.execute(text(sql))
+                add_column(conn, User, column_name, server_default=server_default)
+                conn.commit()
                 print(f"✅ Столбец '{column_name}' добавлен успешно!")
                 added_count += 1
             except Exception as e:
+                conn.rollback()
                 print(f"❌ Ошибка при добавлении столбца '{column_name}': {e}")
     
     # Создаём таблицу audit_logs если её нет
-    result = conn.execute(text("SELECT name FROM sqlite_master WHERE type='table' AND name='audit_logs'"))
-    if not result.fetchone():
-        print("\nСоздаём таблицу audit_logs...")
-        conn.execute(text("""
-            CREATE TABLE audit_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                action VARCHAR(100),
-                description TEXT,
-                ip_address VARCHAR(50),
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        """))
-        print("✅ Таблица audit_logs создана успешно!")
+    if create_table(conn, AuditLog):
+        conn.commit()
+        print("\n✅ Таблица audit_logs создана успешно!")
+    
+    # Индексы журнала и рядов посещаемости в таблицах, созданных до их появления в модели
+    # Дубли пропусков за день не дают создать uq_absences_student_date
+    removed = merge_duplicate_absences(conn)
+    if removed:
+        print(f"✅ Объединено дублей пропусков: {removed}")
+    created_indexes = []
+    for model in (AuditLog, Absence, Student):
+        created_indexes += create_model_indexes(conn, model)
+    conn.commit()
+    for index_name in created_indexes:
+        print(f"✅ Индекс {index_name} создан!")
+    
+    # Журнал изменений для ANALYTICS_ENGINE=memory
+    if create_table(conn, AnalyticsChange):
+        conn.commit()
+        print("✅ Таблица analytics_changes создана успешно!")
     
     conn.close()
     
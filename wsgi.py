@@ -0,0 +1,10 @@
+# wsgi.py
+"""WSGI-точка входа для продакшена: gunicorn -c gunicorn.conf.py wsgi:app
+
+python app.py по-прежнему запускает сервер разработки.
+"""
+from app import get_app
+
+app = get_app()
+
+__all__ = ['app']